@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Compare cost per edit of ConfigParser rewrites against batched edits of the
+comment-preserving config model on a large lnd.conf.
+
+    python3 benchmarks/bench_conf.py --sections 200 --edits 50
+"""
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+from configparser import ConfigParser
+from noma import conf
+
+SHIPPED_LND_CONF = (
+    pathlib.Path(__file__).parent.parent / "lnd" / "neutrino" / "lnd.conf"
+)
+
+
+def make_config(path, sections):
+    """Shipped lnd.conf followed by many commented sections"""
+    with open(path, "w") as file:
+        file.write(SHIPPED_LND_CONF.read_text())
+        for number in range(sections):
+            file.write("\n[Extra{}]\n".format(number))
+            for key in range(20):
+                file.write("; documentation of key{}\n".format(key))
+                file.write("key{k}=value{k}\n".format(k=key))
+
+
+def configparser_edit(path, section, key, value):
+    """Per-key parse and full rewrite, as lnd.set_kv used to do"""
+    parser = ConfigParser(strict=False)
+    with open(path) as lines:
+        parser.read_file(lines)
+    parser.set(section, key, value)
+    with open(path, "w") as file:
+        parser.write(file, space_around_delimiters=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sections", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "lnd.conf")
+        make_config(path, args.sections)
+        size = os.path.getsize(path)
+        edits = [
+            ("Extra{}".format(n % args.sections), "key{}".format(n % 20), n)
+            for n in range(args.edits)
+        ]
+
+        start = time.perf_counter()
+        for section, key, value in edits:
+            configparser_edit(path, section, key, str(value))
+        per_key = (time.perf_counter() - start) / args.edits
+
+        make_config(path, args.sections)
+        start = time.perf_counter()
+        for section, key, value in edits:
+            with conf.edit(path) as doc:
+                doc.set(section, key, value)
+        single = (time.perf_counter() - start) / args.edits
+
+        make_config(path, args.sections)
+        start = time.perf_counter()
+        with conf.edit(path) as doc:
+            for section, key, value in edits:
+                doc.set(section, key, value)
+        batched = (time.perf_counter() - start) / args.edits
+
+    print("config size: {} bytes, {} edits".format(size, args.edits))
+    print("{:<32}{:>12}".format("method", "ms/edit"))
+    print("{:<32}{:>12.3f}".format("ConfigParser rewrite", per_key * 1000))
+    print("{:<32}{:>12.3f}".format("conf.edit per key", single * 1000))
+    print("{:<32}{:>12.3f}".format("conf.edit batched", batched * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Compare the old os.walk permission loop of fastsync with
+permissions.normalize on a synthetic tree.
+
+The tree is created in a temporary directory and owned by the current
+user, so no root privileges are needed:
+
+    python3 benchmarks/bench_permissions.py --files 100000 --jobs 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from noma.permissions import normalize
+
+
+def make_tree(top, files, per_dir):
+    for number in range(files):
+        directory = os.path.join(top, "d{:04d}".format(number // per_dir))
+        if number % per_dir == 0:
+            os.makedirs(directory, mode=0o700)
+        path = os.path.join(directory, "{:06d}.ldb".format(number))
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+
+
+def reset_modes(top):
+    for path, dirs, files in os.walk(top):
+        for name in dirs:
+            os.chmod(os.path.join(path, name), 0o700)
+        for name in files:
+            os.chmod(os.path.join(path, name), 0o600)
+
+
+def walk_chown_chmod(top, uid, gid):
+    """The loop fastsync used before, chown and chmod on every path"""
+    for path, dirs, files in os.walk(top):
+        for directory in dirs:
+            os.chown(os.path.join(path, directory), uid, gid)
+            os.chmod(os.path.join(path, directory), 0o755)
+        for file in files:
+            os.chown(os.path.join(path, file), uid, gid)
+            os.chmod(os.path.join(path, file), 0o744)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--per-dir", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=4)
+    args = parser.parse_args()
+    uid, gid = os.getuid(), os.getgid()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        top = os.path.join(tmp, "bitcoin")
+        os.makedirs(top)
+        print("Creating {} files".format(args.files))
+        make_tree(top, args.files, args.per_dir)
+
+        def fresh(fn):
+            reset_modes(top)
+            return timed(fn)
+
+        results = [
+            ("os.walk", fresh(lambda: walk_chown_chmod(top, uid, gid))),
+            (
+                "os.walk, unchanged",
+                timed(lambda: walk_chown_chmod(top, uid, gid)),
+            ),
+            ("normalize", fresh(lambda: normalize(top, uid, gid))),
+            ("normalize, unchanged", timed(lambda: normalize(top, uid, gid))),
+            (
+                "normalize, {} jobs".format(args.jobs),
+                fresh(lambda: normalize(top, uid, gid, jobs=args.jobs)),
+            ),
+            (
+                "normalize, {} jobs, unchanged".format(args.jobs),
+                timed(lambda: normalize(top, uid, gid, jobs=args.jobs)),
+            ),
+        ]
+
+    print("{:<32}{:>10}".format("method", "seconds"))
+    for name, seconds in results:
+        print("{:<32}{:>10.2f}".format(name, seconds))
+
+
+if __name__ == "__main__":
+    main()
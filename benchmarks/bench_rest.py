@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Compare requests per second of per-call requests.get against the pooled
+LndRest client.
+
+Without arguments a local keep-alive HTTP stand-in server is used. Point it
+at a running lnd to include the TLS handshake:
+
+    python3 benchmarks/bench_rest.py --url https://127.0.0.1:8080 \\
+        --cert /media/noma/lnd/neutrino/tls.cert --path /v1/getinfo
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import requests
+from noma.rest import LndRest
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # send headers and body in one segment
+    wbufsize = -1
+
+    def do_GET(self):
+        body = b'{"synced_to_chain": true}'
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def rate(fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn().raise_for_status()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="lnd REST url, default: stand-in")
+    parser.add_argument("--cert", help="path to tls.cert")
+    parser.add_argument("--macaroon", default="", help="path to macaroon")
+    parser.add_argument("--path", default="/v1/getinfo")
+    parser.add_argument("--count", type=int, default=500)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server = StandInServer(("127.0.0.1", 0), StandInHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{}".format(server.server_port)
+
+    client = LndRest(url=url, tls_cert=args.cert or "", macaroon=args.macaroon)
+    headers = client.headers()
+    verify = args.cert or True
+
+    per_call = rate(
+        lambda: requests.get(
+            client.endpoint(args.path), headers=headers, verify=verify
+        ),
+        args.count,
+    )
+    pooled = rate(lambda: client.get(args.path), args.count)
+
+    print("{:<20}{:>12}".format("client", "req/s"))
+    print("{:<20}{:>12.1f}".format("requests.get", per_call))
+    print("{:<20}{:>12.1f}".format("LndRest", pooled))
+    print("speedup: {:.1f}x".format(pooled / per_call))
+
+    client.close()
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
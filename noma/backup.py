@@ -0,0 +1,299 @@
+"""
+Change-aware channel.backup shipping over ssh
+
+A local manifest records the hash of the last shipped channel.backup, so
+unchanged files are never uploaded again. Uploads reuse a persistent ssh
+control-master connection and keep BACKUP_VERSIONS versions on the remote.
+"""
+import hashlib
+import os
+import pathlib
+import shlex
+import struct
+import time
+from json import dumps, loads
+from subprocess import run, PIPE, STDOUT
+import noma.config as cfg
+
+
+def file_digest(file_path):
+    """Return sha256 hex digest of file"""
+    digest = hashlib.sha256()
+    with open(str(file_path), "rb") as file:
+        for block in iter(lambda: file.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path=""):
+    """
+    Load backup manifest
+
+    :param manifest_path: optional path to manifest
+    :return dict: sha256, versions, upload and savings statistics
+    """
+    if not manifest_path:
+        manifest_path = cfg.BACKUP_MANIFEST
+    try:
+        with open(str(manifest_path)) as file:
+            return loads(file.read())
+    except FileNotFoundError:
+        return {
+            "sha256": "",
+            "versions": [],
+            "uploads": 0,
+            "upload_seconds": 0.0,
+            "skipped": 0,
+            "saved_bytes": 0,
+            "saved_seconds": 0.0,
+        }
+
+
+def _write_manifest(manifest, manifest_path):
+    """Atomically replace manifest"""
+    temp_path = str(manifest_path) + ".tmp"
+    with open(temp_path, "w") as file:
+        file.write(dumps(manifest, indent=2, sort_keys=True))
+    os.replace(temp_path, str(manifest_path))
+
+
+def parse_target(target=""):
+    """
+    Split scp target into host and remote directory
+
+    :param target: [user@]host:[path]
+    :return tuple: host, path
+    """
+    if not target:
+        target = cfg.SSH_TARGET
+    host, _, remote_dir = target.partition(":")
+    return host, remote_dir or "."
+
+
+def ssh_options():
+    """Options shared by ssh and scp, including control-master reuse"""
+    return [
+        "-i",
+        os.path.expanduser(cfg.SSH_IDENTITY),
+        "-o",
+        "BatchMode=yes",
+        "-o",
+        "ControlMaster=auto",
+        "-o",
+        "ControlPath={}".format(cfg.SSH_CONTROL_PATH),
+        "-o",
+        "ControlPersist={}".format(cfg.SSH_CONTROL_PERSIST),
+    ]
+
+
+def remote(command, target=""):
+    """Run shell command on backup host over the shared connection"""
+    host, _ = parse_target(target)
+    return run(
+        ["ssh"] + ssh_options() + ["-p", cfg.SSH_PORT, host, command],
+        stdout=PIPE,
+        stderr=STDOUT,
+    )
+
+
+def upload(source, name, target=""):
+    """
+    Upload source to remote directory as name
+
+    :return CompletedProcess: scp result
+    """
+    host, remote_dir = parse_target(target)
+    destination = "{h}:{d}/{n}".format(
+        h=host, d=remote_dir.rstrip("/"), n=name
+    )
+    # -p to preserve modification & access time, modes
+    return run(
+        ["scp"]
+        + ssh_options()
+        + ["-p", "-P", cfg.SSH_PORT, str(source), destination]
+    )
+
+
+def _quote_remote(path):
+    """Quote a path for the remote shell, keeping a leading ~/ expandable"""
+    if path in ("~", "~/"):
+        return "~"
+    if path.startswith("~/"):
+        return "~/" + shlex.quote(path[2:])
+    return shlex.quote(path)
+
+
+def rotate_remote(latest, keep=cfg.BACKUP_VERSIONS, target=""):
+    """Point channel.backup at latest version and drop all but keep versions"""
+    _, remote_dir = parse_target(target)
+    command = (
+        "cd {d} && cp -p {l} channel.backup && "
+        "ls -1t channel.backup.*-* | tail -n +{k} | xargs rm -f --".format(
+            d=_quote_remote(remote_dir), l=shlex.quote(latest), k=int(keep) + 1
+        )
+    )
+    return remote(command, target)
+
+
+def ship(source="", manifest_path="", force=False, changed_at=None):
+    """
+    Upload channel.backup if it changed since the last successful upload
+
+    :param source: file to back up, default CHANNEL_BACKUP
+    :param manifest_path: optional path to manifest
+    :param force: upload even if unchanged
+    :param changed_at: time of the file change, to record upload latency
+    :return int: 0 on success or skip, scp/ssh exit code otherwise
+    """
+    if not source:
+        source = cfg.CHANNEL_BACKUP
+    if not manifest_path:
+        manifest_path = cfg.BACKUP_MANIFEST
+    manifest = load_manifest(manifest_path)
+    size = os.path.getsize(str(source))
+    digest = file_digest(source)
+
+    if digest == manifest["sha256"] and not force:
+        average = manifest["upload_seconds"] / max(manifest["uploads"], 1)
+        manifest["skipped"] += 1
+        manifest["saved_bytes"] += size
+        manifest["saved_seconds"] += average
+        _write_manifest(manifest, manifest_path)
+        print("channel.backup unchanged, skipped upload")
+        print(
+            "Saved {b} bytes and ~{s:.1f}s this run, "
+            "{tb} bytes and ~{ts:.1f}s in total".format(
+                b=size,
+                s=average,
+                tb=manifest["saved_bytes"],
+                ts=manifest["saved_seconds"],
+            )
+        )
+        return 0
+
+    now = int(time.time())
+    name = "channel.backup.{t}-{h}".format(t=now, h=digest[:8])
+    start = time.monotonic()
+    cfg.SSH_CONTROL_PATH.parent.mkdir(mode=0o700, exist_ok=True)
+    complete = upload(source, name)
+    if complete.returncode != 0:
+        print("Error: upload of channel.backup failed")
+        return complete.returncode
+    rotated = rotate_remote(name)
+    if rotated.returncode != 0:
+        print(
+            "Warning: remote rotation failed: " + bytes.decode(rotated.stdout)
+        )
+    elapsed = time.monotonic() - start
+
+    version = {"name": name, "sha256": digest, "size": size, "time": now}
+    if changed_at is not None:
+        version["latency"] = round(time.time() - changed_at, 3)
+    manifest["sha256"] = digest
+    manifest["uploads"] += 1
+    manifest["upload_seconds"] += elapsed
+    manifest["versions"].insert(0, version)
+    del manifest["versions"][cfg.BACKUP_VERSIONS:]
+    _write_manifest(manifest, manifest_path)
+    print(
+        "Uploaded {n} ({b} bytes) in {s:.1f}s".format(
+            n=name, b=size, s=elapsed
+        )
+    )
+    if "latency" in version:
+        print("{:.1f}s from change to remote copy".format(version["latency"]))
+    return 0
+
+
+# inotify(7) event masks
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENT = struct.Struct("iIII")
+
+
+def _inotify_watch(directory, mask):
+    """
+    Create inotify instance watching directory
+
+    :return int: inotify file descriptor
+    """
+    import ctypes
+    import ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        raise OSError("inotify is not available on this platform")
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    if libc.inotify_add_watch(fd, os.fsencode(str(directory)), mask) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, "inotify_add_watch failed", str(directory))
+    return fd
+
+
+def _read_names(fd):
+    """Read pending inotify events and return the file names they refer to"""
+    buffer = os.read(fd, 65536)
+    names = []
+    offset = 0
+    while offset < len(buffer):
+        _, _, _, length = _EVENT.unpack_from(buffer, offset)
+        offset += _EVENT.size
+        name = buffer[offset:offset + length].rstrip(b"\0")
+        names.append(os.fsdecode(name))
+        offset += length
+    return names
+
+
+def watch(source="", manifest_path="", debounce=cfg.BACKUP_DEBOUNCE):
+    """
+    Ship every new version of channel.backup as soon as lnd writes it
+
+    Blocks on inotify events for the directory of source instead of polling.
+    Bursts of writes are debounced until the file has been quiet for
+    debounce seconds. Failed uploads are retried every BACKUP_RETRY seconds.
+
+    :param source: file to watch, default CHANNEL_BACKUP
+    :param manifest_path: optional path to manifest
+    :param debounce: seconds without writes before shipping
+    """
+    import select
+
+    if not source:
+        source = cfg.CHANNEL_BACKUP
+    source = pathlib.Path(source)
+    # lnd replaces channel.backup with a rename, so watch the directory
+    fd = _inotify_watch(
+        source.parent, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    )
+    print("Watching {} for changes".format(source))
+    # ship once on start in case channel.backup changed while not watching
+    changed_at = last_change = time.time() if source.is_file() else None
+    try:
+        while True:
+            if changed_at is None:
+                timeout = None
+            else:
+                timeout = max(0.0, last_change + debounce - time.time())
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if readable:
+                if source.name in _read_names(fd):
+                    last_change = time.time()
+                    if changed_at is None:
+                        changed_at = last_change
+                continue
+            if not source.is_file():
+                changed_at = None
+            elif ship(source, manifest_path, changed_at=changed_at) == 0:
+                changed_at = None
+            else:
+                time.sleep(cfg.BACKUP_RETRY)
+    finally:
+        os.close(fd)
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -1,31 +1,73 @@
 """
 bitcoind related functionality
 """
-from subprocess import call, run, PIPE, STDOUT, DEVNULL
+from subprocess import call
 import os
 import pathlib
 import shutil
+import time
+import noma.config as cfg
+from noma import conf
 from noma import rpcauth
 
 
 def start():
     """Start bitcoind docker compose container"""
+    from noma.containers import compose_name
     from noma.node import is_running
 
     if is_running("bitcoind"):
         print("bitcoind is running already")
     else:
-        call(["docker", "start", "compose_bitcoind_1"])
+        call(["docker", "start", compose_name("bitcoind")])
 
 
 def stop():
-    """Stop bitcoind docker compose container, if running"""
-    from noma.node import is_running
+    """Stop bitcoind cleanly, services depending on it keep running"""
+    from noma import shutdown
+
+    return shutdown.shutdown(["bitcoind"], dependents=False)
 
-    if is_running("bitcoind"):
-        call(["docker", "exec", "compose_bitcoind_1", "bitcoin-cli", "stop"])
-    else:
-        print("bitcoind is already stopped")
+
+def status():
+    """
+    Print chain, network and mempool state from one batched RPC request
+
+    :return dict: blockchain, network and mempool info
+    """
+    from noma import rpc
+
+    chain, network, mempool = rpc.batch(
+        ["getblockchaininfo", "getnetworkinfo", "getmempoolinfo"]
+    )
+    print("{:<20}{}".format("version", network["subversion"]))
+    print("{:<20}{}".format("chain", chain["chain"]))
+    print(
+        "{:<20}{} of {} headers".format(
+            "blocks", chain["blocks"], chain["headers"]
+        )
+    )
+    print(
+        "{:<20}{:.2f}%".format(
+            "progress", chain["verificationprogress"] * 100
+        )
+    )
+    print(
+        "{:<20}{:.1f} GB{}".format(
+            "size on disk",
+            chain["size_on_disk"] / 1e9,
+            ", pruned" if chain.get("pruned") else "",
+        )
+    )
+    print("{:<20}{}".format("connections", network["connections"]))
+    print(
+        "{:<20}{} transactions, {:.1f} MB".format(
+            "mempool", mempool["size"], mempool["usage"] / 1e6
+        )
+    )
+    if chain.get("warnings"):
+        print("{:<20}{}".format("warnings", chain["warnings"]))
+    return {"blockchain": chain, "network": network, "mempool": mempool}
 
 
 def fastsync():
@@ -34,36 +76,49 @@ def fastsync():
 
     :return bool: success status
     """
-    bitcoind_dir_path = "/media/archive/archive/bitcoin/"
-    bitcoind_dir = pathlib.Path(bitcoind_dir_path)
-    location = "http://utxosets.blob.core.windows.net/public/"
-    snapshot = "utxo-snapshot-bitcoin-mainnet-565305.tar"
-    checksum = (
-        "8e18176138be351707aee95f349dd1debc714cc2cc4f0c76d6a7380988bf0d22"
-    )
-    snapshot_path = bitcoind_dir / snapshot
-    url = location + snapshot
+    bitcoind_dir_path = str(cfg.BITCOIN_PATH) + "/"
+    bitcoind_dir = cfg.BITCOIN_PATH
+    checksum = cfg.SNAPSHOT_SHA256
+    snapshot_path = cfg.SNAPSHOT_PATH
+    url = cfg.SNAPSHOT_MIRROR + cfg.SNAPSHOT_NAME
 
     bitcoind_dir_exists = bitcoind_dir.is_dir()
 
-    def set_permissions(working_path):
+    def set_permissions():
+        import sys
+        from noma import scheduler
+
         print("Setting file and directory permissions")
-        for path, dirs, files in os.walk(working_path):
-            lncm_uid, lncm_gid = 1001, 1001
-            for directory in dirs:
-                os.chown(os.path.join(path, directory), lncm_uid, lncm_gid)
-                os.chmod(os.path.join(path, directory), 0o755)
-            for file in files:
-                os.chown(os.path.join(path, file), lncm_uid, lncm_gid)
-                os.chmod(os.path.join(path, file), 0o744)
+        result = scheduler.run(
+            "permissions",
+            [
+                sys.executable,
+                "-m",
+                "noma.noma",
+                "permissions",
+                "bitcoind",
+                "--jobs={}".format(cfg.PERMISSIONS_JOBS),
+            ],
+        )
+        if result["returncode"] != 0:
+            raise OSError(
+                "Setting permissions failed with exit code {}".format(
+                    result["returncode"]
+                )
+            )
 
     def extract_snapshot():
+        from noma import scheduler
+
         print("Extract snapshot")
         os.chdir(bitcoind_dir_path)
-        tar = run(["tar", "xf", snapshot_path])
+        tar = scheduler.run("fastsync", ["tar", "xf", snapshot_path])
+        if tar["returncode"] != 0:
+            raise OSError(
+                "Extracting failed with exit code {}".format(tar["returncode"])
+            )
         print("Extracting done")
-        if tar.returncode == 0:
-            set_permissions(bitcoind_dir_path)
+        set_permissions()
 
     def remove_snapshot():
         assert IOError("Corrupt snapshot file")
@@ -77,92 +132,99 @@ def fastsync():
         #     # os.remove(snapshot_path + ".st")
 
     def compare_checksums():
+        from noma.backup import file_digest
+
         print("Comparing checksums")
-        openssl_location = run(
-            ["which", "openssl"], stdout=DEVNULL, stderr=DEVNULL
-        )
-        if openssl_location.returncode == 0:
-            # openssl is installed
-            openssl = run(
-                ["openssl", "dgst", "-sha256", snapshot_path],
-                stdout=PIPE,
-                stderr=PIPE,
-            )
-            if openssl.returncode == 0:
-                hash = str(bytes.decode(openssl.stdout))
-                hash = hash.split(" ")[1].rstrip()
-
-                if hash == checksum:
-                    print("Checksums match")
-                    return True
-                print("Checksums do not match:")
-                print("Expected: " + str(checksum))
-                print("  Actual: " + str(hash))
-                return False
-            raise OSError(
-                "Cannot compare hashes: " + bytes.decode(openssl.stderr)
-            )
-        else:
-            shasum = run(
-                ["sha256sum", snapshot_path], stdout=PIPE, stderr=PIPE
-            )
-            if shasum.returncode == 0:
-                hash = shasum.stdout.split(" ")[0]
-                print(hash)
-                if hash == checksum:
-                    print("Checksums match")
-                    return True
-                print("Checksums do not match: " + bytes.decode(shasum.stdout))
-                return False
-            raise OSError(
-                "Cannot compare hashes: " + bytes.decode(shasum.stderr)
-            )
+        digest = file_digest(snapshot_path)
+        if digest == checksum:
+            print("Checksums match")
+            return True
+        print("Checksums do not match:")
+        print("Expected: " + str(checksum))
+        print("  Actual: " + str(digest))
+        return False
+
+    def from_sources(fetch):
+        from requests import RequestException
+        from noma.seed import sources
+
+        # LAN seeds first, every source is verified against checksum
+        for source in sources(url, checksum):
+            print("Fetching snapshot from " + source)
+            try:
+                return fetch(source)
+            except (OSError, RequestException) as error:
+                if source == url:
+                    raise
+                print("LAN seed failed, trying next source:", error)
 
     def download_snapshot():
-        os.chdir(bitcoind_dir_path)
+        from noma.download import download
+
         print("Download snapshot")
-        download = run(
-            ["axel", "--quiet", "--no-clobber", url],
-            stdout=PIPE,
-            stderr=STDOUT,
-        )
-        if download.returncode == 0:
-            if compare_checksums():
-                extract_snapshot()
-            else:
-                remove_snapshot()
-                download_snapshot()
-        else:
-            raise OSError("Download failed" + str(download.stdout))
+        try:
+            # the digest is verified while downloading
+            from_sources(
+                lambda source: download(source, snapshot_path, checksum)
+            )
+        except OSError:
+            remove_snapshot()
+            raise
+        extract_snapshot()
+
+    def stream_snapshot():
+        from noma.download import extract
+        from noma.scheduler import Scheduler
+
+        print("Download and extract snapshot")
+        # hashed and extracted while downloading, no tarball is stored
+        with Scheduler().job("fastsync") as throttle:
+            from_sources(
+                lambda source: extract(
+                    source, bitcoind_dir, checksum, throttle=throttle
+                )
+            )
+        set_permissions()
 
+    def existing_chain():
+        for name in ("blocks", "chainstate"):
+            if pathlib.Path(bitcoind_dir / name).is_dir():
+                print("Bitcoin {} directory exists, stopping".format(name))
+                print("Remove the directory to fastsync")
+                return True
+        return False
+
+    fetch_snapshot = stream_snapshot
+    if cfg.SNAPSHOT_KEEP:
+        # a kept tarball can be seeded to other boxes on the LAN
+        fetch_snapshot = download_snapshot
+    start = time.monotonic()
     print("Checking existing filesystem structure")
     if bitcoind_dir_exists:
         print("Bitcoin directory exists")
-        if snapshot_path.is_file():
+        if existing_chain():
+            return
+        if pathlib.Path(str(snapshot_path) + ".state").is_file():
+            print("Resuming snapshot download")
+            download_snapshot()
+        elif snapshot_path.is_file():
             print("Snapshot archive exists")
-            if pathlib.Path(bitcoind_dir / "blocks").is_dir():
-                print("Bitcoin blocks directory exists, stopping")
-                print("Remove the directory to fastsync")
-                return
-            if pathlib.Path(bitcoind_dir / "chainstate").is_dir():
-                print("Bitcoin chainstate directory exists, stopping")
-                print("Remove the directory to fastsync")
-                return
             if compare_checksums():
                 extract_snapshot()
             else:
-                download_snapshot()
+                fetch_snapshot()
         else:
-            download_snapshot()
+            fetch_snapshot()
     else:
         print("Bitcoin directory does not exist, creating")
         if pathlib.Path("/media/archive/archive").is_dir():
             pathlib.Path(bitcoind_dir).mkdir(exist_ok=True)
-            download_snapshot()
+            fetch_snapshot()
         else:
             raise OSError(
                 "Error: archive directory does not exist on your usb device"
             )
+    print("fastsync took {:.0f}s".format(time.monotonic() - start))
 
 
 def create():
@@ -185,21 +247,20 @@ def create():
 
 def set_prune(prune_target, config_path=""):
     """Set bitcoind prune target, minimum 550"""
-    if not config_path:
-        config_path = "/media/archive/archive/bitcoin/bitcoin.conf"
     set_kv("prune", prune_target, config_path)
 
 
-def set_rpcauth(config_path):
+def set_rpcauth(config_path=""):
     """Write new rpc auth to bitcoind and lnd config"""
     import noma.lnd
 
     # TODO: Generate usernames too
     if not config_path:
-        config_path = "/media/archive/archive/bitcoin/bitcoin.conf"
+        config_path = cfg.BITCOIN_CONF
     if pathlib.Path(config_path).is_file():
         auth_value, password = generate_rpcauth("lncm")
-        set_kv("rpcauth", auth_value, config_path)
+        with conf.edit(config_path, conf.BitcoinConfig) as doc:
+            doc.set_rpcauth(auth_value)
         noma.lnd.set_bitcoind(password)
     else:
         create()
@@ -213,9 +274,9 @@ def generate_rpcauth(username, password=""):
     password_hmac = rpcauth.password_to_hmac(salt, password)
     auth_value = "{0}:{1}${2}".format(username, salt, password_hmac)
     try:
-        with open("/media/important/important/rpc.txt", "a") as file:
+        with open(str(cfg.RPC_CREDENTIALS), "a") as file:
             file.write(
-                "rpcauth={r}\nusername={u}\npassword={p}".format(
+                "rpcauth={r}\nusername={u}\npassword={p}\n".format(
                     r=auth_value, u=username, p=password
                 )
             )
@@ -248,63 +309,45 @@ def check():
     return False
 
 
-def get_kv(key, config_path):
+def get_kv(key, config_path="", network="main"):
     """
-    Parse key-value config files and print out values
+    Parse bitcoin.conf and return the value bitcoind uses for key
 
     :param key: left part of key value pair
     :param config_path: path to file
+    :param network: main, test or regtest
     :return: value of key
     """
-    import itertools
-    import configparser
-
-    parser = configparser.ConfigParser(strict=False)
-    with open(config_path) as lines:
-        lines = itertools.chain(
-            ("[main]",), lines
-        )  # workaround: prepend dummy section
-        parser.read_file(lines)
-        return parser.get("main", key)
+    if not config_path:
+        config_path = cfg.BITCOIN_CONF
+    return conf.load(config_path, conf.BitcoinConfig).lookup(key, network)
 
 
-def set_kv(key, value, config_path):
+def set_kv(key, value, config_path="", section=""):
     """
-    Set key to value in path
-    kv pairs are separated by "="
+    Set key to value in bitcoin.conf, keeping comments and ordering
 
     :param key: key to set
     :param value: value to set
     :param config_path: config file path
-    :return str: string written
+    :param section: optional network section, e.g. test
     """
-    from fileinput import FileInput
+    set_kvs({key: value}, config_path, section)
 
-    path = pathlib.Path(config_path)
-    config_exists = path.is_file()
 
-    if not config_exists:
-        # create empty config file
-        path.touch()
+def set_kvs(pairs, config_path="", section=""):
+    """
+    Set several single-valued keys in one atomic write of bitcoin.conf
 
-    current_val = None
-    try:
-        current_val = get_kv(key, config_path)
-    except Exception as err:
-        print(err)
-    if value == current_val:
-        # nothing to do
-        print("{k} already set to {v}".format(k=key, v=value))
-        return
-    if current_val is None:
-        # key does not exist yet
-        with open(config_path, "a") as file:
-            # append kv pair to file
-            file.write("\n{k}={v}".format(k=key, v=value))
-    else:
-        with FileInput(config_path, inplace=True, backup=".bak") as file:
-            for line in file:
-                print(line.replace(current_val, value), end="")
+    :param pairs: dict of keys and values
+    :param config_path: config file path, created if missing
+    :param section: optional network section, e.g. test
+    """
+    if not config_path:
+        config_path = cfg.BITCOIN_CONF
+    with conf.edit(config_path, conf.BitcoinConfig) as doc:
+        for key, value in pairs.items():
+            doc.set(section, key, value)
 
 
 if __name__ == "__main__":
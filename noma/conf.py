@@ -0,0 +1,414 @@
+"""
+Comment-preserving config file model for lnd.conf and bitcoin.conf
+
+The file is kept as a list of lines, so comments, blank lines, ordering and
+repeated keys such as neutrino.connect or rpcauth survive any number of
+edits. Parsed documents are cached per path and only re-read when the file
+changes, and edits are written back in a single atomic rename-into-place.
+"""
+import os
+import re
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+_SECTION = re.compile(r"^\s*\[([^\]]+)\]\s*$")
+_KV = re.compile(r"^(\s*)([^=\s\[;#][^=]*?)(\s*=\s*)(.*?)\s*$")
+_COMMENTED_KV = re.compile(r"^\s*[;#]\s*([^=\s;#]+)\s*=")
+
+# kind is one of "section", "kv" or "other" (comments, blank lines)
+Line = namedtuple("Line", "kind section key value raw")
+
+
+class ConfigDocument:
+    """
+    Parsed config file that keeps every line of the original text
+
+    Keys outside of any [section] belong to the section "".
+
+    :param text: config file contents
+    """
+
+    comment_prefixes = (";", "#")
+
+    def __init__(self, text=""):
+        self.lines = []
+        self.changed = False
+        section = ""
+        for raw in text.splitlines():
+            stripped = raw.strip()
+            match = _SECTION.match(raw)
+            if not stripped or stripped.startswith(self.comment_prefixes):
+                self.lines.append(Line("other", section, None, None, raw))
+            elif match:
+                section = match.group(1).strip()
+                self.lines.append(Line("section", section, None, None, raw))
+            else:
+                match = _KV.match(raw)
+                if match:
+                    key, value = match.group(2), match.group(4)
+                    self.lines.append(Line("kv", section, key, value, raw))
+                else:
+                    self.lines.append(Line("other", section, None, None, raw))
+
+    def copy(self):
+        """Return an independent copy of this document"""
+        other = self.__class__.__new__(self.__class__)
+        other.lines = list(self.lines)
+        other.changed = False
+        return other
+
+    def text(self):
+        """Render document back to text"""
+        return "".join(line.raw + "\n" for line in self.lines)
+
+    def sections(self):
+        """Return section names in order of appearance"""
+        names = [""] if any(line.section == "" for line in self.lines) else []
+        names.extend(
+            line.section for line in self.lines if line.kind == "section"
+        )
+        return names
+
+    def _indexes(self, section, key):
+        key = key.lower()
+        return [
+            index
+            for index, line in enumerate(self.lines)
+            if line.kind == "kv"
+            and line.section == section
+            and line.key.lower() == key
+        ]
+
+    def get_all(self, section, key):
+        """Return every value of a possibly repeated key, in order"""
+        return [self.lines[i].value for i in self._indexes(section, key)]
+
+    def get(self, section, key):
+        """
+        Return value of key, the last one wins if it is repeated
+
+        :raises KeyError: key is not set in section
+        """
+        values = self.get_all(section, key)
+        if not values:
+            raise KeyError("{k} not set in [{s}]".format(k=key, s=section))
+        return values[-1]
+
+    def items(self, section):
+        """Return list of (key, value) pairs of section"""
+        return [
+            (line.key, line.value)
+            for line in self.lines
+            if line.kind == "kv" and line.section == section
+        ]
+
+    def _render(self, index, key, value):
+        """Render kv line, keeping indentation and delimiter of index"""
+        indent, delimiter = "", "="
+        if index is not None:
+            match = _KV.match(self.lines[index].raw)
+            indent, delimiter = match.group(1), match.group(3)
+        return indent + key + delimiter + str(value)
+
+    def _insert_position(self, section, key):
+        """Find where a new key belongs in section, or None if not found"""
+        key = key.lower()
+        position = None
+        for index, line in enumerate(self.lines):
+            if line.section != section:
+                continue
+            if line.kind == "section" or line.kind == "kv":
+                position = index + 1
+            elif line.kind == "other":
+                # place new keys right below their commented out default
+                match = _COMMENTED_KV.match(line.raw)
+                if match and match.group(1).lower() == key:
+                    return index + 1
+        if position is None and section == "":
+            position = 0
+        return position
+
+    def _insert(self, section, key, value):
+        position = self._insert_position(section, key)
+        if position is None:
+            if self.lines and self.lines[-1].raw.strip():
+                previous = self.lines[-1].section
+                self.lines.append(Line("other", previous, None, None, ""))
+            header = "[{}]".format(section)
+            self.lines.append(Line("section", section, None, None, header))
+            position = len(self.lines)
+        raw = self._render(None, key, value)
+        self.lines.insert(position, Line("kv", section, key, str(value), raw))
+
+    def set(self, section, key, value):
+        """
+        Set key to a single value
+
+        An existing line is edited in place, further repetitions of the key
+        are dropped. New keys go below their commented out default if there
+        is one, otherwise at the end of the section.
+        """
+        indexes = self._indexes(section, key)
+        value = str(value)
+        if len(indexes) == 1 and self.lines[indexes[0]].value == value:
+            return
+        if indexes:
+            first = indexes[0]
+            line = self.lines[first]
+            raw = self._render(first, line.key, value)
+            self.lines[first] = line._replace(value=value, raw=raw)
+            for index in reversed(indexes[1:]):
+                del self.lines[index]
+        else:
+            self._insert(section, key, value)
+        self.changed = True
+
+    def set_all(self, section, key, values):
+        """Replace all values of a repeated key, e.g. neutrino.connect"""
+        values = [str(value) for value in values]
+        indexes = self._indexes(section, key)
+        if [self.lines[i].value for i in indexes] == values:
+            return
+        if not indexes:
+            for value in values:
+                self.add(section, key, value)
+            return
+        # keep the repeated key where it was, formatted like before
+        first = indexes[0]
+        name = self.lines[first].key
+        lines = [
+            Line("kv", section, name, value, self._render(first, name, value))
+            for value in values
+        ]
+        for index in reversed(indexes):
+            del self.lines[index]
+        self.lines[first:first] = lines
+        self.changed = True
+
+    def add(self, section, key, value):
+        """Add another value for a repeated key, after its last occurrence"""
+        indexes = self._indexes(section, key)
+        value = str(value)
+        if indexes:
+            last = indexes[-1]
+            raw = self._render(last, self.lines[last].key, value)
+            self.lines.insert(
+                last + 1, Line("kv", section, self.lines[last].key, value, raw)
+            )
+        else:
+            self._insert(section, key, value)
+        self.changed = True
+
+    def remove(self, section, key, value=None):
+        """Remove key, or only the lines where it is set to value"""
+        for index in reversed(self._indexes(section, key)):
+            if value is None or self.lines[index].value == str(value):
+                del self.lines[index]
+                self.changed = True
+
+
+class BitcoinConfig(ConfigDocument):
+    """
+    Parsed bitcoin.conf
+
+    Keys before the first section apply to every network unless they are
+    network-only, [main], [test] and [regtest] override them per network.
+    Like bitcoind, the first value of a repeated single-valued key wins.
+    """
+
+    comment_prefixes = ("#",)
+    networks = ("main", "test", "regtest")
+    # options that may be given more than once
+    multi_valued = {
+        "addnode",
+        "bind",
+        "connect",
+        "debug",
+        "externalip",
+        "onlynet",
+        "rpcallowip",
+        "rpcauth",
+        "rpcbind",
+        "seednode",
+        "wallet",
+        "whitebind",
+        "whitelist",
+    }
+    # options in the default section that are ignored on test and regtest
+    network_only = {
+        "addnode",
+        "bind",
+        "connect",
+        "port",
+        "rpcbind",
+        "rpcport",
+        "wallet",
+    }
+    placeholder = "GENERATEDRPCAUTH"
+
+    def get(self, section, key):
+        """
+        Return value of key, the first one wins if it is repeated
+
+        :raises KeyError: key is not set in section
+        """
+        values = self.get_all(section, key)
+        if not values:
+            raise KeyError("{k} not set in [{s}]".format(k=key, s=section))
+        return values[0]
+
+    def lookup_all(self, key, network="main"):
+        """Return values of key as bitcoind sees them on network"""
+        if network not in self.networks:
+            raise ValueError("Unknown network: " + str(network))
+        values = self.get_all(network, key)
+        if values:
+            return values
+        if network != "main" and key.lower() in self.network_only:
+            return []
+        return self.get_all("", key)
+
+    def lookup(self, key, network="main"):
+        """
+        Return value of key as bitcoind sees it on network
+
+        :raises KeyError: key is not set for network
+        """
+        values = self.lookup_all(key, network)
+        if not values:
+            raise KeyError("{k} not set for {n}".format(k=key, n=network))
+        if key.lower() in self.multi_valued:
+            return values[-1]
+        return values[0]
+
+    def set(self, section, key, value):
+        """
+        Set a single-valued key, use add or set_all for multi-valued keys
+
+        :raises ValueError: key may be given more than once
+        """
+        if key.lower() in self.multi_valued:
+            raise ValueError(key + " is multi-valued, use add or set_all")
+        super().set(section, key, value)
+
+    def set_rpcauth(self, auth_value, section=""):
+        """
+        Set rpcauth of the user in auth_value, keeping other users
+
+        Replaces the user's previous rpcauth line or else the
+        GENERATEDRPCAUTH placeholder if there is one.
+        """
+        user = auth_value.split(":", 1)[0]
+        indexes = [
+            index
+            for index in self._indexes(section, "rpcauth")
+            if self.lines[index].value.split(":", 1)[0] == user
+        ]
+        if not indexes:
+            for index, line in enumerate(self.lines):
+                if line.section == section and line.raw == self.placeholder:
+                    raw = "rpcauth=" + auth_value
+                    self.lines[index] = Line(
+                        "kv", section, "rpcauth", auth_value, raw
+                    )
+                    self.changed = True
+                    return
+            self.add(section, "rpcauth", auth_value)
+            return
+        first = self.lines[indexes[0]]
+        if len(indexes) == 1 and first.value == auth_value:
+            return
+        raw = self._render(indexes[0], first.key, auth_value)
+        self.lines[indexes[0]] = first._replace(value=auth_value, raw=raw)
+        for index in reversed(indexes[1:]):
+            del self.lines[index]
+        self.changed = True
+
+
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def _stat_key(config_path):
+    stat = os.stat(config_path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def load(config_path, document=ConfigDocument):
+    """
+    Return parsed document for config_path
+
+    The parse is cached and reused until the file's mtime, size or inode
+    changes. Every call returns an independent copy that is safe to edit.
+
+    :param config_path: path to config file
+    :param document: ConfigDocument class to parse with
+    :return: document
+    """
+    config_path = str(config_path)
+    stat_key = _stat_key(config_path)
+    cache_key = (config_path, document)
+    with _CACHE_LOCK:
+        cached = _CACHE.get(cache_key)
+        if cached and cached[0] == stat_key:
+            return cached[1].copy()
+    with open(config_path) as file:
+        parsed = document(file.read())
+    with _CACHE_LOCK:
+        _CACHE[cache_key] = (stat_key, parsed)
+    return parsed.copy()
+
+
+def save(doc, config_path):
+    """
+    Atomically write document to config_path
+
+    Writes a temporary file next to config_path, syncs it and renames it
+    into place, so readers never see a partially written config.
+    """
+    config_path = str(config_path)
+    temp_path = config_path + ".tmp"
+    try:
+        mode = os.stat(config_path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o644
+    with open(temp_path, "w") as file:
+        file.write(doc.text())
+        file.flush()
+        os.fsync(file.fileno())
+    os.chmod(temp_path, mode)
+    os.replace(temp_path, config_path)
+    doc.changed = False
+    with _CACHE_LOCK:
+        _CACHE[(config_path, doc.__class__)] = (
+            _stat_key(config_path),
+            doc.copy(),
+        )
+
+
+@contextmanager
+def edit(config_path, document=ConfigDocument):
+    """
+    Apply a batch of edits to config_path in one atomic write
+
+    Nothing is written if the block raises or leaves the document unchanged::
+
+        with conf.edit(cfg.LND_CONF) as doc:
+            doc.set("Bitcoind", "bitcoind.rpcuser", "lncm")
+            doc.set("Bitcoind", "bitcoind.rpcpass", password)
+
+    :param config_path: path to config file, created if missing
+    :param document: ConfigDocument class to parse with
+    """
+    try:
+        doc = load(config_path, document)
+    except FileNotFoundError:
+        doc = document()
+    yield doc
+    if doc.changed:
+        save(doc, config_path)
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -14,6 +14,7 @@ LND_NET = "mainnet"
 """Filesystem"""
 MEDIA_PATH = Path("/media")
 NOMA_SOURCE = MEDIA_PATH / "noma"
+IMPORTANT_PATH = MEDIA_PATH / "important" / "important"
 
 """Remote SSH backup host"""
 SSH_PORT = "22"
@@ -21,6 +22,14 @@ SSH_PORT = "22"
 SSH_IDENTITY = "~/.ssh/id_ed25519"
 # [user@]host:[path]
 SSH_TARGET = "user@ssh-hostname:/path/to/backup/dir/"
+# Number of channel.backup versions kept on the remote host
+BACKUP_VERSIONS = 10
+# Keep the ssh master connection open for reuse between backups
+SSH_CONTROL_PERSIST = "10m"
+# Seconds channel.backup must be quiet before backup --watch ships it
+BACKUP_DEBOUNCE = 2
+# Seconds between retries of failed uploads in backup --watch
+BACKUP_RETRY = 30
 
 """Do not change below here"""
 """unless you know what you're doing"""
@@ -28,6 +37,115 @@ SSH_TARGET = "user@ssh-hostname:/path/to/backup/dir/"
 HOME_PATH = Path.home()
 COMPOSE_MODE_PATH = NOMA_SOURCE / "compose" / LND_MODE
 
+"""bitcoind Paths"""
+BITCOIN_PATH = MEDIA_PATH / "archive" / "archive" / "bitcoin"
+BITCOIN_CONF = BITCOIN_PATH / "bitcoin.conf"
+
+"""bitcoind RPC"""
+BITCOIN_RPC_URL = "http://127.0.0.1:8332"
+# Credentials written by bitcoind.generate_rpcauth
+RPC_CREDENTIALS = IMPORTANT_PATH / "rpc.txt"
+# (connect, read) timeout in seconds
+RPC_TIMEOUT = (3.05, 60)
+
+"""bitcoind sync progress"""
+# Seconds between samples
+PROGRESS_INTERVAL = 10
+# Samples kept for rates and stall detection, one hour at 10 seconds
+PROGRESS_SAMPLES = 360
+# Seconds without a new block before sync counts as stalled
+PROGRESS_STALL = 600
+# Weight of the newest interval in the smoothed rates
+PROGRESS_SMOOTHING = 0.2
+# iowait and cpu percentages blamed for a rate drop
+PROGRESS_IOWAIT = 20
+PROGRESS_CPU = 90
+
+"""Hardware tuning"""
+# Bytes written to measure archive drive throughput
+TUNE_TEST_SIZE = 64 * 1048576
+# Share of RAM given to dbcache, more on drives slower than TUNE_SLOW_DISK
+TUNE_DBCACHE_SHARE = 0.25
+TUNE_DBCACHE_SHARE_SLOW = 0.35
+# MB/s
+TUNE_SLOW_DISK = 20
+# Share of free archive space used for blocks
+TUNE_DISK_SHARE = 0.8
+# MiB needed to keep the whole chain unpruned, with room to grow
+TUNE_FULL_CHAIN = 400000
+# Seconds to measure sync rate before and after tuning
+TUNE_DURATION = 300
+# Seconds bitcoind gets to flush its cache on restart
+TUNE_RESTART_TIMEOUT = 600
+
+"""noma info dashboard"""
+# Values shared between calls, e.g. by a monitoring system
+INFO_CACHE = Path("/run") / "noma-info.json"
+# Seconds a source's value is cached, sources not listed are always fresh
+INFO_TTL = {
+    "lnd": 5,
+    "bitcoind": 5,
+    "voltage": 60,
+    "gpu_memory": 3600,
+    "disk": 30,
+}
+# Seconds to wait for a source
+INFO_TIMEOUT = 2
+INFO_TIMEOUTS = {"lnd": 4, "bitcoind": 4}
+
+"""Hardware telemetry"""
+TELEMETRY_PATH = MEDIA_PATH / "telemetry.bin"
+TELEMETRY_INTERVAL = 10
+# Samples kept, a day at the default interval
+TELEMETRY_SAMPLES = 8640
+# Samples between writing the memory-mapped file to disk
+TELEMETRY_FLUSH = 60
+# Seconds of samples summarised by noma telemetry stats
+TELEMETRY_WINDOW = 3600
+TELEMETRY_PERCENTILES = (50, 95, 99)
+
+"""Maintenance jobs"""
+SCHEDULER_STATS = MEDIA_PATH / "scheduler.json"
+# Locked while a job runs, so jobs of all noma processes run one at a time
+SCHEDULER_LOCK = Path("/run") / "noma-jobs.lock"
+# Degrees Celsius, the firmware throttles the clock from 80
+SCHEDULER_START_TEMP = 70
+SCHEDULER_PAUSE_TEMP = 77
+SCHEDULER_RESUME_TEMP = 70
+# 1 minute load average per CPU below which jobs start
+SCHEDULER_START_LOAD = 0.75
+# Seconds between temperature checks of a running job
+SCHEDULER_POLL = 5
+# Seconds a job waits to start before it runs regardless
+SCHEDULER_DEFER = 1800
+# Seconds a job stays paused before it continues regardless
+SCHEDULER_MAX_PAUSE = 600
+SCHEDULER_NICE = 19
+# ionice best-effort class at its lowest level, idle can starve jobs
+SCHEDULER_IOCLASS = 2
+SCHEDULER_IOLEVEL = 7
+
+"""Shutdown"""
+# Seconds for stopping all services
+SHUTDOWN_DEADLINE = 180
+# Seconds a service gets to exit cleanly before docker stop
+SHUTDOWN_TIMEOUT = 30
+SHUTDOWN_TIMEOUTS = {"lnd": 60, "bitcoind": 150}
+# Clean shutdown commands run inside containers, bitcoind uses RPC
+SHUTDOWN_COMMANDS = {"lnd": ["lncli", "stop"]}
+
+"""Ownership and permissions"""
+LNCM_UID = 1001
+LNCM_GID = 1001
+# name: (directory, uid, gid, directory mode, file mode)
+PERMISSIONS = {
+    "bitcoind": (BITCOIN_PATH, LNCM_UID, LNCM_GID, 0o755, 0o744),
+    "lnd": (NOMA_SOURCE / "lnd", 0, 0, 0o700, 0o600),
+    "nginx": (IMPORTANT_PATH / "nginx", 0, 0, 0o755, 0o644),
+}
+# Worker threads used to fix permissions
+PERMISSIONS_JOBS = 4
+
 """LND Paths"""
 LND_PATH = NOMA_SOURCE / "lnd" / LND_MODE
 LND_CONF = LND_PATH / "lnd.conf"
@@ -38,6 +156,13 @@ TLS_CERT_PATH = LND_PATH / "tls.cert"
 MACAROON_PATH = CHAIN_PATH / LND_NET / "admin.macaroon"
 SEED_FILENAME = LND_PATH / "seed.txt"
 CHANNEL_BACKUP = CHAIN_PATH / LND_NET / "channel.backup"
+# Saved peers for reconnecting, next to autoconnect.txt
+PEERS_FILE = LND_PATH / "peers.json"
+# Time from container start to unlocked wallet, one JSON object per line
+UNLOCK_LOG = LND_PATH / "unlock.log"
+# Hash and version manifest of shipped channel backups
+BACKUP_MANIFEST = LND_PATH / "backup.json"
+SSH_CONTROL_PATH = HOME_PATH / ".ssh" / "noma-%r@%h:%p"
 
 """LND Create Password"""
 # Save password control file (Add this file to save passwords)
@@ -47,8 +172,89 @@ PASSWORD_FILE_PATH = LND_PATH / "password.txt"
 
 """LND Endpoints"""
 URL_GRPC = "192.168.83.33:10009"
+URL_REST = "https://127.0.0.1:8080"
 # Generate seed
-URL_GENSEED = "https://127.0.0.1:8080/v1/genseed"
+URL_GENSEED = URL_REST + "/v1/genseed"
 # Initialize wallet
-URL_INITWALLET = "https://127.0.0.1:8080/v1/initwallet"
-URL_UNLOCKWALLET = "https://127.0.0.1:8080/v1/unlockwallet"
+URL_INITWALLET = URL_REST + "/v1/initwallet"
+URL_UNLOCKWALLET = URL_REST + "/v1/unlockwallet"
+
+"""LND REST client"""
+# (connect, read) timeout in seconds
+REST_TIMEOUT = (3.05, 30)
+# Retries of failed connection attempts
+REST_RETRIES = 3
+# Keep-alive connections held open to lnd
+REST_POOL_SIZE = 8
+
+"""LND unlock"""
+# Seconds to wait for lnd to accept the wallet password
+UNLOCK_TIMEOUT = 300
+# Escalating REST readiness poll interval in seconds
+UNLOCK_POLL_MIN = 0.1
+UNLOCK_POLL_MAX = 2
+
+"""LND invoice and payment index"""
+INDEX_DB = IMPORTANT_PATH / "lnd-index.sqlite"
+# Invoices or payments requested from lnd per page
+INDEX_PAGE_SIZE = 500
+
+"""LND forwarding history export"""
+FWD_EXPORT_PATH = IMPORTANT_PATH / "fwdexport"
+# Forwarding events requested from lnd per page
+FWD_PAGE_SIZE = 5000
+# Rows read per chunk when aggregating the export
+FWD_CHUNK_ROWS = 65536
+
+"""Snapshot downloads"""
+# Parallel connections per download
+DOWNLOAD_JOBS = 4
+# Bytes per HTTP Range request
+DOWNLOAD_CHUNK_SIZE = 4194304
+# Attempts per chunk after the first one
+DOWNLOAD_RETRIES = 5
+# Seconds to connect and between received bytes
+DOWNLOAD_TIMEOUT = (3.05, 60)
+# Seconds between progress reports
+DOWNLOAD_REPORT = 10
+# Seconds between syncing written chunks and recording them as done
+DOWNLOAD_CHECKPOINT = 30
+
+"""UTXO snapshot"""
+SNAPSHOT_MIRROR = "http://utxosets.blob.core.windows.net/public/"
+SNAPSHOT_NAME = "utxo-snapshot-bitcoin-mainnet-565305.tar"
+SNAPSHOT_SHA256 = (
+    "8e18176138be351707aee95f349dd1debc714cc2cc4f0c76d6a7380988bf0d22"
+)
+SNAPSHOT_PATH = BITCOIN_PATH / SNAPSHOT_NAME
+# Keep the tarball after fastsync so this box can seed it to the LAN
+SNAPSHOT_KEEP = False
+
+"""LAN snapshot seeds"""
+SEED_PORT = 8432
+SEED_SERVICE = "_noma-seed._tcp"
+# Seeds tried before discovered ones, e.g. ["http://192.168.1.5:8432"]
+SEED_PEERS = []
+# Seconds to browse mDNS for seeds
+SEED_DISCOVERY_TIMEOUT = 5
+
+"""LND logs"""
+LND_LOG_PATH = LND_PATH / "logs" / "bitcoin" / LND_NET
+LOG_INDEX_PATH = LND_PATH / "logs" / "index"
+# Approximate bytes per indexed block of a log file
+LOG_BLOCK_SIZE = 262144
+
+"""LND channel graph snapshots"""
+GRAPH_PATH = MEDIA_PATH / "graph"
+# Bytes read from the describegraph response at a time
+GRAPH_CHUNK_SIZE = 65536
+# Nodes and edges written to the snapshot per transaction
+GRAPH_BATCH_SIZE = 1000
+
+"""LND autoconnect"""
+# Concurrent peer connection attempts
+AUTOCONNECT_JOBS = 8
+# Seconds to wait for a single peer to connect
+AUTOCONNECT_TIMEOUT = 10
+# Seconds before last-seen timestamps alone cause peers.json to be rewritten
+PEERS_REFRESH = 3600
@@ -0,0 +1,231 @@
+"""
+Docker container state, kept current by the Docker event stream
+
+One long-lived Docker client lists the containers once. A background thread
+then applies container events to an in-memory table, so status queries are
+dictionary lookups and callers can wait for a state change instead of
+polling. If the event stream breaks, e.g. because dockerd restarted, the
+table is seeded again.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+import noma.config as cfg
+
+# container event action: resulting status, None removes the container
+ACTIONS = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+    "destroy": None,
+}
+
+_CLIENT = None
+_STATE = None
+_LOCK = threading.Lock()
+
+
+def client():
+    """Return the shared Docker client, created on first use"""
+    global _CLIENT
+    with _LOCK:
+        if _CLIENT is None:
+            from docker import from_env
+
+            _CLIENT = from_env()
+        return _CLIENT
+
+
+def compose_name(node):
+    """Return container name of a compose service, e.g. neutrino_lnd_1"""
+    return cfg.LND_MODE + "_" + node + "_1"
+
+
+def _epoch(started):
+    """
+    Convert Docker's StartedAt timestamp to epoch seconds
+
+    :param started: e.g. 2019-03-01T12:00:00.123456789Z
+    :return float: seconds, None if the container never started
+    """
+    if not started or started.startswith("0001-"):
+        return None
+    # Docker reports nanoseconds, strptime accepts microseconds
+    started = started.rstrip("Z").split(".")
+    micro = (started[1] + "000000")[:6] if len(started) > 1 else "0"
+    return (
+        datetime.strptime(started[0], "%Y-%m-%dT%H:%M:%S")
+        .replace(microsecond=int(micro), tzinfo=timezone.utc)
+        .timestamp()
+    )
+
+
+class ContainerState:
+    """
+    Table of container name to status, id and start time
+
+    :param docker_client: Docker client, the shared one by default
+    """
+
+    def __init__(self, docker_client=None):
+        self._client = docker_client
+        self._containers = {}
+        self._condition = threading.Condition()
+        self._seeded = False
+        self._closed = False
+        self._thread = None
+        self._events = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = client()
+        return self._client
+
+    def _seed(self):
+        """
+        Fill the table from a container listing
+
+        :return int: time to replay events from, taken before listing
+        """
+        since = int(time.time())
+        containers = {}
+        for container in self.client.containers.list(all=True):
+            containers[container.name] = {
+                "id": container.id,
+                "status": container.status,
+                "started": _epoch(container.attrs["State"].get("StartedAt")),
+            }
+        with self._condition:
+            self._containers = containers
+            self._seeded = True
+            self._condition.notify_all()
+        return since
+
+    def apply(self, event):
+        """Update the table from one Docker container event"""
+        action = event.get("Action", event.get("status", ""))
+        if action not in ACTIONS:
+            return
+        name = event["Actor"]["Attributes"].get("name")
+        status = ACTIONS[action]
+        with self._condition:
+            if status is None:
+                self._containers.pop(name, None)
+            else:
+                container = self._containers.setdefault(name, {})
+                container["id"] = event["Actor"]["ID"]
+                container["status"] = status
+                if status == "running" and action != "unpause":
+                    container["started"] = event.get(
+                        "timeNano", event.get("time", 0) * 1e9
+                    ) / 1e9
+            self._condition.notify_all()
+
+    def _watch(self, since):
+        """Apply events until closed, seeding again if the stream breaks"""
+        while not self._closed:
+            try:
+                self._events = self.client.events(
+                    since=since, decode=True, filters={"type": "container"}
+                )
+                for event in self._events:
+                    # replaying a second twice after reconnecting is harmless
+                    since = event.get("time", since)
+                    self.apply(event)
+            except Exception as error:
+                if not self._closed:
+                    print(error.__class__.__name__, ":", error)
+            if self._closed:
+                break
+            with self._condition:
+                self._seeded = False
+            time.sleep(1)
+            try:
+                since = self._seed()
+            except Exception:
+                continue
+
+    def _ensure(self):
+        """Seed the table and start following events, if not done yet"""
+        if self._seeded and self._thread is not None:
+            return
+        since = self._seed()
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._watch, args=(since,), daemon=True
+                )
+                self._thread.start()
+
+    def status(self, name):
+        """
+        Return status of a container
+
+        :param name: container name
+        :return str: e.g. running or exited, None if there is no container
+        """
+        self._ensure()
+        with self._condition:
+            return self._containers.get(name, {}).get("status")
+
+    def is_running(self, name):
+        """Return True if the container is running"""
+        return self.status(name) == "running"
+
+    def started_at(self, name):
+        """Return start time of the container as epoch seconds, or None"""
+        self._ensure()
+        with self._condition:
+            return self._containers.get(name, {}).get("started")
+
+    def containers(self):
+        """Return a copy of the table"""
+        self._ensure()
+        with self._condition:
+            return {
+                name: dict(container)
+                for name, container in self._containers.items()
+            }
+
+    def wait(self, name, running=True, timeout=None):
+        """
+        Wait until a container is running, or is not running
+
+        :param name: container name
+        :param running: wait for the container to run or to stop
+        :param timeout: seconds to wait at most, None for no limit
+        :return bool: True if the state was reached
+        """
+        self._ensure()
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: (
+                    self._containers.get(name, {}).get("status") == "running"
+                )
+                == running,
+                timeout,
+            )
+
+    def close(self):
+        """Stop following events"""
+        self._closed = True
+        if self._events is not None:
+            self._events.close()
+
+
+def state():
+    """Return the shared ContainerState"""
+    global _STATE
+    with _LOCK:
+        if _STATE is None:
+            _STATE = ContainerState()
+        return _STATE
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
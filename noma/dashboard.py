@@ -0,0 +1,290 @@
+"""
+Aggregated node dashboard for noma info
+
+Every source is gathered in its own thread with its own timeout, so one
+slow or hanging source neither delays nor hides the others. Sources are read
+from sysfs, psutil and the lnd and bitcoind HTTP APIs where possible; only
+values that need vcgencmd fork a process. Slow sources are cached in
+INFO_CACHE for their TTL, which is shared by every noma info call, e.g. by a
+monitoring system polling every few seconds.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from json import dumps, loads
+from subprocess import PIPE, run
+import noma.config as cfg
+
+_FORKS = 0
+_FORKS_LOCK = threading.Lock()
+
+
+def _run(args, timeout=cfg.INFO_TIMEOUT):
+    """Run a command, count the fork and return its stripped output"""
+    global _FORKS
+    with _FORKS_LOCK:
+        _FORKS += 1
+    result = run(
+        args, stdout=PIPE, universal_newlines=True, timeout=timeout, check=True
+    )
+    return result.stdout.strip()
+
+
+def forks():
+    """Return number of processes started by sources so far"""
+    with _FORKS_LOCK:
+        return _FORKS
+
+
+def _read(path):
+    with open(path) as file:
+        return file.read().strip()
+
+
+def lnd_info():
+    """Node identity and channel counts from lnd's REST getinfo"""
+    from noma.rest import get
+
+    response = get("/v1/getinfo", timeout=cfg.INFO_TIMEOUT)
+    response.raise_for_status()
+    info = response.json()
+    keys = (
+        "alias",
+        "version",
+        "block_height",
+        "synced_to_chain",
+        "num_peers",
+        "num_active_channels",
+        "num_pending_channels",
+    )
+    return {key: info.get(key) for key in keys}
+
+
+def bitcoind_info():
+    """Chain, network and mempool state from one batched RPC request"""
+    from noma import rpc
+
+    chain, network, mempool = rpc.batch(
+        ["getblockchaininfo", "getnetworkinfo", "getmempoolinfo"]
+    )
+    return {
+        "blocks": chain["blocks"],
+        "headers": chain["headers"],
+        "progress": round(chain["verificationprogress"], 6),
+        "pruned": chain.get("pruned", False),
+        "connections": network["connections"],
+        "mempool_transactions": mempool["size"],
+    }
+
+
+def container_info():
+    """Status of every container, from the event-driven state table"""
+    from noma import containers
+
+    table = containers.state().containers()
+    return {name: table[name]["status"] for name in sorted(table)}
+
+
+def system_info():
+    """Memory, swap, load and uptime from psutil"""
+    import psutil
+
+    memory = psutil.virtual_memory()
+    return {
+        "ram_mib": round(memory.total / 1048576),
+        "ram_available_mib": round(memory.available / 1048576),
+        "swap_mib": round(psutil.swap_memory().total / 1048576),
+        "load": [round(load, 2) for load in os.getloadavg()],
+        "uptime": round(time.time() - psutil.boot_time()),
+    }
+
+
+def temp_info():
+    """CPU temperature in degrees Celsius from sysfs"""
+    return int(_read("/sys/class/thermal/thermal_zone0/temp")) / 1000
+
+
+def freq_info():
+    """ARM clock in MHz from sysfs, no vcgencmd needed"""
+    path = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+    return int(_read(path)) // 1000
+
+
+def voltage_info():
+    """Core voltage from vcgencmd, e.g. volt=1.2000V"""
+    output = _run(["/opt/vc/bin/vcgencmd", "measure_volts", "core"])
+    return float(output.split("=")[1].rstrip("V"))
+
+
+def gpu_memory_info():
+    """Memory split in MiB from vcgencmd, e.g. gpu=64M"""
+    arm = _run(["/opt/vc/bin/vcgencmd", "get_mem", "arm"])
+    gpu = _run(["/opt/vc/bin/vcgencmd", "get_mem", "gpu"])
+    return {
+        "arm": int(arm.split("=")[1].rstrip("M")),
+        "gpu": int(gpu.split("=")[1].rstrip("M")),
+    }
+
+
+def disk_info():
+    """Size and free space of the media volume in GiB"""
+    usage = shutil.disk_usage(str(cfg.MEDIA_PATH))
+    return {
+        "total_gib": round(usage.total / 1073741824, 1),
+        "free_gib": round(usage.free / 1073741824, 1),
+    }
+
+
+SOURCES = {
+    "lnd": lnd_info,
+    "bitcoind": bitcoind_info,
+    "containers": container_info,
+    "system": system_info,
+    "temp": temp_info,
+    "freq": freq_info,
+    "voltage": voltage_info,
+    "gpu_memory": gpu_memory_info,
+    "disk": disk_info,
+}
+
+
+def load_cache(cache_path=""):
+    """Return cached source values, empty if missing or unreadable"""
+    if not cache_path:
+        cache_path = cfg.INFO_CACHE
+    try:
+        with open(str(cache_path)) as file:
+            return loads(file.read())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_cache(cache, cache_path):
+    # unpredictable name, created exclusively next to the cache
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(str(cache_path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(dumps(cache))
+        os.replace(temp_path, str(cache_path))
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def _collect(function, result):
+    start = time.monotonic()
+    try:
+        value = function()
+        result["seconds"] = time.monotonic() - start
+        result["value"] = value
+    except Exception as error:
+        result["error"] = "{}: {}".format(error.__class__.__name__, error)
+
+
+def gather(sources=None, cache_path="", ttls=None, timeouts=None):
+    """
+    Gather all sources concurrently, using cached values within their TTL
+
+    :param sources: dict of name to function, SOURCES by default
+    :param cache_path: JSON file shared between calls
+    :param ttls: seconds a value is cached per source, 0 if not listed
+    :param timeouts: seconds per source, INFO_TIMEOUT if not listed
+    :return dict: value or error per source and a meta entry with the
+        elapsed time, forks and cached sources of this call
+    """
+    if sources is None:
+        sources = SOURCES
+    if not cache_path:
+        cache_path = cfg.INFO_CACHE
+    if ttls is None:
+        ttls = cfg.INFO_TTL
+    if timeouts is None:
+        timeouts = cfg.INFO_TIMEOUTS
+    start = time.monotonic()
+    forks_before = forks()
+    now = time.time()
+    cache = load_cache(cache_path)
+    info, cached, workers = {}, [], {}
+    for name, function in sources.items():
+        entry = cache.get(name)
+        ttl = ttls.get(name, 0)
+        if ttl and entry and 0 <= now - entry["time"] < ttl:
+            info[name] = entry["value"]
+            cached.append(name)
+            continue
+        result = {}
+        # daemon threads, a hanging source must not keep noma alive
+        thread = threading.Thread(
+            target=_collect, args=(function, result), daemon=True
+        )
+        thread.start()
+        workers[name] = (thread, result)
+
+    seconds = {}
+    changed = False
+    for name, (thread, result) in workers.items():
+        timeout = timeouts.get(name, cfg.INFO_TIMEOUT)
+        thread.join(max(0, start + timeout - time.monotonic()))
+        if "value" in result:
+            info[name] = result["value"]
+            seconds[name] = round(result["seconds"], 3)
+            if ttls.get(name, 0):
+                cache[name] = {"time": now, "value": result["value"]}
+                changed = True
+        else:
+            info[name] = {"error": result.get("error", "timeout")}
+    if changed:
+        try:
+            _write_cache(cache, cache_path)
+        except OSError as error:
+            print(error.__class__.__name__, ":", error)
+    info = {name: info[name] for name in sources}
+    info["meta"] = {
+        "elapsed": round(time.monotonic() - start, 3),
+        "forks": forks() - forks_before,
+        "cached": cached,
+        "seconds": seconds,
+    }
+    return info
+
+
+def render(info):
+    """Return gathered info as a table"""
+    lines = []
+    for name, value in info.items():
+        if name == "meta":
+            continue
+        if isinstance(value, dict):
+            lines.append(name)
+            for key, item in value.items():
+                lines.append("  {:<22}{}".format(key, item))
+        else:
+            lines.append("{:<24}{}".format(name, value))
+    meta = info.get("meta")
+    if meta:
+        lines.append(
+            "gathered in {e:.3f}s, {f} forks, {c} cached".format(
+                e=meta["elapsed"], f=meta["forks"], c=len(meta["cached"])
+            )
+        )
+    return "\n".join(lines)
+
+
+def show(as_json=False):
+    """
+    Print the dashboard
+
+    :param as_json: print one JSON object instead of a table
+    :return dict: gathered info
+    """
+    info = gather()
+    print(dumps(info, sort_keys=True) if as_json else render(info))
+    return info
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
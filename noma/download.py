@@ -0,0 +1,505 @@
+"""
+Resumable multi-connection HTTP downloader
+
+Large files are split into chunks of DOWNLOAD_CHUNK_SIZE bytes which are
+fetched with HTTP Range requests over several connections and written in
+place. Completed chunks are synced to disk and recorded in a state file
+next to the target every DOWNLOAD_CHECKPOINT seconds and when a run stops,
+so an interrupted download continues with the missing chunks only. Failed
+chunks are retried a bounded number of times with exponential backoff.
+
+The SHA-256 digest is computed in file order from the chunks still in
+memory, so verification needs no second read of the file. Only chunks
+fetched by an earlier, interrupted run are read back once.
+
+Extract feeds the same ordered stream into a tar extractor instead of a
+file, so an archive is unpacked while it downloads, with no tarball.
+"""
+import hashlib
+import os
+import shutil
+import tarfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from json import dumps, loads
+import requests
+import noma.config as cfg
+
+
+class Download:
+    """
+    Download url to target over jobs parallel Range requests
+
+    :param url: source url
+    :param target: destination file
+    :param jobs: number of parallel connections
+    :param chunk_size: bytes per Range request
+    :param retries: attempts per chunk after the first one
+    :param backoff: seconds before the first retry, doubled every retry
+    :param sha256: expected hex digest of the complete file
+    """
+
+    def __init__(
+        self,
+        url,
+        target,
+        sha256="",
+        jobs=cfg.DOWNLOAD_JOBS,
+        chunk_size=cfg.DOWNLOAD_CHUNK_SIZE,
+        retries=cfg.DOWNLOAD_RETRIES,
+        backoff=1,
+    ):
+        self.url = url
+        self.target = str(target)
+        self.state_path = self.target + ".state"
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.backoff = backoff
+        self.sha256 = sha256.lower()
+        self.hasher = hashlib.sha256()
+        self.hashed = 0
+        self.digest = ""
+        self.window = 2 * jobs
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=jobs
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.size = 0
+        self.validator = ""
+        self.received = 0
+        self.checkpointed = 0.0
+        self._lock = threading.Lock()
+
+    def probe(self):
+        """
+        Find size, Range support and validator (ETag or Last-Modified)
+
+        :return bool: True if the server supports Range requests
+        """
+        response = self.session.head(
+            self.url, allow_redirects=True, timeout=cfg.DOWNLOAD_TIMEOUT
+        )
+        response.raise_for_status()
+        self.url = response.url
+        self.size = int(response.headers.get("Content-Length", 0))
+        self.validator = response.headers.get(
+            "ETag", response.headers.get("Last-Modified", "")
+        )
+        return (
+            response.headers.get("Accept-Ranges") == "bytes" and self.size > 0
+        )
+
+    def chunks(self):
+        """Number of chunks of the target"""
+        return -(-self.size // self.chunk_size)
+
+    def load_state(self):
+        """
+        Completed chunks of a previous run, if it downloaded the same file
+
+        :return set: indexes of completed chunks
+        """
+        try:
+            with open(self.state_path) as file:
+                state = loads(file.read())
+        except (FileNotFoundError, ValueError):
+            return set()
+        if (
+            state.get("size") != self.size
+            or state.get("validator") != self.validator
+            or state.get("chunk_size") != self.chunk_size
+            or not os.path.isfile(self.target)
+        ):
+            return set()
+        return set(state["done"])
+
+    def save_state(self, done):
+        """Atomically record completed chunks"""
+        state = {
+            "url": self.url,
+            "size": self.size,
+            "validator": self.validator,
+            "chunk_size": self.chunk_size,
+            "done": sorted(done),
+        }
+        with open(self.state_path + ".tmp", "w") as file:
+            file.write(dumps(state))
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def checkpoint(self, fd, done):
+        """Sync written chunks to disk, then record them as completed"""
+        os.fsync(fd)
+        self.save_state(done)
+        self.checkpointed = time.monotonic()
+
+    def _count(self, length):
+        with self._lock:
+            self.received += length
+
+    def fetch(self, index):
+        """
+        Fetch one chunk into memory, retrying with exponential backoff
+
+        :return tuple: chunk index, bytes
+        """
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size)
+        data = bytearray()
+        attempt = 0
+        while True:
+            try:
+                headers = {
+                    "Range": "bytes={}-{}".format(start + len(data), end - 1)
+                }
+                if self.validator:
+                    headers["If-Range"] = self.validator
+                with self.session.get(
+                    self.url,
+                    headers=headers,
+                    stream=True,
+                    timeout=cfg.DOWNLOAD_TIMEOUT,
+                ) as response:
+                    if response.status_code != 206:
+                        raise OSError(
+                            "Expected partial content, got HTTP {}".format(
+                                response.status_code
+                            )
+                        )
+                    for block in response.iter_content(65536):
+                        data += block
+                        self._count(len(block))
+                if len(data) != end - start:
+                    raise OSError(
+                        "Short read: {} of {} bytes".format(
+                            len(data), end - start
+                        )
+                    )
+                return index, data
+            except (OSError, requests.RequestException) as error:
+                attempt += 1
+                if attempt > self.retries:
+                    raise OSError(
+                        "Chunk {i} failed after {n} retries: {e}".format(
+                            i=index, n=self.retries, e=error
+                        )
+                    )
+                time.sleep(min(self.backoff * 2 ** (attempt - 1), 30))
+
+    def report(self, start, done_before):
+        """Print progress and throughput since start"""
+        elapsed = max(time.monotonic() - start, 1e-9)
+        rate = self.received / elapsed
+        done = done_before + self.received
+        eta = (self.size - done) / rate if rate else 0
+        print(
+            "{d:.0f}/{t:.0f} MB, {r:.2f} MB/s, {e:.0f}s left".format(
+                d=done / 1048576,
+                t=self.size / 1048576,
+                r=rate / 1048576,
+                e=eta,
+            ),
+            flush=True,
+        )
+
+    def _chunk_length(self, index):
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def _ordered(self, data):
+        """Consume the next chunk in file order"""
+        self.hasher.update(data)
+
+    def _store(self, fd, done, index, data):
+        """Write a fetched chunk in place, checkpoint now and then"""
+        os.pwrite(fd, data, index * self.chunk_size)
+        done.add(index)
+        if time.monotonic() - self.checkpointed >= cfg.DOWNLOAD_CHECKPOINT:
+            self.checkpoint(fd, done)
+
+    def _advance(self, fd, ready, previous):
+        """Pass completed chunks to _ordered in file order"""
+        while self.hashed < self.chunks():
+            if self.hashed in ready:
+                data = ready.pop(self.hashed)
+            elif self.hashed in previous:
+                # fetched by an earlier run; hashlib state can't be saved
+                data = os.pread(
+                    fd,
+                    self._chunk_length(self.hashed),
+                    self.hashed * self.chunk_size,
+                )
+            else:
+                break
+            self._ordered(data)
+            self.hashed += 1
+
+    def _stream(self, fd):
+        """Fallback for servers without Range support, not resumable"""
+        with self.session.get(
+            self.url, stream=True, timeout=cfg.DOWNLOAD_TIMEOUT
+        ) as response:
+            response.raise_for_status()
+            if fd is not None:
+                os.ftruncate(fd, 0)
+            for block in response.iter_content(1048576):
+                if fd is not None:
+                    os.write(fd, block)
+                self._count(len(block))
+                self._ordered(block)
+
+    def _fetch_missing(self, fd, done, start, done_before):
+        """
+        Fetch missing chunks in parallel while hashing in file order
+
+        At most window chunks are fetched or waiting to be hashed, which
+        bounds memory to window * chunk_size.
+        """
+        previous = set(done)
+        todo = iter([i for i in range(self.chunks()) if i not in done])
+        pending, ready = set(), {}
+        error = None
+        last_report = start
+        self._advance(fd, ready, previous)
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            try:
+                while True:
+                    while error is None and (
+                        len(pending) + len(ready) < self.window
+                    ):
+                        index = next(todo, None)
+                        if index is None:
+                            break
+                        pending.add(pool.submit(self.fetch, index))
+                    if not pending:
+                        break
+                    finished, pending = wait(
+                        pending,
+                        timeout=cfg.DOWNLOAD_REPORT,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    for future in finished:
+                        if future.cancelled():
+                            continue
+                        try:
+                            index, data = future.result()
+                        except OSError as failure:
+                            # keep chunks in flight, drop queued ones
+                            if error is None:
+                                error = failure
+                                for other in pending:
+                                    other.cancel()
+                            continue
+                        self._store(fd, done, index, data)
+                        ready[index] = data
+                    self._advance(fd, ready, previous)
+                    now = time.monotonic()
+                    if now - last_report >= cfg.DOWNLOAD_REPORT:
+                        self.report(start, done_before)
+                        last_report = now
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+        if error is not None:
+            raise error
+
+    def run(self):
+        """
+        Download missing chunks, verify the SHA-256 digest computed while
+        downloading and remove the state file when complete
+
+        :return str: path of the target
+        """
+        start = time.monotonic()
+        ranges = self.probe()
+        fd = os.open(self.target, os.O_RDWR | os.O_CREAT, 0o644)
+        done_before = 0
+        try:
+            if not ranges:
+                print("Server does not support Range requests, no resume")
+                self._stream(fd)
+            else:
+                done = self.load_state()
+                if not done:
+                    os.ftruncate(fd, self.size)
+                else:
+                    print(
+                        "Resuming download, {} of {} chunks done".format(
+                            len(done), self.chunks()
+                        )
+                    )
+                done_before = sum(self._chunk_length(i) for i in done)
+                self.checkpointed = time.monotonic()
+                try:
+                    self._fetch_missing(fd, done, start, done_before)
+                finally:
+                    self.checkpoint(fd, done)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.report(start, done_before)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        self.digest = self.hasher.hexdigest()
+        if self.sha256 and self.digest != self.sha256:
+            raise OSError(
+                "Checksum mismatch, expected {e} got {d}".format(
+                    e=self.sha256, d=self.digest
+                )
+            )
+        return self.target
+
+
+def _check_member(member):
+    """Refuse archive members that could write outside the staging dir"""
+    parts = member.name.replace("\\", "/").split("/")
+    if member.name.startswith("/") or ".." in parts:
+        raise OSError("Unsafe path in archive: " + member.name)
+    if not (member.isfile() or member.isdir()):
+        raise OSError("Unsupported archive member: " + member.name)
+
+
+class Extract(Download):
+    """
+    Stream a tar archive from url through the hasher into directory
+
+    No tarball is written. Members are extracted into a staging directory
+    inside directory while downloading, moved into place when the digest
+    matches and discarded otherwise. Streaming extraction cannot resume,
+    an interrupted run starts over.
+
+    :param url: source url of a tar archive
+    :param directory: directory to extract into
+    :param sha256: expected hex digest of the archive
+    :param throttle: function called before every chunk is extracted,
+        e.g. to wait while the CPU is too hot
+    """
+
+    def __init__(self, url, directory, sha256="", throttle=None, **kwargs):
+        super().__init__(
+            url,
+            os.path.join(str(directory), ".staging"),
+            sha256=sha256,
+            **kwargs
+        )
+        self.directory = str(directory)
+        self.staging = self.target
+        self.throttle = throttle
+        self._pipe = None
+        self._error = None
+
+    def _store(self, fd, done, index, data):
+        """Chunks are only passed on to the extractor in file order"""
+
+    def _ordered(self, data):
+        if self.throttle is not None:
+            self.throttle()
+        super()._ordered(data)
+        self._pipe.write(data)
+
+    def _extract(self, read_fd):
+        """Extract the archive read from the pipe, runs in a thread"""
+        try:
+            with os.fdopen(read_fd, "rb") as stream:
+                with tarfile.open(fileobj=stream, mode="r|") as tar:
+                    for member in tar:
+                        _check_member(member)
+                        tar.extract(member, self.staging)
+                # consume end of archive padding so the writer never blocks
+                while stream.read(1048576):
+                    pass
+        except Exception as error:
+            self._error = error
+
+    def _commit(self):
+        """Move extracted files into place"""
+        for name in os.listdir(self.staging):
+            os.replace(
+                os.path.join(self.staging, name),
+                os.path.join(self.directory, name),
+            )
+        os.rmdir(self.staging)
+
+    def run(self):
+        """
+        Download, verify and extract, removing partial files on failure
+
+        :return str: directory extracted into
+        """
+        start = time.monotonic()
+        ranges = self.probe()
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+        read_fd, write_fd = os.pipe()
+        self._pipe = os.fdopen(write_fd, "wb")
+        extractor = threading.Thread(target=self._extract, args=(read_fd,))
+        extractor.start()
+        try:
+            try:
+                if ranges:
+                    self._fetch_missing(None, set(), start, 0)
+                else:
+                    self._stream(None)
+            except BrokenPipeError:
+                # extractor failed and closed the pipe, reported below
+                pass
+            finally:
+                try:
+                    self._pipe.close()
+                except BrokenPipeError:
+                    pass
+                extractor.join()
+            if self._error is not None:
+                raise OSError("Extraction failed: {}".format(self._error))
+            self.report(start, 0)
+            self.digest = self.hasher.hexdigest()
+            if self.sha256 and self.digest != self.sha256:
+                raise OSError(
+                    "Checksum mismatch, expected {e} got {d}".format(
+                        e=self.sha256, d=self.digest
+                    )
+                )
+            self._commit()
+        except BaseException:
+            print("Discarding partial extraction")
+            shutil.rmtree(self.staging, ignore_errors=True)
+            raise
+        return self.directory
+
+
+def extract(url, directory, sha256="", jobs=cfg.DOWNLOAD_JOBS, throttle=None):
+    """
+    Download a tar archive and extract it into directory on the fly
+
+    :param sha256: expected hex digest, nothing is kept on mismatch
+    :param throttle: function called before every chunk is extracted
+    :return str: directory extracted into
+    """
+    return Extract(
+        url, directory, sha256=sha256, jobs=jobs, throttle=throttle
+    ).run()
+
+
+def download(url, target, sha256="", jobs=cfg.DOWNLOAD_JOBS):
+    """
+    Download url to target, resuming a previous partial download
+
+    The digest computed while downloading is kept next to the target, so
+    seeding it needs no second read of the file.
+
+    :param sha256: expected hex digest, OSError is raised on mismatch
+    :return str: path of the target
+    """
+    from noma.seed import record_digest
+
+    job = Download(url, target, sha256=sha256, jobs=jobs)
+    job.run()
+    record_digest(job.target, job.digest)
+    return job.target
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,262 @@
+"""
+Incremental forwarding history export in a compact columnar format
+
+Every column of lnd's forwarding events is appended to its own typed,
+array-backed binary file (native 64-bit integers, readable with
+numpy.fromfile). A sidecar index.json holds the row count, the export cursor
+and the first row of every day, so aggregations stream through the columns
+in fixed-size chunks and never load the full history into memory.
+"""
+import os
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from json import dumps, loads
+import noma.config as cfg
+from noma.rest import post
+
+# column name, array typecode
+COLUMNS = (
+    ("timestamp", "q"),
+    ("chan_id_in", "Q"),
+    ("chan_id_out", "Q"),
+    ("amt_in_msat", "q"),
+    ("amt_out_msat", "q"),
+    ("fee_msat", "q"),
+)
+TYPECODES = dict(COLUMNS)
+DAY = 86400
+
+
+def _column_path(export_path, column):
+    return os.path.join(str(export_path), column + ".bin")
+
+
+def load_index(export_path=""):
+    """
+    Load sidecar index of an export
+
+    :return dict: rows, cursor timestamp, rows at cursor, first row per day
+    """
+    if not export_path:
+        export_path = cfg.FWD_EXPORT_PATH
+    try:
+        with open(os.path.join(str(export_path), "index.json")) as file:
+            return loads(file.read())
+    except FileNotFoundError:
+        return {
+            "rows": 0,
+            "cursor": 0,
+            "at_cursor": 0,
+            "days": {},
+            "byteorder": sys.byteorder,
+            "columns": [list(column) for column in COLUMNS],
+        }
+
+
+def _write_index(index, export_path):
+    path = os.path.join(str(export_path), "index.json")
+    with open(path + ".tmp", "w") as file:
+        file.write(dumps(index, indent=2, sort_keys=True))
+    os.replace(path + ".tmp", path)
+
+
+def _truncate(index, export_path):
+    """Drop rows appended after the last index write, e.g. after a crash"""
+    for column, typecode in COLUMNS:
+        path = _column_path(export_path, column)
+        size = index["rows"] * array(typecode).itemsize
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+
+def _msat(event, msat_key, sat_key):
+    if event.get(msat_key) not in (None, ""):
+        return int(event[msat_key])
+    return int(event.get(sat_key, 0)) * 1000
+
+
+def _append(index, events, export_path):
+    """Append events to column files and record day offsets"""
+    columns = {column: array(typecode) for column, typecode in COLUMNS}
+    for row, event in enumerate(events, start=index["rows"]):
+        timestamp = int(event["timestamp"])
+        columns["timestamp"].append(timestamp)
+        columns["chan_id_in"].append(int(event["chan_id_in"]))
+        columns["chan_id_out"].append(int(event["chan_id_out"]))
+        columns["amt_in_msat"].append(_msat(event, "amt_in_msat", "amt_in"))
+        columns["amt_out_msat"].append(_msat(event, "amt_out_msat", "amt_out"))
+        columns["fee_msat"].append(_msat(event, "fee_msat", "fee"))
+        day = str(timestamp // DAY * DAY)
+        index["days"].setdefault(day, row)
+    for column, values in columns.items():
+        with open(_column_path(export_path, column), "ab") as file:
+            values.tofile(file)
+    index["rows"] += len(events)
+
+
+def export(export_path="", page_size=cfg.FWD_PAGE_SIZE):
+    """
+    Append forwarding events newer than the cursor to the export
+
+    :param export_path: optional export directory, default FWD_EXPORT_PATH
+    :param page_size: events requested from lnd per page
+    :return int: number of events appended
+    """
+    if not export_path:
+        export_path = cfg.FWD_EXPORT_PATH
+    os.makedirs(str(export_path), exist_ok=True)
+    index = load_index(export_path)
+    _truncate(index, export_path)
+
+    # events at the cursor second may already be exported, skip those
+    start_time = index["cursor"]
+    skip = index["at_cursor"]
+    offset = 0
+    appended = 0
+    end_time = int(time.time()) + 1
+    while True:
+        response = post(
+            "/v1/switch",
+            data=dumps(
+                {
+                    "start_time": str(start_time),
+                    "end_time": str(end_time),
+                    "index_offset": offset,
+                    "num_max_events": page_size,
+                }
+            ),
+        )
+        response.raise_for_status()
+        data = response.json()
+        events = data.get("forwarding_events", [])
+        if not events:
+            break
+        offset = int(data.get("last_offset_index", offset + len(events)))
+
+        new = []
+        for event in events:
+            timestamp = int(event["timestamp"])
+            if timestamp == start_time and skip:
+                skip -= 1
+                continue
+            new.append(event)
+            if timestamp == index["cursor"]:
+                index["at_cursor"] += 1
+            else:
+                index["cursor"], index["at_cursor"] = timestamp, 1
+        _append(index, new, export_path)
+        _write_index(index, export_path)
+        appended += len(new)
+        if len(events) < page_size:
+            break
+    print("Exported {} new forwarding events".format(appended))
+    return appended
+
+
+def iter_columns(
+    columns,
+    since=None,
+    until=None,
+    export_path="",
+    chunk_rows=cfg.FWD_CHUNK_ROWS,
+):
+    """
+    Stream columns in chunks of at most chunk_rows rows
+
+    :param columns: column names to read
+    :param since: first timestamp to include, epoch seconds
+    :param until: timestamp to stop before, epoch seconds
+    :return: generator of dicts of column name to array
+    """
+    if not export_path:
+        export_path = cfg.FWD_EXPORT_PATH
+    index = load_index(export_path)
+    if not index["rows"]:
+        return
+    start = 0
+    if since is not None:
+        # jump to the first row of the day containing since
+        days = sorted((int(day), row) for day, row in index["days"].items())
+        for day, row in days:
+            if day + DAY > since:
+                start = row
+                break
+        else:
+            start = index["rows"]
+    names = list(columns)
+    if "timestamp" not in names:
+        names.append("timestamp")
+    files = {
+        name: open(_column_path(export_path, name), "rb") for name in names
+    }
+    try:
+        for name, file in files.items():
+            file.seek(start * array(TYPECODES[name]).itemsize)
+        row = start
+        while row < index["rows"]:
+            count = min(chunk_rows, index["rows"] - row)
+            chunk = {}
+            for name, file in files.items():
+                chunk[name] = array(TYPECODES[name])
+                chunk[name].fromfile(file, count)
+            row += count
+            timestamps = chunk["timestamp"]
+            if (since is not None and timestamps[0] < since) or (
+                until is not None and timestamps[-1] >= until
+            ):
+                keep = [
+                    i
+                    for i, timestamp in enumerate(timestamps)
+                    if (since is None or timestamp >= since)
+                    and (until is None or timestamp < until)
+                ]
+                chunk = {
+                    name: array(TYPECODES[name], (values[i] for i in keep))
+                    for name, values in chunk.items()
+                }
+            if chunk["timestamp"]:
+                yield {name: chunk[name] for name in columns}
+            if until is not None and timestamps[-1] >= until:
+                break
+    finally:
+        for file in files.values():
+            file.close()
+
+
+def fees_per_channel(since=None, until=None, export_path=""):
+    """Return dict of outgoing channel id to earned fees in msat"""
+    fees = {}
+    for chunk in iter_columns(
+        ("chan_id_out", "fee_msat"), since, until, export_path
+    ):
+        for channel, fee in zip(chunk["chan_id_out"], chunk["fee_msat"]):
+            fees[channel] = fees.get(channel, 0) + fee
+    return fees
+
+
+def fees_per_day(since=None, until=None, export_path=""):
+    """Return dict of YYYY-MM-DD to earned fees in msat"""
+    fees = {}
+    for chunk in iter_columns(
+        ("timestamp", "fee_msat"), since, until, export_path
+    ):
+        for timestamp, fee in zip(chunk["timestamp"], chunk["fee_msat"]):
+            day = datetime.fromtimestamp(
+                timestamp // DAY * DAY, timezone.utc
+            ).strftime("%Y-%m-%d")
+            fees[day] = fees.get(day, 0) + fee
+    return fees
+
+
+def print_fees(fees, label):
+    """Print fees_per_channel() or fees_per_day() as a table"""
+    print("{:<22}{:>16}".format(label, "fee msat"))
+    for key in sorted(fees):
+        print("{:<22}{:>16}".format(key, fees[key]))
+    print("{:<22}{:>16}".format("total", sum(fees.values())))
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
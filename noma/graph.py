@@ -0,0 +1,324 @@
+"""
+Memory-bounded channel graph snapshots
+
+describegraph responses are hundreds of MB of JSON. Instead of decoding the
+whole response, the body is streamed and nodes and edges are parsed one at a
+time, then written in batches to a SQLite snapshot. Two snapshots are
+diffed inside SQLite, so neither has to be loaded into memory.
+"""
+import codecs
+import json
+import os
+import sqlite3
+import time
+import noma.config as cfg
+from noma.rest import get
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    pub_key TEXT PRIMARY KEY,
+    alias TEXT,
+    color TEXT,
+    last_update INTEGER,
+    addresses TEXT
+);
+CREATE TABLE IF NOT EXISTS edges (
+    channel_id TEXT PRIMARY KEY,
+    chan_point TEXT,
+    node1_pub TEXT,
+    node2_pub TEXT,
+    capacity INTEGER,
+    last_update INTEGER,
+    node1_policy TEXT,
+    node2_policy TEXT
+);
+CREATE INDEX IF NOT EXISTS edges_node1 ON edges (node1_pub);
+CREATE INDEX IF NOT EXISTS edges_node2 ON edges (node2_pub);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_WHITESPACE = " \t\n\r"
+
+
+class StreamParser:
+    """
+    Incremental parser for a JSON object whose values are (large) arrays
+
+    Yields (key, item) for every item of every top-level array and
+    (key, value) for other top-level values. Only the item currently being
+    decoded is held in memory.
+
+    :param chunks: iterable of bytes
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self.max_buffer = 0
+
+    def _fill(self):
+        """Read next chunk, dropping consumed text; False at end of input"""
+        if self._eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._eof = True
+            chunk = b""
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(
+            chunk, final=self._eof
+        )
+        self._pos = 0
+        self.max_buffer = max(self.max_buffer, len(self._buffer))
+        return True
+
+    def _peek(self):
+        """Return next non-whitespace character without consuming it"""
+        while True:
+            while (
+                self._pos < len(self._buffer)
+                and self._buffer[self._pos] in _WHITESPACE
+            ):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(
+                "Expected {!r} at {!r}".format(
+                    char, self._buffer[self._pos:self._pos + 20]
+                )
+            )
+        self._pos += 1
+
+    def _value(self):
+        """Decode one complete JSON value, reading more input as needed"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in next chunk
+            if end == len(self._buffer) and not self._eof:
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if self._peek() == "[":
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield key, self._value()
+                        if self._peek() == ",":
+                            self._pos += 1
+                            continue
+                        self._expect("]")
+                        break
+            else:
+                yield key, self._value()
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+def _node_row(node):
+    return (
+        node["pub_key"],
+        node.get("alias", ""),
+        node.get("color", ""),
+        int(node.get("last_update", 0)),
+        json.dumps(node.get("addresses", [])),
+    )
+
+
+def _edge_row(edge):
+    return (
+        str(edge["channel_id"]),
+        edge.get("chan_point", ""),
+        edge.get("node1_pub", ""),
+        edge.get("node2_pub", ""),
+        int(edge.get("capacity", 0)),
+        int(edge.get("last_update", 0)),
+        json.dumps(edge.get("node1_policy"), sort_keys=True),
+        json.dumps(edge.get("node2_policy"), sort_keys=True),
+    )
+
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes"""
+    import resource
+    import sys
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def store(chunks, db_path, batch_size=cfg.GRAPH_BATCH_SIZE):
+    """
+    Parse describegraph JSON chunks into a SQLite snapshot
+
+    :param chunks: iterable of bytes of the describegraph response
+    :param db_path: snapshot file to create
+    :param batch_size: rows per executemany batch
+    :return dict: number of nodes and edges, largest parser buffer
+    """
+    db = sqlite3.connect(str(db_path))
+    db.executescript(SCHEMA)
+    parser = StreamParser(chunks)
+    nodes, edges = [], []
+    counts = {"nodes": 0, "edges": 0}
+
+    def flush():
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?)", nodes
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO edges VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                edges,
+            )
+        del nodes[:]
+        del edges[:]
+
+    try:
+        for key, item in parser:
+            if key == "nodes":
+                nodes.append(_node_row(item))
+                counts["nodes"] += 1
+            elif key == "edges":
+                edges.append(_edge_row(item))
+                counts["edges"] += 1
+            if len(nodes) + len(edges) >= batch_size:
+                flush()
+        flush()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('time', ?)",
+                (str(int(time.time())),),
+            )
+    finally:
+        db.close()
+    counts["max_buffer"] = parser.max_buffer
+    return counts
+
+
+def snapshot(snapshot_path=""):
+    """
+    Stream describegraph from lnd into a new SQLite snapshot
+
+    :param snapshot_path: optional snapshot file, default a timestamped file
+    in GRAPH_PATH
+    :return str: path of the snapshot
+    """
+    if not snapshot_path:
+        os.makedirs(str(cfg.GRAPH_PATH), exist_ok=True)
+        snapshot_path = os.path.join(
+            str(cfg.GRAPH_PATH),
+            time.strftime("graph-%Y%m%dT%H%M%S.sqlite", time.gmtime()),
+        )
+    start = time.monotonic()
+    rss_before = _peak_rss()
+    response = get(
+        "/v1/graph", stream=True, timeout=(cfg.REST_TIMEOUT[0], 300)
+    )
+    response.raise_for_status()
+    try:
+        counts = store(
+            response.iter_content(chunk_size=cfg.GRAPH_CHUNK_SIZE),
+            snapshot_path,
+        )
+    finally:
+        response.close()
+    print(
+        "Stored {n} nodes and {e} edges in {p} ({s:.1f}s)".format(
+            n=counts["nodes"],
+            e=counts["edges"],
+            p=snapshot_path,
+            s=time.monotonic() - start,
+        )
+    )
+    print(
+        "Peak memory: {m:.1f} MB (before snapshot {b:.1f} MB), "
+        "largest parser buffer {k:.0f} kB".format(
+            m=_peak_rss() / 1048576,
+            b=rss_before / 1048576,
+            k=counts["max_buffer"] / 1024,
+        )
+    )
+    return snapshot_path
+
+
+DIFF_QUERIES = {
+    "nodes added": "SELECT COUNT(*) FROM new.nodes WHERE pub_key NOT IN "
+    "(SELECT pub_key FROM old.nodes)",
+    "nodes removed": "SELECT COUNT(*) FROM old.nodes WHERE pub_key NOT IN "
+    "(SELECT pub_key FROM new.nodes)",
+    "nodes updated": "SELECT COUNT(*) FROM new.nodes n JOIN old.nodes o "
+    "USING (pub_key) WHERE n.alias IS NOT o.alias OR n.color IS NOT o.color "
+    "OR n.addresses IS NOT o.addresses",
+    "edges added": "SELECT COUNT(*) FROM new.edges WHERE channel_id NOT IN "
+    "(SELECT channel_id FROM old.edges)",
+    "edges removed": "SELECT COUNT(*) FROM old.edges WHERE channel_id NOT IN "
+    "(SELECT channel_id FROM new.edges)",
+    "policies changed": "SELECT COUNT(*) FROM new.edges n JOIN old.edges o "
+    "USING (channel_id) WHERE n.node1_policy IS NOT o.node1_policy "
+    "OR n.node2_policy IS NOT o.node2_policy",
+    "capacity added": "SELECT COALESCE(SUM(capacity), 0) FROM new.edges "
+    "WHERE channel_id NOT IN (SELECT channel_id FROM old.edges)",
+    "capacity removed": "SELECT COALESCE(SUM(capacity), 0) FROM old.edges "
+    "WHERE channel_id NOT IN (SELECT channel_id FROM new.edges)",
+}
+
+
+def diff(old_path, new_path):
+    """
+    Compare two snapshots inside SQLite
+
+    :return dict: counts of added, removed and changed nodes and edges
+    """
+    for path in (old_path, new_path):
+        if not os.path.isfile(str(path)):
+            raise FileNotFoundError(path)
+    db = sqlite3.connect(":memory:")
+    try:
+        db.execute("ATTACH DATABASE ? AS old", (str(old_path),))
+        db.execute("ATTACH DATABASE ? AS new", (str(new_path),))
+        return {
+            name: db.execute(query).fetchone()[0]
+            for name, query in DIFF_QUERIES.items()
+        }
+    finally:
+        db.close()
+
+
+def print_diff(changes):
+    """Print diff() result"""
+    for name, value in changes.items():
+        print("{:<20}{:>16}".format(name, value))
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
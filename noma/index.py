@@ -0,0 +1,334 @@
+"""
+Incremental SQLite index of lnd invoices and payments
+
+Invoices and payments are paged from lnd's REST interface with
+index_offset and stored in an indexed SQLite database on the important
+storage. Every run resumes from the last stored index, so lookups by
+amount, memo, date and state never need to download the full history.
+"""
+import sqlite3
+import time
+from datetime import datetime, timezone
+import noma.config as cfg
+from noma.rest import get
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    add_index INTEGER PRIMARY KEY,
+    settle_index INTEGER,
+    r_hash TEXT,
+    memo TEXT,
+    value_msat INTEGER,
+    amt_paid_msat INTEGER,
+    state TEXT,
+    creation_date INTEGER,
+    settle_date INTEGER,
+    payment_request TEXT,
+    expiry INTEGER
+);
+CREATE INDEX IF NOT EXISTS invoices_value ON invoices (value_msat);
+CREATE INDEX IF NOT EXISTS invoices_created ON invoices (creation_date);
+CREATE INDEX IF NOT EXISTS invoices_state ON invoices (state, settle_date);
+CREATE INDEX IF NOT EXISTS invoices_memo ON invoices (memo);
+CREATE TABLE IF NOT EXISTS payments (
+    payment_hash TEXT PRIMARY KEY,
+    payment_index INTEGER,
+    value_msat INTEGER,
+    fee_msat INTEGER,
+    status TEXT,
+    creation_date INTEGER,
+    payment_request TEXT
+);
+CREATE INDEX IF NOT EXISTS payments_index ON payments (payment_index);
+CREATE INDEX IF NOT EXISTS payments_value ON payments (value_msat);
+CREATE INDEX IF NOT EXISTS payments_created ON payments (creation_date);
+CREATE INDEX IF NOT EXISTS payments_status ON payments (status);
+"""
+# seconds lnd keeps an invoice payable when it was created without expiry
+DEFAULT_EXPIRY = 3600
+
+
+def connect(db_path=""):
+    """
+    Open index database, creating the schema if necessary
+
+    :param db_path: optional path to database, default INDEX_DB
+    :return: sqlite3.Connection
+    """
+    if not db_path:
+        db_path = cfg.INDEX_DB
+    db = sqlite3.connect(str(db_path))
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def _int(value):
+    return int(value) if value not in (None, "") else 0
+
+
+def _msat(item, sat_key, msat_key):
+    """Prefer the msat field, fall back to sat for older lnd versions"""
+    if item.get(msat_key) not in (None, ""):
+        return int(item[msat_key])
+    return _int(item.get(sat_key)) * 1000
+
+
+def _invoice_row(invoice):
+    state = invoice.get("state")
+    if not state:
+        state = "SETTLED" if invoice.get("settled") else "OPEN"
+    return (
+        _int(invoice.get("add_index")),
+        _int(invoice.get("settle_index")),
+        invoice.get("r_hash", ""),
+        invoice.get("memo", ""),
+        _msat(invoice, "value", "value_msat"),
+        _msat(invoice, "amt_paid_sat", "amt_paid_msat"),
+        state,
+        _int(invoice.get("creation_date")),
+        _int(invoice.get("settle_date")),
+        invoice.get("payment_request", ""),
+        _int(invoice.get("expiry")) or DEFAULT_EXPIRY,
+    )
+
+
+def _payment_row(payment):
+    return (
+        payment.get("payment_hash", ""),
+        _int(payment.get("payment_index")),
+        _msat(payment, "value_sat", "value_msat"),
+        _msat(payment, "fee_sat", "fee_msat"),
+        payment.get("status", "SUCCEEDED"),
+        _int(payment.get("creation_date")),
+        payment.get("payment_request", ""),
+    )
+
+
+def _invoice_offset(db, now=None):
+    """
+    Resume point for invoices
+
+    Start below the oldest invoice that could still change, i.e. one that
+    was accepted or open and unexpired when last indexed, so settlements
+    and cancellations are picked up too. lnd keeps expired invoices open
+    forever, they must not hold the resume point back.
+    """
+    if now is None:
+        now = time.time()
+    row = db.execute(
+        "SELECT MIN(add_index) FROM invoices WHERE state = 'ACCEPTED' "
+        "OR (state = 'OPEN' AND creation_date + COALESCE(expiry, ?) > ?)",
+        (DEFAULT_EXPIRY, now),
+    ).fetchone()
+    if row[0]:
+        return row[0] - 1
+    row = db.execute("SELECT MAX(add_index) FROM invoices").fetchone()
+    return row[0] or 0
+
+
+def _payment_offset(db):
+    """
+    Resume point for payments
+
+    Start below the oldest payment that was neither succeeded nor failed
+    when last indexed, so its final status and fee are picked up too.
+    """
+    row = db.execute(
+        "SELECT MIN(payment_index) FROM payments "
+        "WHERE status NOT IN ('SUCCEEDED', 'FAILED')"
+    ).fetchone()
+    if row[0]:
+        return row[0] - 1
+    row = db.execute("SELECT MAX(payment_index) FROM payments").fetchone()
+    return row[0] or 0
+
+
+def index_invoices(db, page_size=cfg.INDEX_PAGE_SIZE):
+    """
+    Page new and still open invoices from lnd into the index
+
+    :return int: number of invoices stored
+    """
+    offset = _invoice_offset(db)
+    stored = 0
+    while True:
+        response = get(
+            "/v1/invoices",
+            params={"index_offset": offset, "num_max_invoices": page_size},
+        )
+        response.raise_for_status()
+        data = response.json()
+        invoices = data.get("invoices", [])
+        if not invoices:
+            break
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO invoices VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [_invoice_row(invoice) for invoice in invoices],
+            )
+        stored += len(invoices)
+        last = _int(data.get("last_index_offset"))
+        if last <= offset or len(invoices) < page_size:
+            break
+        offset = last
+    return stored
+
+
+def index_payments(db, page_size=cfg.INDEX_PAGE_SIZE):
+    """
+    Page new and still pending payments from lnd into the index
+
+    lnd versions without payment pagination return every payment at once,
+    which is still stored correctly, just not incrementally.
+
+    :return int: number of payments stored
+    """
+    offset = _payment_offset(db)
+    stored = 0
+    while True:
+        response = get(
+            "/v1/payments",
+            params={
+                "index_offset": offset,
+                "max_payments": page_size,
+                "include_incomplete": "true",
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+        payments = data.get("payments", [])
+        if not payments:
+            break
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO payments VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [_payment_row(payment) for payment in payments],
+            )
+        stored += len(payments)
+        last = _int(data.get("last_index_offset"))
+        if last <= offset or len(payments) < page_size:
+            break
+        offset = last
+    return stored
+
+
+def update(db_path=""):
+    """
+    Bring the index up to date with lnd
+
+    :param db_path: optional path to database
+    :return tuple: number of invoices and payments stored
+    """
+    start = time.monotonic()
+    db = connect(db_path)
+    try:
+        invoices = index_invoices(db)
+        payments = index_payments(db)
+    finally:
+        db.close()
+    print(
+        "Indexed {i} invoices and {p} payments in {s:.1f}s".format(
+            i=invoices, p=payments, s=time.monotonic() - start
+        )
+    )
+    return invoices, payments
+
+
+def timestamp(date):
+    """Convert YYYY-MM-DD[ HH:MM[:SS]] or epoch seconds to epoch seconds"""
+    if isinstance(date, (int, float)) or str(date).isdigit():
+        return int(date)
+    date = date.replace("T", " ")
+    for form in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            parsed = datetime.strptime(date, form)
+            break
+        except ValueError:
+            pass
+    else:
+        raise ValueError("Expected YYYY-MM-DD[ HH:MM:SS], got " + date)
+    return int(parsed.replace(tzinfo=timezone.utc).timestamp())
+
+
+def search(
+    table,
+    memo=None,
+    min_sat=None,
+    max_sat=None,
+    since=None,
+    until=None,
+    state=None,
+    limit=100,
+    db_path="",
+):
+    """
+    Query indexed invoices or payments
+
+    :param table: invoices or payments
+    :param memo: substring of invoice memo
+    :param min_sat: minimum amount in satoshis
+    :param max_sat: maximum amount in satoshis
+    :param since: created on or after, YYYY-MM-DD or epoch seconds
+    :param until: created before, YYYY-MM-DD or epoch seconds
+    :param state: invoice state (OPEN, SETTLED, ...) or payment status
+    :param limit: maximum number of rows
+    :return list: rows as dicts, newest first
+    """
+    if table not in ("invoices", "payments"):
+        raise ValueError("Unknown table: " + str(table))
+    clauses, params = [], []
+    if memo is not None and table == "invoices":
+        clauses.append("memo LIKE ?")
+        params.append("%" + memo + "%")
+    if min_sat is not None:
+        clauses.append("value_msat >= ?")
+        params.append(int(min_sat) * 1000)
+    if max_sat is not None:
+        clauses.append("value_msat <= ?")
+        params.append(int(max_sat) * 1000)
+    if since is not None:
+        clauses.append("creation_date >= ?")
+        params.append(timestamp(since))
+    if until is not None:
+        clauses.append("creation_date < ?")
+        params.append(timestamp(until))
+    if state is not None:
+        clauses.append(("state" if table == "invoices" else "status") + " = ?")
+        params.append(state.upper())
+    query = "SELECT * FROM " + table
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY creation_date DESC LIMIT ?"
+    params.append(int(limit))
+
+    db = connect(db_path)
+    try:
+        return [dict(row) for row in db.execute(query, params)]
+    finally:
+        db.close()
+
+
+def print_rows(rows):
+    """Print search() results as a table"""
+    print(
+        "{:<20}{:>14}  {:<10}{}".format("created", "sat", "state", "memo/hash")
+    )
+    for row in rows:
+        created = datetime.fromtimestamp(
+            row["creation_date"], timezone.utc
+        ).strftime("%Y-%m-%d %H:%M:%S")
+        print(
+            "{:<20}{:>14}  {:<10}{}".format(
+                created,
+                row["value_msat"] // 1000,
+                row.get("state", row.get("status")),
+                row.get("memo") or row.get("r_hash") or row["payment_hash"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -73,7 +73,7 @@ def apk_update():
 def install_apk_deps():
     """Install misc dependencies"""
     print("Install dependencies")
-    call(["apk", "add", "curl", "jq", "autossh", "axel"])
+    call(["apk", "add", "curl", "jq", "autossh", "avahi-tools"])
 
 
 def mnt_ext4(device, path):
@@ -223,7 +223,10 @@ def create_swap():
     swap_path = volatile_path / "swap"
 
     def create_file():
-        dd = run(
+        from noma import scheduler
+
+        dd = scheduler.run(
+            "swap",
             [
                 "dd",
                 "if=/dev/zero",
@@ -235,10 +238,10 @@ def create_swap():
             stderr=STDOUT,
         )
 
-        if dd.returncode != 0:
+        if dd["returncode"] != 0:
             # dd has non-zero exit code
             raise OSError(
-                "Warning: dd cannot create swap file \n" + str(dd.stdout)
+                "Warning: dd cannot create swap file \n" + str(dd["output"])
             )
         return True
 
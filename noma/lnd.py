@@ -2,12 +2,14 @@
 LND related functionality
 """
 import pathlib
-from subprocess import call, run
+import time
+from subprocess import call
 from os import path
-from json import dumps
+from json import dumps, loads
 import base64
-from requests import get, post
 import noma.config as cfg
+from noma import conf
+from noma.rest import get, post
 
 
 def check_wallet():
@@ -89,9 +91,7 @@ def autounlock():
     password_bytes = str(password_str).encode("utf-8")
     data = {"wallet_password": base64.b64encode(password_bytes).decode()}
     try:
-        response = post(
-            cfg.URL_UNLOCKWALLET, verify=cfg.TLS_CERT_PATH, data=dumps(data)
-        )
+        response = post(cfg.URL_UNLOCKWALLET, data=dumps(data))
     except Exception:
         # Silence connection errors when lnd is not running
         pass
@@ -104,6 +104,135 @@ def autounlock():
             pass
 
 
+def _rest_ready(timeout=0.5):
+    """Return True if lnd's REST port accepts connections"""
+    import socket
+    from urllib.parse import urlparse
+
+    url = urlparse(cfg.URL_REST)
+    try:
+        socket.create_connection((url.hostname, url.port), timeout).close()
+    except OSError:
+        return False
+    return True
+
+
+def wait_for_rest(timeout=cfg.UNLOCK_TIMEOUT):
+    """
+    Poll lnd's REST port with an escalating interval
+
+    :param timeout: seconds to wait at most
+    :return bool: REST port is answering
+    """
+    deadline = time.monotonic() + timeout
+    interval = cfg.UNLOCK_POLL_MIN
+    while not _rest_ready():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, cfg.UNLOCK_POLL_MAX)
+    return True
+
+
+def _unlock_status(response):
+    """
+    Classify unlockwallet response
+
+    :return str: unlocked, already unlocked, failed or retry
+    """
+    if response.status_code == 200:
+        return "unlocked"
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    error = str(body.get("error", response.text)).lower()
+    # The WalletUnlocker service is gone once the wallet is unlocked
+    if (
+        response.status_code == 404
+        or body.get("code") == 12
+        or "unknown service" in error
+        or "already unlocked" in error
+    ):
+        return "already unlocked"
+    if "invalid passphrase" in error or "wallet not found" in error:
+        return "failed"
+    return "retry"
+
+
+def _container_started_at(node="lnd"):
+    """Return start time of compose container as epoch seconds, or None"""
+    try:
+        from noma import containers
+
+        return containers.state().started_at(containers.compose_name(node))
+    except Exception as error:
+        print(error.__class__.__name__, ":", error)
+        return None
+
+
+def unlock(timeout=cfg.UNLOCK_TIMEOUT):
+    """
+    Unlock lnd as soon as its REST port answers
+
+    Probes the REST port with an escalating interval, retries while lnd is
+    still starting up and detects an already unlocked wallet. The time from
+    container start to unlocked wallet is appended to UNLOCK_LOG.
+
+    :param timeout: seconds to wait for lnd at most
+    :return str: unlocked, already unlocked, failed or timeout
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    password_str = open(str(cfg.PASSWORD_FILE_PATH), "r").read().rstrip()
+    password_bytes = str(password_str).encode("utf-8")
+    data = {"wallet_password": base64.b64encode(password_bytes).decode()}
+
+    status = "timeout"
+    interval = cfg.UNLOCK_POLL_MIN
+    while time.monotonic() < deadline:
+        if not wait_for_rest(deadline - time.monotonic()):
+            break
+        try:
+            status = _unlock_status(
+                post(cfg.URL_UNLOCKWALLET, data=dumps(data))
+            )
+        except Exception as error:
+            print(error.__class__.__name__, ":", error)
+            status = "retry"
+        if status != "retry":
+            break
+        status = "timeout"
+        time.sleep(min(interval, max(0, deadline - time.monotonic())))
+        interval = min(interval * 2, cfg.UNLOCK_POLL_MAX)
+
+    now = time.time()
+    entry = {
+        "time": int(now),
+        "status": status,
+        "wait_seconds": round(time.monotonic() - start, 3),
+    }
+    if status == "unlocked":
+        started_at = _container_started_at("lnd")
+        if started_at is not None:
+            entry["boot_seconds"] = round(now - started_at, 3)
+    try:
+        with open(str(cfg.UNLOCK_LOG), "a") as file:
+            file.write(dumps(entry) + "\n")
+    except OSError as error:
+        print(error.__class__.__name__, ":", error)
+
+    print("lnd wallet: " + status)
+    if "boot_seconds" in entry:
+        print(
+            "{:.1f}s from container start to unlocked wallet".format(
+                entry["boot_seconds"]
+            )
+        )
+    return status
+
+
 def get_kv(key, section="", config_path=""):
     """
     Parse key-value config files and print out values
@@ -113,24 +242,16 @@ def get_kv(key, section="", config_path=""):
     :param section: [section] of the kv pair
     :return: value of key
     """
-    from configparser import ConfigParser
-
     if not config_path:
         config_path = cfg.LND_CONF
     if not section:
         section = "Application Options"
-
-    parser = ConfigParser(strict=False)
-    with open(config_path) as lines:
-        parser.read_file(lines)
-        return parser.get(section, key)
+    return conf.load(config_path).get(section, key)
 
 
 def set_kv(key, value, section="", config_path=""):
     """
-    Parse key-value config files and write them out with a key-value change
-
-    Note: comments are lost!
+    Set key to value in config file, keeping comments and ordering
 
     :param key: left part of key value pair
     :param value: right part of key value pair
@@ -139,19 +260,24 @@ def set_kv(key, value, section="", config_path=""):
 
     :return:
     """
-    from configparser import ConfigParser
+    set_kvs({key: value}, section, config_path)
 
+
+def set_kvs(pairs, section="", config_path=""):
+    """
+    Set several keys in one atomic write of the config file
+
+    :param pairs: dict of keys and values
+    :param section: optional name of section to set in
+    :param config_path: path to file
+    """
     if not section:
         section = "Application Options"
     if not config_path:
         config_path = cfg.LND_CONF
-    parser = ConfigParser(strict=False)
-    with open(config_path) as lines:
-        parser.read_file(lines)
-        parser.set(section, key, value)
-        with open(config_path, "w") as file:
-            parser.write(file, space_around_delimiters=False)
-            file.close()
+    with conf.edit(config_path) as doc:
+        for key, value in pairs.items():
+            doc.set(section, key, value)
 
 
 def setup_tor(version=""):
@@ -162,7 +288,9 @@ def setup_tor(version=""):
     try:
         print("Adding externalip directive to lnd for tor")
         with open(hostname_path, "r") as hostname:
-            set_kv("externalip", hostname.read(), "Application Options")
+            set_kv(
+                "externalip", hostname.read().strip(), "Application Options"
+            )
     except Exception as error:
         print(error.__class__.__name__, ":", error)
 
@@ -174,29 +302,155 @@ def set_bitcoind(password, user="", lnd_config=""):
     if not lnd_config:
         lnd_config = cfg.LND_CONF
     if pathlib.Path(lnd_config).is_file():
-        set_kv("bitcoind.rpcuser", user, "Bitcoind", lnd_config)
-        set_kv("bitcoind.rpcpass", password, "Bitcoind", lnd_config)
+        set_kvs(
+            {"bitcoind.rpcuser": user, "bitcoind.rpcpass": password},
+            "Bitcoind",
+            lnd_config,
+        )
 
 
-def autoconnect(list_path=""):
-    """Auto-connect to a list of nodes in lnd/autoconnect.txt"""
-    print("Connecting to:")
+def autoconnect(list_path="", parallel=False, jobs=cfg.AUTOCONNECT_JOBS):
+    """
+    Auto-connect to a list of nodes in lnd/autoconnect.txt
+
+    :param list_path: file with one pubkey@host[:port] address per line
+    :param parallel: connect concurrently over REST instead of lncli
+    :param jobs: number of concurrent connection attempts in parallel mode
+    :return list: connect results in parallel mode
+    """
     if not list_path:
         list_path = pathlib.Path(cfg.LND_PATH / "autoconnect.txt")
 
     with open(list_path) as address_list:
-        for address in address_list:
-            print(address.strip())
-            call(
-                [
-                    "docker",
-                    "exec",
-                    cfg.LND_MODE + "_lnd_1",
-                    "lncli",
-                    "connect",
-                    address.strip(),
-                ]
+        addresses = [line.strip() for line in address_list if line.strip()]
+
+    if parallel:
+        results = connect_peers(addresses, jobs=jobs)
+        print_connect_summary(results)
+        return results
+
+    print("Connecting to:")
+    for address in addresses:
+        print(address)
+        call(
+            [
+                "docker",
+                "exec",
+                cfg.LND_MODE + "_lnd_1",
+                "lncli",
+                "connect",
+                address,
+            ]
+        )
+
+
+def connected_peers():
+    """Return set of pubkeys lnd is currently connected to"""
+    response = get("/v1/peers")
+    response.raise_for_status()
+    return {peer["pub_key"] for peer in response.json().get("peers", [])}
+
+
+def connect_peer(address, timeout=cfg.AUTOCONNECT_TIMEOUT):
+    """
+    Connect lnd to a single peer over REST
+
+    :param address: pubkey@host[:port]
+    :param timeout: seconds to wait for lnd to finish connecting
+    :return dict: address, status (ok, connected, failed), latency, error
+    """
+    result = {"address": address, "status": "failed", "error": ""}
+    start = time.monotonic()
+    try:
+        pubkey, host = address.split("@", 1)
+        response = post(
+            "/v1/peers",
+            data=dumps({"addr": {"pubkey": pubkey, "host": host}}),
+            timeout=(cfg.REST_TIMEOUT[0], timeout),
+        )
+        if response.status_code == 200:
+            result["status"] = "ok"
+        else:
+            error = response.json().get("error", response.text)
+            if "already connected" in error:
+                result["status"] = "connected"
+            else:
+                result["error"] = error
+    except Exception as error:
+        result["error"] = "{}: {}".format(error.__class__.__name__, error)
+    result["latency"] = time.monotonic() - start
+    return result
+
+
+def connect_peers(
+    addresses, jobs=cfg.AUTOCONNECT_JOBS, timeout=cfg.AUTOCONNECT_TIMEOUT
+):
+    """
+    Connect lnd to many peers concurrently, skipping connected peers
+
+    :param addresses: iterable of pubkey@host[:port] addresses
+    :param jobs: maximum number of concurrent connection attempts
+    :param timeout: per-peer timeout in seconds
+    :return list: connect_peer() results, in order of addresses
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        connected = connected_peers()
+    except Exception as error:
+        print("Cannot list peers:", error.__class__.__name__, ":", error)
+        connected = set()
+
+    pending = []
+    results = {}
+    for address in addresses:
+        if address in results or address in pending:
+            continue
+        if address.split("@", 1)[0] in connected:
+            results[address] = {
+                "address": address,
+                "status": "connected",
+                "latency": 0.0,
+                "error": "",
+            }
+        else:
+            pending.append(address)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [
+                executor.submit(connect_peer, address, timeout)
+                for address in pending
+            ]
+            for future in futures:
+                result = future.result()
+                results[result["address"]] = result
+
+    return [results[address] for address in addresses if address in results]
+
+
+def print_connect_summary(results):
+    """Print table of connect_peers() results"""
+    print("{:<10}{:>9}  {}".format("status", "latency", "address"))
+    for result in results:
+        print(
+            "{:<10}{:>8.3f}s  {}".format(
+                result["status"], result["latency"], result["address"]
             )
+        )
+        if result["error"]:
+            print("{:<21}{}".format("", result["error"]))
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(
+        "{ok} connected, {connected} already connected, "
+        "{failed} failed".format(
+            ok=counts.get("ok", 0),
+            connected=counts.get("connected", 0),
+            failed=counts.get("failed", 0),
+        )
+    )
 
 
 def check():
@@ -216,29 +470,181 @@ def check():
     return False
 
 
-def backup():
-    """Export and backup latest channel.db from lnd via ssh"""
-    # secure remote backups via scp
+def backup(force=False, watch=False):
+    """
+    Backup latest channel.backup from lnd via ssh, if it changed
+
+    :param force: upload even if unchanged
+    :param watch: keep running and ship every new version of channel.backup
+    """
+    from noma import backup as channel_backup
+
+    if watch:
+        return channel_backup.watch()
     if cfg.CHANNEL_BACKUP.is_file():
-        # scp options:
-        # -B for non-interactive batch mode
-        # -p to preserve modification & access time, modes
-        complete = run(["scp",
-                        "-B",
-                        "-i {}".format(cfg.SSH_IDENTITY),
-                        "-p",
-                        "-P {}".format(cfg.SSH_PORT),
-                        "{}".format(cfg.CHANNEL_BACKUP),
-                        "{}".format(cfg.SSH_TARGET)])
-        return complete.returncode
+        return channel_backup.ship(force=force)
     print("Error: channel.backup not found")
     return exit(1)
 
 
-def savepeers():
-    """Save list of peers to file on disk for reconnecting"""
-    # TODO: export list of peers to text file on disk
-    print("Not implemented yet")
+def load_peers(peers_path=""):
+    """
+    Load saved peers from PEERS_FILE
+
+    :param peers_path: optional path to peers file
+    :return dict: pubkey -> host, last_seen, ping, latency, channel
+    """
+    if not peers_path:
+        peers_path = cfg.PEERS_FILE
+    try:
+        with open(str(peers_path)) as file:
+            return loads(file.read())
+    except FileNotFoundError:
+        return {}
+
+
+def _write_peers(peers, peers_path):
+    """Atomically replace peers file"""
+    from os import replace
+
+    temp_path = str(peers_path) + ".tmp"
+    with open(temp_path, "w") as file:
+        file.write(dumps(peers, indent=2, sort_keys=True))
+    replace(temp_path, str(peers_path))
+
+
+def _node_address(pubkey):
+    """Look up first advertised address of a node in the channel graph"""
+    try:
+        response = get("/v1/graph/node/" + pubkey)
+        if response.status_code == 200:
+            addresses = response.json()["node"].get("addresses", [])
+            if addresses:
+                return addresses[0]["addr"]
+    except Exception as error:
+        print(error.__class__.__name__, ":", error)
+    return None
+
+
+def _merge_peers(peers, connected, channel_peers, now):
+    """
+    Merge live peer data into saved peers
+
+    :return bool: True if the saved peers changed significantly
+    """
+    changed = False
+    for peer in connected:
+        pubkey = peer["pub_key"]
+        host = peer["address"]
+        if peer.get("inbound"):
+            # an inbound peer's address is its ephemeral source port
+            host = _node_address(pubkey)
+            if not host:
+                continue
+        entry = peers.setdefault(pubkey, {})
+        if entry.get("host") != host:
+            entry["host"] = host
+            changed = True
+        if now - entry.get("last_seen", 0) >= cfg.PEERS_REFRESH:
+            changed = True
+        entry["last_seen"] = now
+        ping = int(peer.get("ping_time", 0)) / 1000000
+        if ping:
+            entry["ping"] = ping
+
+    for pubkey, entry in peers.items():
+        channel = pubkey in channel_peers
+        if entry.get("channel", False) != channel:
+            entry["channel"] = channel
+            changed = True
+
+    for pubkey in channel_peers:
+        if pubkey not in peers:
+            host = _node_address(pubkey)
+            if host:
+                peers[pubkey] = {"host": host, "last_seen": 0, "channel": True}
+                changed = True
+    return changed
+
+
+def savepeers(peers_path=""):
+    """
+    Save list of peers and channel peers to file on disk for reconnecting
+
+    Only rewrites the file when peers, addresses or channels changed, or when
+    last-seen timestamps are older than PEERS_REFRESH.
+
+    :param peers_path: optional path to peers file
+    :return bool: True if the file was written
+    """
+    if not peers_path:
+        peers_path = cfg.PEERS_FILE
+    peers = load_peers(peers_path)
+
+    response = get("/v1/peers")
+    response.raise_for_status()
+    connected = response.json().get("peers", [])
+
+    response = get("/v1/channels")
+    response.raise_for_status()
+    channel_peers = {
+        channel["remote_pubkey"]
+        for channel in response.json().get("channels", [])
+    }
+
+    if _merge_peers(peers, connected, channel_peers, int(time.time())):
+        _write_peers(peers, peers_path)
+        print("Saved {} peers to {}".format(len(peers), peers_path))
+        return True
+    print("Peers unchanged")
+    return False
+
+
+def prioritized_peers(peers):
+    """
+    Order saved peers for reconnecting
+
+    Channel peers come first, then the most recently seen peers, fastest
+    connect latency (or ping) first.
+
+    :param peers: dict as returned by load_peers()
+    :return list: pubkey@host addresses
+    """
+
+    def priority(item):
+        entry = item[1]
+        speed = entry.get("latency", entry.get("ping", float("inf")))
+        recency = entry.get("last_seen", 0) // cfg.PEERS_REFRESH
+        return (not entry.get("channel", False), -recency, speed)
+
+    return [
+        pubkey + "@" + entry["host"]
+        for pubkey, entry in sorted(peers.items(), key=priority)
+        if entry.get("host")
+    ]
+
+
+def restorepeers(peers_path="", jobs=cfg.AUTOCONNECT_JOBS):
+    """
+    Reconnect to saved peers in priority order and record connect latency
+
+    :param peers_path: optional path to peers file
+    :param jobs: number of concurrent connection attempts
+    :return list: connect results
+    """
+    if not peers_path:
+        peers_path = cfg.PEERS_FILE
+    peers = load_peers(peers_path)
+    results = connect_peers(prioritized_peers(peers), jobs=jobs)
+    print_connect_summary(results)
+
+    for result in results:
+        if result["status"] == "ok":
+            pubkey = result["address"].split("@", 1)[0]
+            peers[pubkey]["latency"] = round(result["latency"], 3)
+    if results:
+        _write_peers(peers, peers_path)
+    return results
 
 
 def randompass(string_length=10):
@@ -283,7 +689,7 @@ def _wallet_password():
 def _generate_and_save_seed():
     """Generate a wallet seed, save it to SEED_FILENAME, and return it"""
     mnemonic = None
-    return_data = get(cfg.URL_GENSEED, verify=str(cfg.TLS_CERT_PATH))
+    return_data = get(cfg.URL_GENSEED)
     if return_data.status_code == 200:
         json_seed_creation = return_data.json()
         mnemonic = json_seed_creation["cipher_seed_mnemonic"]
@@ -346,9 +752,7 @@ def create_wallet():
     # Step 2: Create wallet
     if data:
         # Data is defined so proceed
-        return_data = post(
-            cfg.URL_INITWALLET, verify=str(cfg.TLS_CERT_PATH), data=dumps(data)
-        )
+        return_data = post(cfg.URL_INITWALLET, data=dumps(data))
         if return_data.status_code == 200:
             print("✅ Create wallet is successful")
         else:
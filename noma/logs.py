@@ -0,0 +1,302 @@
+"""
+Indexed search over lnd logs and merged container log streams
+
+lnd writes lnd.log and rotates it into numbered, gzipped files. Rotated files
+are decompressed once into the index directory, and every file is
+memory-mapped and split into blocks of about LOG_BLOCK_SIZE bytes. For each
+block the index records its offset, first and last timestamp, and the levels
+and subsystems it contains, so a query only scans the blocks that can match.
+The index is extended incrementally as lnd.log grows.
+"""
+import gzip
+import mmap
+import os
+import re
+import shutil
+from json import dumps, loads
+import noma.config as cfg
+
+# 2019-06-20 10:11:12.345 [INF] HSWC: message
+ENTRY = re.compile(
+    rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\.\d+ \[(\w{3})\] (\w+):", re.M
+)
+LEVELS = ("TRC", "DBG", "INF", "WRN", "ERR", "CRT")
+
+
+def _level_mask(level):
+    """Bitmask of level and all more severe levels"""
+    if level is None:
+        return (1 << len(LEVELS)) - 1
+    level = level.upper()[:3]
+    if level not in LEVELS:
+        raise ValueError("Unknown level: " + level)
+    return sum(1 << i for i in range(LEVELS.index(level), len(LEVELS)))
+
+
+def _bit(level):
+    level = level.decode()
+    return 1 << LEVELS.index(level) if level in LEVELS else 0
+
+
+def _time(value):
+    """Normalize YYYY-MM-DD[ HH:MM[:SS]] for string comparison"""
+    return value.replace("T", " ")[:19] if value else value
+
+
+def load_index(index_path=""):
+    """Load block index, keyed by log file path"""
+    if not index_path:
+        index_path = cfg.LOG_INDEX_PATH
+    try:
+        with open(os.path.join(str(index_path), "index.json")) as file:
+            return loads(file.read())
+    except FileNotFoundError:
+        return {}
+
+
+def _write_index(index, index_path):
+    path = os.path.join(str(index_path), "index.json")
+    with open(path + ".tmp", "w") as file:
+        file.write(dumps(index))
+    os.replace(path + ".tmp", path)
+
+
+def _plain_copy(path, index_path):
+    """Decompress a rotated log once into the index directory"""
+    target = os.path.join(
+        str(index_path), os.path.basename(path)[: -len(".gz")]
+    )
+    stat = os.stat(path)
+    if (
+        not os.path.exists(target)
+        or os.stat(target).st_mtime_ns != stat.st_mtime_ns
+    ):
+        with gzip.open(path, "rb") as source, open(
+            target + ".tmp", "wb"
+        ) as plain:
+            shutil.copyfileobj(source, plain, 1 << 20)
+        os.utime(target + ".tmp", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(target + ".tmp", target)
+    return target
+
+
+def index_blocks(data, start=0, block_size=cfg.LOG_BLOCK_SIZE):
+    """
+    Split log data into blocks starting at entry boundaries
+
+    :param data: bytes-like log contents, e.g. an mmap
+    :param start: offset to start at, must be an entry boundary
+    :return list: [offset, first time, last time, level mask, subsystems]
+    """
+    blocks = []
+    for match in ENTRY.finditer(data, start):
+        timestamp = match.group(1).decode()
+        if not blocks or match.start() >= blocks[-1][0] + block_size:
+            blocks.append([match.start(), timestamp, timestamp, 0, set()])
+        block = blocks[-1]
+        block[2] = timestamp
+        block[3] |= _bit(match.group(2))
+        block[4].add(match.group(3).decode())
+    for block in blocks:
+        block[4] = sorted(block[4])
+    return blocks
+
+
+def _map(path):
+    """Memory-map a file read-only, None if empty"""
+    with open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:
+            return None
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def update_index(log_path="", index_path="", block_size=cfg.LOG_BLOCK_SIZE):
+    """
+    Index new log files and the growth of the current one
+
+    :param log_path: optional lnd log directory, default LND_LOG_PATH
+    :param index_path: optional index directory, default LOG_INDEX_PATH
+    :param block_size: approximate size of indexed blocks in bytes
+    :return dict: index of plain log files, oldest first
+    """
+    if not log_path:
+        log_path = cfg.LND_LOG_PATH
+    if not index_path:
+        index_path = cfg.LOG_INDEX_PATH
+    os.makedirs(str(index_path), exist_ok=True)
+    old = load_index(index_path)
+    index = {}
+    for name in sorted(os.listdir(str(log_path))):
+        if not name.startswith("lnd.log"):
+            continue
+        path = os.path.join(str(log_path), name)
+        if name.endswith(".gz"):
+            path = _plain_copy(path, index_path)
+        stat = os.stat(path)
+        entry = old.get(path)
+        if (
+            entry
+            and entry["inode"] == stat.st_ino
+            and entry["size"] == stat.st_size
+        ):
+            index[path] = entry
+            continue
+        start, blocks = 0, []
+        if (
+            entry
+            and entry["inode"] == stat.st_ino
+            and entry["size"] < stat.st_size
+            and entry["blocks"]
+        ):
+            # appended to, re-index from the start of the last block
+            blocks = entry["blocks"][:-1]
+            start = entry["blocks"][-1][0]
+        data = _map(path)
+        if data is not None:
+            with data:
+                blocks += index_blocks(data, start, block_size)
+        index[path] = {
+            "inode": stat.st_ino,
+            "size": stat.st_size,
+            "blocks": blocks,
+        }
+    # drop decompressed copies of rotated logs that lnd has deleted
+    for name in os.listdir(str(index_path)):
+        path = os.path.join(str(index_path), name)
+        if name.startswith("lnd.log") and path not in index:
+            os.remove(path)
+    index = dict(
+        sorted(
+            index.items(),
+            key=lambda item: item[1]["blocks"][0][1]
+            if item[1]["blocks"]
+            else "",
+        )
+    )
+    _write_index(index, index_path)
+    return index
+
+
+def search(
+    since=None,
+    until=None,
+    level=None,
+    subsystems=None,
+    pattern=None,
+    log_path="",
+    index_path="",
+):
+    """
+    Search lnd logs, only scanning blocks that can contain matches
+
+    :param since: on or after, YYYY-MM-DD[ HH:MM[:SS]]
+    :param until: before, YYYY-MM-DD[ HH:MM[:SS]]
+    :param level: minimum level, e.g. WRN
+    :param subsystems: iterable of subsystems, e.g. ("HSWC", "PEER")
+    :param pattern: regular expression matched against the entry
+    :return: generator of log entries, oldest first
+    """
+    since, until = _time(since), _time(until)
+    levels = _level_mask(level)
+    wanted = {name.upper() for name in subsystems} if subsystems else None
+    regex = re.compile(pattern.encode()) if pattern else None
+
+    for path, entry in update_index(log_path, index_path).items():
+        blocks = entry["blocks"]
+        selected = [
+            (block[0], blocks[i + 1][0] if i + 1 < len(blocks) else None)
+            for i, block in enumerate(blocks)
+            if (since is None or block[2] >= since)
+            and (until is None or block[1] < until)
+            and block[3] & levels
+            and (wanted is None or wanted.intersection(block[4]))
+        ]
+        if not selected:
+            continue
+        data = _map(path)
+        with data:
+            for start, end in selected:
+                end = entry["size"] if end is None else end
+                matches = list(ENTRY.finditer(data, start, end))
+                for i, match in enumerate(matches):
+                    timestamp = match.group(1).decode()
+                    if since is not None and timestamp < since:
+                        continue
+                    if until is not None and timestamp >= until:
+                        return
+                    if not _bit(match.group(2)) & levels:
+                        continue
+                    if wanted and match.group(3).decode() not in wanted:
+                        continue
+                    stop = (
+                        matches[i + 1].start() if i + 1 < len(matches) else end
+                    )
+                    text = data[match.start():stop]
+                    if regex is None or regex.search(text):
+                        yield text.decode(errors="replace").rstrip("\n")
+
+
+def _matches(line, levels, wanted, regex):
+    """Filter a followed line; lines not in lnd format only by regex"""
+    match = ENTRY.match(line.encode())
+    if match:
+        if not _bit(match.group(2)) & levels:
+            return False
+        if wanted and match.group(3).decode() not in wanted:
+            return False
+    elif wanted or levels != _level_mask(None):
+        return False
+    return regex is None or bool(regex.search(line))
+
+
+def follow(containers=None, level=None, subsystems=None, pattern=None):
+    """
+    Follow logs of several containers as one merged, filtered stream
+
+    :param containers: container names, default all of the compose project
+    :param level: minimum lnd level
+    :param subsystems: lnd subsystems to show
+    :param pattern: regular expression lines must match
+    """
+    import queue
+    import threading
+    from noma import containers as docker_state
+
+    client = docker_state.client()
+    if containers:
+        selected = [client.containers.get(name) for name in containers]
+    else:
+        selected = client.containers.list(
+            filters={"label": "com.docker.compose.project=" + cfg.LND_MODE}
+        )
+    levels = _level_mask(level)
+    wanted = {name.upper() for name in subsystems} if subsystems else None
+    regex = re.compile(pattern) if pattern else None
+    lines = queue.Queue(maxsize=10000)
+    width = max((len(container.name) for container in selected), default=0)
+
+    def reader(container):
+        pending = b""
+        for chunk in container.logs(stream=True, follow=True, tail=0):
+            pending += chunk
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                lines.put((container.name, line.decode(errors="replace")))
+        lines.put((container.name, None))
+
+    for container in selected:
+        threading.Thread(target=reader, args=(container,), daemon=True).start()
+    running = len(selected)
+    try:
+        while running:
+            name, line = lines.get()
+            if line is None:
+                running -= 1
+            elif _matches(line, levels, wanted, regex):
+                print("{} | {}".format(name.ljust(width), line), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -67,13 +67,16 @@ def start():
     call(["docker-compose", "up", "-d"])
 
 
-def info():
-    # Show dashboard with aggregated information
-    if is_running("lnd"):
-        print("lnd is running")
-        call(["docker", "exec", cfg.LND_MODE + "_lnd_1", "lncli", "getinfo"])
-    else:
-        print("lnd is not running")
+def info(as_json=False):
+    """
+    Show dashboard with aggregated information
+
+    :param as_json: print JSON instead of a table
+    :return dict: gathered info
+    """
+    from noma import dashboard
+
+    return dashboard.show(as_json)
 
 
 def devtools():
@@ -98,52 +101,46 @@ def devtools():
 def is_running(node=""):
     """Check if container is running
 
-    :return bool: container is running"""
-    from docker import from_env
+    :return bool: container is running, None if docker is unreachable"""
+    from docker.errors import DockerException
     import requests
+    from noma import containers
 
     if not node:
         node = "lnd"
-    docker_host = from_env()
-    compose_name = cfg.LND_MODE + "_" + node + "_1"
     try:
-        for container in docker_host.containers.list():
-            if compose_name in container.name:
-                return True
+        return containers.state().is_running(containers.compose_name(node))
     except AttributeError:
         return None
     except ConnectionError:
         return None
     except requests.exceptions.ConnectionError:
         return None
+    except DockerException:
+        return None
 
-    return False
-
-
-def stop(timeout=1, retries=5):
-    """Check and wait for clean shutdown of lnd"""
-
-    def clean_stop():
-        # ensure clean shutdown of lnd
-        print("lnd is running, stopping with lncli stop")
-        success = call(["docker", "exec", cfg.LND_MODE + "_lnd_1", "lncli", "stop"])
-        if success == 0:
-            print("✅ lncli stop returned success")
-        else:
-            print("❌ lncli stop failed")
 
-        print("waiting " + str(timeout) + "s for lnd to stop...")
-        time.sleep(timeout)
+def stop(deadline=cfg.SHUTDOWN_DEADLINE):
+    """
+    Stop the compose services in dependency order, e.g. before a power cut
 
-    for tries in range(retries):
-        if is_running("lnd"):
-            clean_stop()
-            retries -= 1
-        else:
-            print("✅ lnd is stopped")
-            exit(0)
+    :param deadline: seconds for the whole shutdown
+    :return bool: all services stopped cleanly
+    """
+    from noma import shutdown
 
-    print("❌ Failed to stop lnd")
+    start = time.monotonic()
+    results = shutdown.shutdown(deadline=deadline)
+    clean = all(
+        result["status"] in ("stopped", "not running")
+        for result in results.values()
+    )
+    print(
+        "{m} Shutdown took {s:.1f}s".format(
+            m="✅" if clean else "❌", s=time.monotonic() - start
+        )
+    )
+    return clean
 
 
 def voltage(device=""):
@@ -274,7 +271,9 @@ def reinstall():
     supplicant_sd = pathlib.Path("/etc/wpa_supplicant/wpa_supplicant.conf")
     supplicant_gh = pathlib.Path("etc/wpa_supplicant/wpa_supplicant.conf")
     shutil.copy(supplicant_sd, supplicant_gh)
-    call(["./make_apkovl.sh"])
+    from noma import scheduler
+
+    scheduler.run("reinstall", ["./make_apkovl.sh"])
     call(["mount", "-o", "remount,ro", "/dev/mmcblk0p1", "/media/mmcblk0p1"])
     shutil.copy("box.apkovl.tar.gz", "/media/mmcbkl0p1/")
     os.remove("/media/mmcblk0p1/installed")
@@ -293,7 +292,9 @@ def full_reinstall():
     get_source()
     os.chdir(cfg.NOMA_SOURCE)
     call(["git", "pull"])
-    call(["make_upgrade.sh"])
+    from noma import scheduler
+
+    scheduler.run("upgrade", ["make_upgrade.sh"])
 
 
 def do_diff():
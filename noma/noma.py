@@ -5,28 +5,85 @@ Usage:  noma start
         noma stop
         noma check
         noma logs
-        noma info
+        noma logs search [--grep=<regex>] [--since=<date>] [--until=<date>]
+                         [--level=<level>] [--subsystem=<names>] [--limit=<n>]
+        noma logs follow [<container>...] [--grep=<regex>] [--level=<level>]
+                         [--subsystem=<names>]
+        noma info [--json]
+        noma permissions <name> [--jobs=<n>]
+        noma tune [--dry-run] [--benchmark] [--prune] [--duration=<seconds>]
+        noma seed serve [<path>] [--port=<port>] [--no-announce]
+        noma seed list
+        noma telemetry record [--interval=<seconds>]
+        noma telemetry stats [--window=<seconds>] [--json]
+        noma jobs run [--name=<name>] [--] <command>...
+        noma jobs stats [--json]
+        noma bitcoind status
+        noma bitcoind progress [--watch] [--json] [--interval=<seconds>]
+        noma bitcoind stop
         noma lnd create
-        noma lnd backup
+        noma lnd backup [--force|--watch]
         noma lnd autounlock
-        noma lnd autoconnect [<path>]
+        noma lnd unlock [--timeout=<seconds>]
+        noma lnd autoconnect [<path>] [--parallel] [--jobs=<n>]
         noma lnd savepeers
+        noma lnd restorepeers [--jobs=<n>]
+        noma lnd index
+        noma lnd search (invoices|payments) [--memo=<text>] [--min=<sat>]
+                        [--max=<sat>] [--since=<date>] [--until=<date>]
+                        [--state=<state>] [--limit=<n>]
+        noma lnd fwdexport
+        noma lnd fwdfees (channel|day) [--since=<date>] [--until=<date>]
+        noma lnd graph snapshot [<path>]
+        noma lnd graph diff <old> <new>
         noma lnd connectapp
         noma lnd connectstring
         noma (-h|--help)
         noma --version
 
 Options:
-  -h --help     Show this screen.
-  --version     Show version.
+  -h --help            Show this screen.
+  --version            Show version.
+  --force              Upload channel.backup even if unchanged.
+  --watch              Keep running, e.g. back up channel.backup on change.
+  --parallel           Connect to peers concurrently over REST.
+  --jobs=<n>           Number of concurrent workers.
+  --timeout=<seconds>  Seconds to wait for lnd.
+  --memo=<text>        Invoice memo contains text.
+  --min=<sat>          Minimum amount in satoshis.
+  --max=<sat>          Maximum amount in satoshis.
+  --since=<date>       On or after date, YYYY-MM-DD[ HH:MM:SS].
+  --until=<date>       Before date, YYYY-MM-DD[ HH:MM:SS].
+  --state=<state>      Invoice state or payment status, e.g. SETTLED.
+  --limit=<n>          Maximum number of results [default: 100].
+  --grep=<regex>       Log entry matches regular expression.
+  --level=<level>      Minimum log level, e.g. WRN.
+  --subsystem=<names>  Comma separated lnd subsystems, e.g. HSWC,PEER.
+  --json               Print one JSON object per line.
+  --interval=<seconds>  Seconds between samples.
+  --dry-run            Show changes as a diff without writing them.
+  --benchmark          Measure sync rate before and after restarting bitcoind.
+  --duration=<seconds>  Seconds to measure sync rate.
+  --prune              Prune a full chain that does not fit the drive.
+  --port=<port>        Port to serve the snapshot on.
+  --no-announce        Do not announce the seed over mDNS.
+  --window=<seconds>   Seconds of samples to summarize.
+  --name=<name>        Job name statistics are kept under [default: job].
 
 """
 import os
 from docopt import docopt
+import noma.config as cfg
 from noma import lnd
 from noma import node
 
 
+def _option(args, name, convert, default):
+    """Return an option converted, or default if it was not given"""
+    value = args[name]
+    return default if value is None else convert(value)
+
+
 def lnd_fn(args):
     """
     lnd related functionality
@@ -37,38 +94,207 @@ def lnd_fn(args):
     elif args["autounlock"]:
         lnd.autounlock()
 
+    elif args["unlock"]:
+        status = lnd.unlock(
+            timeout=_option(args, "--timeout", float, cfg.UNLOCK_TIMEOUT)
+        )
+        exit(0 if status in ("unlocked", "already unlocked") else 1)
+
     elif args["backup"]:
-        lnd.backup()
+        lnd.backup(force=args["--force"], watch=args["--watch"])
 
     elif args["autoconnect"]:
-        lnd.autoconnect(args["<path>"])
+        lnd.autoconnect(
+            args["<path>"],
+            parallel=args["--parallel"],
+            jobs=_option(args, "--jobs", int, cfg.AUTOCONNECT_JOBS),
+        )
 
     elif args["savepeers"]:
         lnd.savepeers()
 
+    elif args["restorepeers"]:
+        lnd.restorepeers(
+            jobs=_option(args, "--jobs", int, cfg.AUTOCONNECT_JOBS)
+        )
+
     elif args["connectstring"]:
         lnd.connectstring()
 
+    elif args["index"]:
+        from noma import index
+
+        index.update()
+
+    elif args["fwdexport"]:
+        from noma import fwdexport
+
+        fwdexport.export()
+
+    elif args["fwdfees"]:
+        from noma import fwdexport
+        from noma.index import timestamp
+
+        since = timestamp(args["--since"]) if args["--since"] else None
+        until = timestamp(args["--until"]) if args["--until"] else None
+        if args["channel"]:
+            fees = fwdexport.fees_per_channel(since, until)
+            fwdexport.print_fees(fees, "channel")
+        else:
+            fwdexport.print_fees(fwdexport.fees_per_day(since, until), "day")
+
+    elif args["graph"]:
+        from noma import graph
+
+        if args["snapshot"]:
+            graph.snapshot(args["<path>"] or "")
+        else:
+            graph.print_diff(graph.diff(args["<old>"], args["<new>"]))
+
+    elif args["search"]:
+        from noma import index
+
+        index.print_rows(
+            index.search(
+                "invoices" if args["invoices"] else "payments",
+                memo=args["--memo"],
+                min_sat=args["--min"],
+                max_sat=args["--max"],
+                since=args["--since"],
+                until=args["--until"],
+                state=args["--state"],
+                limit=args["--limit"],
+            )
+        )
+
+
+def bitcoind_fn(args):
+    """
+    bitcoind related functionality
+    """
+    from noma import bitcoind
+
+    if args["status"]:
+        bitcoind.status()
+
+    elif args["progress"]:
+        from noma import progress
+
+        progress.monitor(
+            interval=_option(
+                args, "--interval", float, cfg.PROGRESS_INTERVAL
+            ),
+            watch=args["--watch"],
+            as_json=args["--json"],
+        )
+
+    elif args["stop"]:
+        bitcoind.stop()
+
 
 def node_fn(args):
     """
     node related functionality
     """
     if args["info"]:
-        node.info()
+        node.info(as_json=args["--json"])
 
     elif args["start"]:
         node.start()
 
     elif args["stop"]:
-        node.stop()
+        exit(0 if node.stop() else 1)
 
     elif args["logs"]:
-        node.logs()
+        if args["search"] or args["follow"]:
+            from noma import logs
+
+            subsystems = (
+                args["--subsystem"].split(",") if args["--subsystem"] else None
+            )
+            if args["follow"]:
+                logs.follow(
+                    args["<container>"],
+                    level=args["--level"],
+                    subsystems=subsystems,
+                    pattern=args["--grep"],
+                )
+            else:
+                entries = logs.search(
+                    since=args["--since"],
+                    until=args["--until"],
+                    level=args["--level"],
+                    subsystems=subsystems,
+                    pattern=args["--grep"],
+                )
+                for number, entry in enumerate(entries):
+                    if number >= int(args["--limit"]):
+                        break
+                    print(entry)
+        else:
+            node.logs()
 
     elif args["check"]:
         node.check()
 
+    elif args["permissions"]:
+        from noma import permissions
+
+        permissions.fix(
+            args["<name>"],
+            jobs=_option(args, "--jobs", int, cfg.PERMISSIONS_JOBS),
+        )
+
+    elif args["seed"]:
+        from noma import seed
+
+        if args["serve"]:
+            seed.serve(
+                args["<path>"] or "",
+                port=_option(args, "--port", int, cfg.SEED_PORT),
+                announce=not args["--no-announce"],
+            )
+        else:
+            seed.print_seeds()
+
+    elif args["telemetry"]:
+        from noma import telemetry
+
+        if args["record"]:
+            telemetry.record(
+                interval=_option(
+                    args, "--interval", float, cfg.TELEMETRY_INTERVAL
+                )
+            )
+        else:
+            telemetry.print_stats(
+                window=_option(
+                    args, "--window", float, cfg.TELEMETRY_WINDOW
+                ),
+                as_json=args["--json"],
+            )
+
+    elif args["jobs"]:
+        from noma import scheduler
+
+        if args["run"]:
+            result = scheduler.run(args["--name"], args["<command>"])
+            exit(result["returncode"])
+        else:
+            scheduler.print_stats(as_json=args["--json"])
+
+    elif args["tune"]:
+        from noma import tune
+
+        tune.tune(
+            dry_run=args["--dry-run"],
+            benchmark=args["--benchmark"],
+            duration=_option(
+                args, "--duration", float, cfg.TUNE_DURATION
+            ),
+            prune=args["--prune"],
+        )
+
 
 def main():
     """
@@ -79,6 +305,8 @@ def main():
     if os.geteuid() == 0:
         if args["lnd"]:
             lnd_fn(args)
+        elif args["bitcoind"]:
+            bitcoind_fn(args)
         else:
             node_fn(args)
     else:
@@ -0,0 +1,134 @@
+"""
+Ownership and permission normalisation for noma-managed directories
+
+Trees are walked with os.fwalk and every entry is inspected with an fstatat
+relative to its directory file descriptor, so no path is resolved twice.
+Entries that already have the wanted owner and mode are skipped and
+directories can be processed by a thread pool. Symlinks are left alone.
+"""
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+import noma.config as cfg
+
+# names per task when a large directory is split across threads
+BATCH = 1024
+
+
+def _fix(dir_fd, names, uid, gid, mode):
+    """
+    Fix owner and mode of names relative to dir_fd
+
+    :return tuple: entries checked, entries changed
+    """
+    changed = 0
+    for name in names:
+        try:
+            info = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        if stat.S_ISLNK(info.st_mode):
+            continue
+        fixed = False
+        if info.st_uid != uid or info.st_gid != gid:
+            os.chown(name, uid, gid, dir_fd=dir_fd, follow_symlinks=False)
+            fixed = True
+        if stat.S_IMODE(info.st_mode) != mode:
+            os.chmod(name, mode, dir_fd=dir_fd)
+            fixed = True
+        changed += fixed
+    return len(names), changed
+
+
+def _fix_owned(dir_fd, names, uid, gid, mode):
+    """Run _fix in a worker thread and close its duplicated dir_fd"""
+    try:
+        return _fix(dir_fd, names, uid, gid, mode)
+    finally:
+        os.close(dir_fd)
+
+
+def normalize(
+    path,
+    uid=cfg.LNCM_UID,
+    gid=cfg.LNCM_GID,
+    dir_mode=0o755,
+    file_mode=0o744,
+    jobs=1,
+):
+    """
+    Set owner and mode of path and everything below it
+
+    :param path: top directory
+    :param uid: wanted owner
+    :param gid: wanted group
+    :param dir_mode: wanted mode of directories
+    :param file_mode: wanted mode of files
+    :param jobs: worker threads, 1 to work in the calling thread
+    :return tuple: entries checked, entries changed
+    """
+    path = str(path)
+    parent, top = os.path.split(os.path.abspath(path))
+    parent_fd = os.open(parent, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        checked, changed = _fix(parent_fd, [top], uid, gid, dir_mode)
+    finally:
+        os.close(parent_fd)
+
+    def tasks(dirs, files):
+        yield dirs, dir_mode
+        for start in range(0, len(files), BATCH):
+            yield files[start:start + BATCH], file_mode
+
+    if jobs <= 1:
+        for _, dirs, files, dir_fd in os.fwalk(path):
+            for names, mode in tasks(dirs, files):
+                result = _fix(dir_fd, names, uid, gid, mode)
+                checked, changed = checked + result[0], changed + result[1]
+        return checked, changed
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+
+        def collect(keep):
+            nonlocal checked, changed
+            # bound open file descriptors of queued tasks
+            while len(futures) > keep:
+                result = futures.pop(0).result()
+                checked, changed = checked + result[0], changed + result[1]
+
+        for _, dirs, files, dir_fd in os.fwalk(path):
+            for names, mode in tasks(dirs, files):
+                if names:
+                    futures.append(
+                        pool.submit(
+                            _fix_owned, os.dup(dir_fd), names, uid, gid, mode
+                        )
+                    )
+            collect(4 * jobs)
+        collect(0)
+    return checked, changed
+
+
+def fix(name, jobs=cfg.PERMISSIONS_JOBS):
+    """
+    Normalize a directory listed in PERMISSIONS
+
+    :param name: bitcoind, lnd or nginx
+    :return tuple: entries checked, entries changed
+    """
+    if name not in cfg.PERMISSIONS:
+        raise ValueError(
+            "Unknown directory {n}, choose from {c}".format(
+                n=name, c=", ".join(sorted(cfg.PERMISSIONS))
+            )
+        )
+    path, uid, gid, dir_mode, file_mode = cfg.PERMISSIONS[name]
+    print("Setting file and directory permissions of " + str(path))
+    checked, changed = normalize(path, uid, gid, dir_mode, file_mode, jobs)
+    print("Checked {c} entries, changed {n}".format(c=checked, n=changed))
+    return checked, changed
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,247 @@
+"""
+bitcoind sync progress monitor
+
+Samples block height, headers and verificationprogress over RPC together
+with CPU, iowait and disk throughput of the device holding the chain. The
+samples are kept in a RingBuffer, from which the sync rate, a smoothed ETA
+and stalls are derived. A rate drop that coincides with high iowait points at
+a slow USB drive, one that coincides with a busy CPU at script verification.
+"""
+import os
+import time
+from json import dumps
+import noma.config as cfg
+from noma.ringbuffer import RingBuffer
+
+COLUMNS = (
+    "time",
+    "blocks",
+    "headers",
+    "progress",
+    "cpu",
+    "iowait",
+    "read",
+    "written",
+)
+
+
+def _disk_device(path):
+    """
+    Return name of the disk holding path as used by psutil.disk_io_counters
+
+    :return str: e.g. sda1, empty if unknown
+    """
+    import psutil
+
+    path = os.path.realpath(str(path))
+    best = None
+    for partition in psutil.disk_partitions(all=False):
+        mount = partition.mountpoint
+        if path == mount or path.startswith(mount.rstrip("/") + "/"):
+            if best is None or len(mount) > len(best.mountpoint):
+                best = partition
+    if best is None:
+        return ""
+    return os.path.basename(os.path.realpath(best.device))
+
+
+def _disk_counters(device):
+    import psutil
+
+    counters = psutil.disk_io_counters(perdisk=bool(device))
+    if device:
+        counters = counters.get(device) or psutil.disk_io_counters()
+    if counters is None:
+        return 0, 0
+    return counters.read_bytes, counters.write_bytes
+
+
+def sample(device=""):
+    """
+    Take one sample of sync state and system load
+
+    :param device: disk name from _disk_device, empty for all disks
+    :return dict: a value for every name in COLUMNS
+    """
+    import psutil
+    from noma import rpc
+
+    chain, = rpc.batch(["getblockchaininfo"])
+    times = psutil.cpu_times_percent(interval=None)
+    read, written = _disk_counters(device)
+    return {
+        "time": time.monotonic(),
+        "blocks": chain["blocks"],
+        "headers": chain["headers"],
+        "progress": chain["verificationprogress"],
+        "cpu": 100.0 - times.idle,
+        "iowait": getattr(times, "iowait", 0.0),
+        "read": read,
+        "written": written,
+    }
+
+
+def summary(
+    samples, stall=cfg.PROGRESS_STALL, smoothing=cfg.PROGRESS_SMOOTHING
+):
+    """
+    Derive sync rate, ETA and bottleneck hints from samples
+
+    The ETA uses the smoothed rate of verificationprogress rather than of
+    blocks, as later blocks hold more transactions and take longer.
+
+    :param samples: RingBuffer with COLUMNS, oldest first
+    :param stall: seconds without a new block before reporting a stall
+    :param smoothing: weight of the newest interval in the moving averages
+    :return dict: latest state and derived rates
+    """
+    latest = samples[-1]
+    result = {
+        "blocks": int(latest["blocks"]),
+        "headers": int(latest["headers"]),
+        "progress": latest["progress"],
+        "blocks_per_minute": None,
+        "average_blocks_per_minute": None,
+        "eta": None,
+        "cpu": latest["cpu"],
+        "iowait": latest["iowait"],
+        "disk_read": None,
+        "disk_write": None,
+        "since_block": 0.0,
+        "stalled": False,
+        "bottleneck": "",
+    }
+    block_rate = progress_rate = None
+    last_block = samples[0]["time"]
+    previous = samples[0]
+    for current in samples:
+        elapsed = current["time"] - previous["time"]
+        if elapsed <= 0:
+            continue
+        blocks = (current["blocks"] - previous["blocks"]) / elapsed
+        progress = (current["progress"] - previous["progress"]) / elapsed
+        if block_rate is None:
+            block_rate, progress_rate = blocks, progress
+        else:
+            block_rate += smoothing * (blocks - block_rate)
+            progress_rate += smoothing * (progress - progress_rate)
+        if current["blocks"] > previous["blocks"]:
+            last_block = current["time"]
+        result["disk_read"] = (current["read"] - previous["read"]) / elapsed
+        result["disk_write"] = (
+            current["written"] - previous["written"]
+        ) / elapsed
+        previous = current
+    if block_rate is None:
+        return result
+
+    first = samples[0]
+    span = latest["time"] - first["time"]
+    average = (latest["blocks"] - first["blocks"]) / span
+    result["blocks_per_minute"] = block_rate * 60
+    result["average_blocks_per_minute"] = average * 60
+    result["since_block"] = latest["time"] - last_block
+    synced = latest["blocks"] >= latest["headers"]
+    if synced:
+        result["eta"] = 0.0
+    elif progress_rate > 0:
+        result["eta"] = (1.0 - latest["progress"]) / progress_rate
+    result["stalled"] = not synced and result["since_block"] >= stall
+    if not synced and (result["stalled"] or block_rate < average / 2):
+        if latest["iowait"] >= cfg.PROGRESS_IOWAIT:
+            result["bottleneck"] = "disk"
+        elif latest["cpu"] >= cfg.PROGRESS_CPU:
+            result["bottleneck"] = "cpu"
+    return result
+
+
+def _duration(seconds):
+    if seconds is None:
+        return "unknown"
+    minutes = int(seconds // 60)
+    if minutes >= 1440:
+        return "{}d {}h".format(minutes // 1440, minutes % 1440 // 60)
+    return "{}h {}m".format(minutes // 60, minutes % 60)
+
+
+def format_summary(state):
+    """Return summary as one human readable line"""
+    line = "height {b}/{h}  {p:.2f}%".format(
+        b=state["blocks"], h=state["headers"], p=state["progress"] * 100
+    )
+    if state["blocks_per_minute"] is not None:
+        line += "  {r:.1f} blocks/min  ETA {e}".format(
+            r=state["blocks_per_minute"], e=_duration(state["eta"])
+        )
+        line += "  disk r {r:.1f} w {w:.1f} MB/s".format(
+            r=state["disk_read"] / 1e6, w=state["disk_write"] / 1e6
+        )
+    line += "  cpu {c:.0f}%  iowait {i:.0f}%".format(
+        c=state["cpu"], i=state["iowait"]
+    )
+    if state["stalled"]:
+        line += "  stalled for " + _duration(state["since_block"])
+    if state["bottleneck"]:
+        line += "  rate limited by " + state["bottleneck"]
+    return line
+
+
+def monitor(
+    interval=cfg.PROGRESS_INTERVAL,
+    watch=False,
+    as_json=False,
+    capacity=cfg.PROGRESS_SAMPLES,
+):
+    """
+    Print sync progress, once or every interval seconds
+
+    Without watch, two samples interval seconds apart are taken so a rate
+    can be shown. JSON output prints one object per line. While watching,
+    RPC and connection errors, e.g. during a bitcoind restart, are printed
+    and sampling continues.
+
+    :param interval: seconds between samples
+    :param watch: keep sampling until interrupted
+    :param as_json: print JSON instead of text
+    :param capacity: samples kept for rates and stall detection
+    :return dict: last summary
+    """
+    from requests import RequestException
+    from noma.rpc import RPCError
+
+    device = _disk_device(cfg.BITCOIN_PATH)
+    samples = RingBuffer(COLUMNS, capacity)
+    state = None
+    try:
+        while True:
+            try:
+                samples.append(sample(device))
+            except (RPCError, RequestException) as error:
+                if not watch:
+                    raise
+                message = "{}: {}".format(error.__class__.__name__, error)
+                if as_json:
+                    print(
+                        dumps({"error": message, "time": time.time()}),
+                        flush=True,
+                    )
+                else:
+                    print("Waiting for bitcoind, " + message, flush=True)
+                time.sleep(interval)
+                continue
+            if len(samples) > 1:
+                state = summary(samples)
+                if as_json:
+                    print(dumps(dict(state, time=time.time())), flush=True)
+                else:
+                    print(format_summary(state), flush=True)
+                if not watch:
+                    break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return state
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,206 @@
+"""
+Pooled keep-alive REST client for lnd
+
+A single requests Session is shared by every caller, so TCP connections and
+TLS sessions to lnd's REST port are reused instead of being renegotiated on
+every call. The TLS context built from tls.cert and the macaroon header are
+loaded once and only reloaded when the file on disk changes.
+"""
+import ssl
+import threading
+from os import stat
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import noma.config as cfg
+
+
+class _PinnedTLSAdapter(HTTPAdapter):
+    """HTTPAdapter that verifies against a prebuilt SSLContext
+
+    requests would otherwise pass the CA path down to urllib3, which loads
+    the certificate from disk again for every new connection.
+    """
+
+    def __init__(self, ssl_context, **kwargs):
+        self._ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self._ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        """Certificate is already loaded into our SSLContext"""
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        attributes = super().build_connection_pool_key_attributes
+        host_params, pool_kwargs = attributes(request, verify, cert)
+        pool_kwargs.pop("ca_certs", None)
+        pool_kwargs.pop("ca_cert_dir", None)
+        return host_params, pool_kwargs
+
+
+class LndRest:
+    """
+    Keep-alive client for lnd's REST interface
+
+    :param url: base url, e.g. https://127.0.0.1:8080
+    :param tls_cert: path to lnd's tls.cert
+    :param macaroon: path to macaroon sent with every request, if it exists
+    :param timeout: default (connect, read) timeout in seconds
+    :param retries: number of retries for failed connection attempts
+    :param pool_size: number of keep-alive connections to hold open
+    """
+
+    def __init__(
+        self,
+        url=cfg.URL_REST,
+        tls_cert=cfg.TLS_CERT_PATH,
+        macaroon=cfg.MACAROON_PATH,
+        timeout=cfg.REST_TIMEOUT,
+        retries=cfg.REST_RETRIES,
+        pool_size=cfg.REST_POOL_SIZE,
+    ):
+        self.url = url.rstrip("/")
+        self.tls_cert = str(tls_cert)
+        self.macaroon = str(macaroon)
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._session = None
+        self._cert_mtime = None
+        self._macaroon_mtime = None
+        self._macaroon_hex = None
+
+    def _retry(self):
+        # Only connection failures are retried: lnd did not see the request,
+        # so retrying is safe even for POSTs such as unlockwallet
+        return Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,
+            status=0,
+            backoff_factor=0.2,
+            raise_on_status=False,
+        )
+
+    def _build_session(self):
+        session = Session()
+        session.mount(
+            "http://",
+            HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.pool_size,
+                max_retries=self._retry(),
+            ),
+        )
+        if self.url.startswith("https://"):
+            context = ssl.create_default_context(cafile=self.tls_cert)
+            session.mount(
+                "https://",
+                _PinnedTLSAdapter(
+                    context,
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=self._retry(),
+                ),
+            )
+        return session
+
+    @property
+    def session(self):
+        """Shared requests Session, rebuilt only when tls.cert changes"""
+        if self.url.startswith("https://"):
+            mtime = stat(self.tls_cert).st_mtime
+        else:
+            mtime = None
+        with self._lock:
+            if self._session is None or mtime != self._cert_mtime:
+                if self._session is not None:
+                    self._session.close()
+                self._session = self._build_session()
+                self._cert_mtime = mtime
+            return self._session
+
+    def headers(self):
+        """Return macaroon header, empty until a macaroon exists"""
+        try:
+            mtime = stat(self.macaroon).st_mtime
+        except OSError:
+            return {}
+        with self._lock:
+            if mtime != self._macaroon_mtime:
+                with open(self.macaroon, "rb") as file:
+                    self._macaroon_hex = file.read().hex()
+                self._macaroon_mtime = mtime
+            return {"Grpc-Metadata-macaroon": self._macaroon_hex}
+
+    def endpoint(self, path):
+        """Return absolute url for path, absolute urls are passed through"""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return self.url + "/" + path.lstrip("/")
+
+    def request(self, method, path, **kwargs):
+        """
+        Send request over the shared session
+
+        :param method: HTTP method
+        :param path: endpoint path such as /v1/getinfo, or absolute url
+        :param kwargs: passed on to requests, e.g. data, params, timeout
+        :return: requests.Response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        headers = self.headers()
+        headers.update(kwargs.pop("headers", None) or {})
+        return self.session.request(
+            method, self.endpoint(path), headers=headers, **kwargs
+        )
+
+    def get(self, path, **kwargs):
+        """GET path from lnd"""
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        """POST to path on lnd"""
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        """DELETE path on lnd"""
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def client():
+    """Return the shared LndRest client, created on first use"""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = LndRest()
+        return _CLIENT
+
+
+def get(path, **kwargs):
+    """GET path using the shared client"""
+    return client().get(path, **kwargs)
+
+
+def post(path, **kwargs):
+    """POST to path using the shared client"""
+    return client().post(path, **kwargs)
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,193 @@
+"""
+Fixed-size ring buffer of numeric samples
+
+Every column is a preallocated array of doubles, so appending a sample never
+allocates and memory use stays constant however long a monitor runs. With a
+path the columns live in a memory-mapped file instead, so the samples
+survive restarts and other processes can read them while they are written.
+"""
+import mmap
+import os
+import struct
+from array import array
+
+MAGIC = b"NOMARING"
+# magic, version, capacity, columns, head, count
+HEADER = struct.Struct("=8s5Q")
+NAMES_SIZE = 512
+DATA_OFFSET = 1024
+
+
+class RingBuffer:
+    """
+    Keep the last capacity rows of named numeric columns
+
+    :param columns: column names
+    :param capacity: maximum number of rows kept
+    :param path: optional file to memory-map, reused if its layout matches
+    :param readonly: map an existing file for reading only
+    """
+
+    def __init__(self, columns, capacity, path=None, readonly=False):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.path = path
+        self._map = None
+        self._views = []
+        if path is None:
+            self._data = {
+                name: array("d", bytes(8 * capacity)) for name in self.columns
+            }
+            # index of the next row to write, number of rows
+            self._state = array("Q", [0, 0])
+        else:
+            self._open(str(path), readonly)
+
+    def _layout(self):
+        names = ",".join(self.columns).encode()
+        if len(names) > NAMES_SIZE:
+            raise ValueError("column names too long")
+        return names.ljust(NAMES_SIZE, b"\0")
+
+    def _open(self, path, readonly):
+        names = self._layout()
+        size = DATA_OFFSET + 8 * self.capacity * len(self.columns)
+        fresh = True
+        try:
+            with open(path, "rb") as file:
+                header = file.read(HEADER.size + NAMES_SIZE)
+            magic, _, capacity, columns, _, _ = HEADER.unpack_from(header)
+            fresh = not (
+                magic == MAGIC
+                and capacity == self.capacity
+                and columns == len(self.columns)
+                and header[HEADER.size:] == names
+                and os.path.getsize(path) == size
+            )
+        except (FileNotFoundError, struct.error):
+            pass
+        if fresh and readonly:
+            raise ValueError("No ring buffer with these columns at " + path)
+        if fresh:
+            header = HEADER.pack(
+                MAGIC, 1, self.capacity, len(self.columns), 0, 0
+            )
+            with open(path + ".tmp", "wb") as file:
+                file.write(header)
+                file.write(names)
+                file.truncate(size)
+            os.replace(path + ".tmp", path)
+        with open(path, "rb" if readonly else "r+b") as file:
+            self._map = mmap.mmap(
+                file.fileno(),
+                size,
+                access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE,
+            )
+        view = memoryview(self._map)
+        # head and count, updated after the row they describe
+        self._state = view[32:48].cast("Q")
+        self._views = [view, self._state]
+        self._data = {}
+        for number, name in enumerate(self.columns):
+            start = DATA_OFFSET + 8 * self.capacity * number
+            column = view[start:start + 8 * self.capacity].cast("d")
+            self._data[name] = column
+            self._views.append(column)
+
+    @property
+    def _head(self):
+        return self._state[0]
+
+    @_head.setter
+    def _head(self, value):
+        self._state[0] = value
+
+    @property
+    def _count(self):
+        return self._state[1]
+
+    @_count.setter
+    def _count(self, value):
+        self._state[1] = value
+
+    def __len__(self):
+        return self._count
+
+    def append(self, row):
+        """
+        Add a row, overwriting the oldest one when full
+
+        :param row: dict with a value for every column
+        """
+        head = self._head
+        count = self._count
+        if count == self.capacity:
+            # the oldest row is overwritten, drop it from the window first
+            count -= 1
+            self._count = count
+        for name in self.columns:
+            self._data[name][head] = row[name]
+        # publish the slot with head before count, so a reader taking its
+        # window now sees at worst one row too few. A reader that took its
+        # window before a full buffer shrank may still read a torn row.
+        self._head = (head + 1) % self.capacity
+        self._count = count + 1
+
+    def _window(self):
+        """Return slot of the oldest row and number of rows"""
+        # count before head, the reverse of append
+        count = self._count
+        return (self._head - count) % self.capacity, count
+
+    def _index(self, position):
+        start, count = self._window()
+        if position < 0:
+            position += count
+        if not 0 <= position < count:
+            raise IndexError("ring buffer index out of range")
+        return (start + position) % self.capacity
+
+    def __getitem__(self, position):
+        """Return row at position as dict, 0 is the oldest, -1 the newest"""
+        index = self._index(position)
+        return {name: self._data[name][index] for name in self.columns}
+
+    def __iter__(self):
+        for position in range(self._count):
+            yield self[position]
+
+    def column(self, name):
+        """Return values of a column from oldest to newest"""
+        values = self._data[name]
+        start, count = self._window()
+        end = start + count
+        if end <= self.capacity:
+            return values[start:end].tolist()
+        return values[start:].tolist() + values[:end - self.capacity].tolist()
+
+    def flush(self):
+        """Write a memory-mapped buffer to disk"""
+        if self._map is not None:
+            self._map.flush()
+
+    def close(self):
+        """Flush and unmap a memory-mapped buffer"""
+        if self._map is None or self._map.closed:
+            return
+        if not self._views[0].readonly:
+            self._map.flush()
+        for view in reversed(self._views):
+            view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,182 @@
+"""
+Keep-alive JSON-RPC client for bitcoind
+
+Credentials are read from the rpc.txt written by
+bitcoind.generate_rpcauth. A single requests Session keeps the HTTP
+connection to bitcoind open between calls, and batch() sends several calls
+as one JSON-RPC array so they come back in a single round trip.
+"""
+import re
+import threading
+from json import dumps
+from requests import Session
+import noma.config as cfg
+
+_CREDENTIAL = re.compile(r"(rpcauth|username|password)=")
+
+
+class RPCError(Exception):
+    """Error returned by bitcoind for a call"""
+
+    def __init__(self, code, message):
+        super().__init__("{} (code {})".format(message, code))
+        self.code = code
+        self.message = message
+
+
+def read_credentials(credentials_path=""):
+    """
+    Return username and password generated last
+
+    Older versions of generate_rpcauth did not end rpc.txt with a newline,
+    so entries are split on their keys rather than on lines.
+
+    :param credentials_path: optional path to rpc.txt
+    :return tuple: username, password
+    """
+    if not credentials_path:
+        credentials_path = cfg.RPC_CREDENTIALS
+    with open(str(credentials_path)) as file:
+        text = file.read()
+    values = {}
+    matches = list(_CREDENTIAL.finditer(text))
+    for match, following in zip(matches, matches[1:] + [None]):
+        end = following.start() if following else len(text)
+        values[match.group(1)] = text[match.end():end].strip()
+    if "username" not in values or "password" not in values:
+        raise ValueError("No RPC credentials in " + str(credentials_path))
+    return values["username"], values["password"]
+
+
+class BitcoinRPC:
+    """
+    Client for bitcoind's JSON-RPC interface
+
+    :param url: e.g. http://127.0.0.1:8332, a wallet path may be appended
+    :param user: RPC username, read from credentials_path if empty
+    :param password: RPC password
+    :param credentials_path: rpc.txt written by generate_rpcauth
+    :param timeout: (connect, read) timeout in seconds
+    """
+
+    def __init__(
+        self,
+        url=cfg.BITCOIN_RPC_URL,
+        user="",
+        password="",
+        credentials_path="",
+        timeout=cfg.RPC_TIMEOUT,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self._user = user
+        self._password = password
+        self._credentials_path = credentials_path
+        self._session = None
+        self._lock = threading.Lock()
+        self._id = 0
+
+    @property
+    def session(self):
+        """Shared keep-alive Session, credentials are read on first use"""
+        with self._lock:
+            if self._session is None:
+                if not self._user:
+                    self._user, self._password = read_credentials(
+                        self._credentials_path
+                    )
+                self._session = Session()
+                self._session.auth = (self._user, self._password)
+                self._session.headers["Content-Type"] = "application/json"
+            return self._session
+
+    def _next_id(self):
+        with self._lock:
+            self._id += 1
+            return self._id
+
+    def _post(self, payload):
+        response = self.session.post(
+            self.url, data=dumps(payload), timeout=self.timeout
+        )
+        # bitcoind answers failed calls with HTTP 500 and a JSON error
+        if response.status_code not in (200, 500) or not response.content:
+            response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _result(reply):
+        if reply.get("error"):
+            raise RPCError(reply["error"]["code"], reply["error"]["message"])
+        return reply["result"]
+
+    def call(self, method, *params):
+        """
+        Call a single RPC method
+
+        :return: result of the call
+        :raises RPCError: bitcoind returned an error
+        """
+        payload = {
+            "jsonrpc": "1.0",
+            "id": self._next_id(),
+            "method": method,
+            "params": list(params),
+        }
+        return self._result(self._post(payload))
+
+    def batch(self, calls):
+        """
+        Send several calls in one request
+
+        :param calls: list of method names or (method, params) tuples
+        :return list: results in the order of calls
+        :raises RPCError: first error returned by bitcoind
+        """
+        payload = []
+        for call in calls:
+            method, params = (call, []) if isinstance(call, str) else call
+            payload.append(
+                {
+                    "jsonrpc": "1.0",
+                    "id": self._next_id(),
+                    "method": method,
+                    "params": list(params),
+                }
+            )
+        replies = {reply["id"]: reply for reply in self._post(payload)}
+        return [self._result(replies[item["id"]]) for item in payload]
+
+    def close(self):
+        """Close the kept-alive connection"""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def client():
+    """Return the shared BitcoinRPC client, created on first use"""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = BitcoinRPC()
+        return _CLIENT
+
+
+def call(method, *params):
+    """Call method using the shared client"""
+    return client().call(method, *params)
+
+
+def batch(calls):
+    """Send calls as one batch using the shared client"""
+    return client().batch(calls)
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,341 @@
+"""
+Thermal- and load-aware scheduler for heavy maintenance jobs
+
+Snapshot extraction, permission walks, swap creation and reinstall builds
+compete with lnd for CPU and I/O on a passively cooled Pi. Jobs run one at
+a time across all noma processes. Jobs of one process run in the order they
+were submitted, processes waiting for the job lock take turns in no
+particular order. A job starts once the CPU is cool and the load is low, or
+after SCHEDULER_DEFER seconds. Process jobs run at low CPU and I/O priority
+and are stopped whenever the CPU gets too hot and continued once it cooled
+down, so the firmware does not throttle the clock lnd runs on. In-process
+jobs, like streaming snapshot extraction, sleep between chunks instead.
+Only the temperature pauses a job, the load includes the job itself.
+Durations, pauses and throttle events are kept per job in SCHEDULER_STATS.
+"""
+import fcntl
+import os
+import shutil
+import signal
+import time
+from collections import deque
+from contextlib import contextmanager
+from json import dumps, loads
+from subprocess import Popen, TimeoutExpired
+import noma.config as cfg
+
+
+def temperature():
+    """Return CPU temperature in degrees Celsius, None without a sensor"""
+    from noma import node
+
+    try:
+        return float(node.temp().rstrip("C"))
+    except (OSError, ValueError):
+        return None
+
+
+def load():
+    """Return the 1 minute load average per CPU"""
+    return os.getloadavg()[0] / (os.cpu_count() or 1)
+
+
+def prioritize(
+    args,
+    nice=cfg.SCHEDULER_NICE,
+    ioclass=cfg.SCHEDULER_IOCLASS,
+    iolevel=cfg.SCHEDULER_IOLEVEL,
+):
+    """
+    Prefix a command with nice and ionice, where available
+
+    :param args: command
+    :param nice: niceness, 19 is the lowest priority
+    :param ioclass: ionice class, 2 best-effort or 3 idle
+    :param iolevel: best-effort level, 7 is the lowest priority
+    :return list: command
+    """
+    args = [str(arg) for arg in args]
+    if shutil.which("ionice"):
+        priority = ["-c", str(ioclass)]
+        if ioclass in (1, 2):
+            priority += ["-n", str(iolevel)]
+        args = ["ionice"] + priority + args
+    if nice and shutil.which("nice"):
+        args = ["nice", "-n", str(nice)] + args
+    return args
+
+
+def _signal(process, number):
+    """Signal the process group of a job, if it still exists"""
+    try:
+        os.killpg(process.pid, number)
+    except ProcessLookupError:
+        pass
+
+
+def load_stats(stats_path=""):
+    """Return per-job statistics, empty if missing or unreadable"""
+    if not stats_path:
+        stats_path = cfg.SCHEDULER_STATS
+    try:
+        with open(str(stats_path)) as file:
+            return loads(file.read())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _result(name):
+    return {
+        "name": name,
+        "returncode": None,
+        "output": None,
+        "seconds": 0.0,
+        "deferred": 0.0,
+        "paused": 0.0,
+        "throttles": 0,
+    }
+
+
+def _write_stats(stats, stats_path):
+    temp_path = "{}.{}.tmp".format(stats_path, os.getpid())
+    with open(temp_path, "w") as file:
+        file.write(dumps(stats, indent=2, sort_keys=True))
+    os.replace(temp_path, str(stats_path))
+
+
+class Scheduler:
+    """
+    Run jobs one at a time within thermal and load limits
+
+    :param temperature: function returning degrees Celsius or None
+    :param load: function returning the load average per CPU
+    :param stats_path: JSON file with per-job statistics
+    :param lock_path: file locked while a job runs, shared by noma processes
+    """
+
+    def __init__(
+        self, temperature=temperature, load=load, stats_path="", lock_path=""
+    ):
+        self.temperature = temperature
+        self.load = load
+        self.stats_path = stats_path or cfg.SCHEDULER_STATS
+        self.lock_path = lock_path or cfg.SCHEDULER_LOCK
+        self.start_temp = cfg.SCHEDULER_START_TEMP
+        self.pause_temp = cfg.SCHEDULER_PAUSE_TEMP
+        self.resume_temp = cfg.SCHEDULER_RESUME_TEMP
+        self.start_load = cfg.SCHEDULER_START_LOAD
+        self.poll = cfg.SCHEDULER_POLL
+        self.defer = cfg.SCHEDULER_DEFER
+        self.max_pause = cfg.SCHEDULER_MAX_PAUSE
+        self.queue = deque()
+
+    def submit(self, name, args, **popen):
+        """
+        Queue a job
+
+        :param name: job name statistics are kept under, e.g. fastsync
+        :param args: command
+        :param popen: passed on to Popen, e.g. stdout=PIPE
+        """
+        self.queue.append((name, args, popen))
+
+    def run(self):
+        """
+        Run queued jobs in order
+
+        :return list: result of every job
+        """
+        results = []
+        while self.queue:
+            name, args, popen = self.queue.popleft()
+            results.append(self.run_job(name, args, **popen))
+        return results
+
+    def _cool(self, limit):
+        temp = self.temperature()
+        return temp is None or temp < limit
+
+    def _admit(self, name):
+        """Wait until the CPU is cool and the load low, return seconds"""
+        start = time.monotonic()
+        deferring = False
+        while time.monotonic() - start < self.defer:
+            if self._cool(self.start_temp) and self.load() < self.start_load:
+                break
+            if not deferring:
+                print("Deferring " + name + " until the CPU is cool and idle")
+                deferring = True
+            time.sleep(self.poll)
+        return time.monotonic() - start
+
+    def _supervise(self, name, process, result):
+        """Pause and continue a job by temperature, return its stdout"""
+        paused_at = None
+        while True:
+            try:
+                return process.communicate(timeout=self.poll)[0]
+            except TimeoutExpired:
+                pass
+            now = time.monotonic()
+            if paused_at is None:
+                if not self._cool(self.pause_temp):
+                    _signal(process, signal.SIGSTOP)
+                    paused_at = now
+                    result["throttles"] += 1
+                    print("Pausing {} to let the CPU cool down".format(name))
+            elif (
+                self._cool(self.resume_temp)
+                or now - paused_at >= self.max_pause
+            ):
+                _signal(process, signal.SIGCONT)
+                result["paused"] += now - paused_at
+                paused_at = None
+                print("Resuming " + name)
+
+    def run_job(self, name, args, **popen):
+        """
+        Run a job now, waiting for other jobs and for admission
+
+        :return dict: name, returncode, output and seconds it ran, was
+            deferred and was paused for, and number of throttle events
+        """
+        result = _result(name)
+        with self._turn(name, result):
+            start = time.monotonic()
+            # own process group, so pausing stops the job's children too
+            process = Popen(prioritize(args), start_new_session=True, **popen)
+            try:
+                result["output"] = self._supervise(name, process, result)
+            except BaseException:
+                _signal(process, signal.SIGCONT)
+                _signal(process, signal.SIGTERM)
+                process.wait()
+                raise
+            result["returncode"] = process.returncode
+            result["seconds"] = time.monotonic() - start
+        self._record(result)
+        return result
+
+    @contextmanager
+    def _turn(self, name, result):
+        """Hold the job lock once no other job runs and name is admitted"""
+        with open(str(self.lock_path), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print("Waiting for another maintenance job to finish")
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            result["deferred"] = self._admit(name)
+            yield
+
+    @contextmanager
+    def job(self, name):
+        """
+        Run an in-process job in the with block, e.g. a streaming download
+
+        The block gets a throttle function to call between units of work.
+        It returns at once while the CPU is cool and sleeps until it cooled
+        down otherwise, as a process job would be stopped.
+
+        :param name: job name statistics are kept under
+        """
+        result = _result(name)
+        with self._turn(name, result):
+            start = time.monotonic()
+            checked = start
+
+            def throttle():
+                nonlocal checked
+                now = time.monotonic()
+                if now - checked < self.poll:
+                    return
+                checked = now
+                if self._cool(self.pause_temp):
+                    return
+                result["throttles"] += 1
+                print("Pausing {} to let the CPU cool down".format(name))
+                while (
+                    not self._cool(self.resume_temp)
+                    and time.monotonic() - now < self.max_pause
+                ):
+                    time.sleep(self.poll)
+                checked = time.monotonic()
+                result["paused"] += checked - now
+                print("Resuming " + name)
+
+            result["returncode"] = 1
+            try:
+                yield throttle
+                result["returncode"] = 0
+            finally:
+                result["seconds"] = time.monotonic() - start
+                self._record(result)
+
+    def _record(self, result):
+        stats = load_stats(self.stats_path)
+        entry = stats.setdefault(
+            result["name"],
+            {
+                "runs": 0,
+                "failures": 0,
+                "seconds": 0.0,
+                "deferred": 0.0,
+                "paused": 0.0,
+                "throttles": 0,
+            },
+        )
+        entry["runs"] += 1
+        entry["failures"] += result["returncode"] != 0
+        for key in ("seconds", "deferred", "paused", "throttles"):
+            entry[key] += result[key]
+        entry["last_seconds"] = result["seconds"]
+        entry["last_run"] = time.time()
+        try:
+            _write_stats(stats, self.stats_path)
+        except OSError as error:
+            print(error.__class__.__name__, ":", error)
+
+
+def run(name, args, **popen):
+    """
+    Run one job through the scheduler
+
+    :param name: job name, e.g. fastsync
+    :param args: command
+    :return dict: result of the job, see Scheduler.run_job
+    """
+    scheduler = Scheduler()
+    scheduler.submit(name, args, **popen)
+    return scheduler.run()[0]
+
+
+def print_stats(as_json=False, stats_path=""):
+    """Print per-job statistics as a table or JSON"""
+    stats = load_stats(stats_path)
+    if as_json:
+        print(dumps(stats, sort_keys=True))
+        return stats
+    print(
+        "{:<14}{:>6}{:>9}{:>10}{:>10}{:>10}{:>10}".format(
+            "job", "runs", "failed", "avg s", "last s", "paused s", "throttled"
+        )
+    )
+    for name in sorted(stats):
+        entry = stats[name]
+        print(
+            "{:<14}{:>6}{:>9}{:>10.1f}{:>10.1f}{:>10.1f}{:>10}".format(
+                name,
+                entry["runs"],
+                entry["failures"],
+                entry["seconds"] / entry["runs"],
+                entry["last_seconds"],
+                entry["paused"],
+                entry["throttles"],
+            )
+        )
+    return stats
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,287 @@
+"""
+Share a verified UTXO snapshot with other noma boxes on the LAN
+
+A box that keeps its snapshot tarball can serve it as a Range-capable HTTP
+seed and announce it over mDNS with avahi. fastsync tries LAN seeds before
+the internet mirror. Every source is verified against the pinned
+SNAPSHOT_SHA256 while downloading, so a LAN seed needs no trust.
+"""
+import os
+import re
+import shutil
+import socket
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from subprocess import PIPE, Popen, TimeoutExpired, run
+import noma.config as cfg
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_TXT = re.compile(r'"([^"]*)"')
+
+
+def _stamp(path):
+    info = os.stat(path)
+    return "{} {}".format(info.st_size, info.st_mtime_ns)
+
+
+def record_digest(path, digest):
+    """
+    Keep a digest computed elsewhere, e.g. while downloading, in path.sha256
+
+    :param path: file the digest was computed for
+    :param digest: hex digest
+    """
+    path = str(path)
+    with open(path + ".sha256", "w") as file:
+        file.write("{} {}\n".format(digest, _stamp(path)))
+
+
+def verified_digest(path):
+    """
+    Return SHA-256 digest of path, hashing it only when it has changed
+
+    The digest is kept in path.sha256 together with the size and mtime it
+    was computed for.
+
+    :return str: hex digest
+    """
+    from noma.backup import file_digest
+
+    path = str(path)
+    try:
+        with open(path + ".sha256") as file:
+            digest, cached = file.read().split(" ", 1)
+        if cached.strip() == _stamp(path):
+            return digest
+    except (FileNotFoundError, ValueError):
+        pass
+    print("Verifying " + path)
+    digest = file_digest(path)
+    record_digest(path, digest)
+    return digest
+
+
+class SeedServer(ThreadingMixIn, HTTPServer):
+    """
+    Serve one file over HTTP with Range support
+
+    :param address: (host, port) to listen on
+    :param path: file to serve
+    :param digest: hex SHA-256 digest of the file, used as ETag
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, path, digest):
+        self.path = str(path)
+        self.name = "/" + os.path.basename(self.path)
+        self.size = os.path.getsize(self.path)
+        self.digest = digest
+        # the same on every seed, so a download can resume from another one
+        self.etag = '"sha256-{}"'.format(digest)
+        super().__init__(address, SeedHandler)
+
+
+class SeedHandler(BaseHTTPRequestHandler):
+    """Answer HEAD and GET requests for the seeded file"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _range(self):
+        """
+        Parse a single byte range, None for the whole file
+
+        :return tuple: first and last byte, or None
+        :raises ValueError: range is not satisfiable
+        """
+        size = self.server.size
+        header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if not header or (if_range and if_range != self.server.etag):
+            return None
+        match = _RANGE.match(header.strip())
+        if not match or match.groups() == ("", ""):
+            # multiple or malformed ranges, send the whole file
+            return None
+        first, last = match.groups()
+        if not first:
+            first, last = max(0, size - int(last)), size - 1
+        else:
+            first = int(first)
+            last = min(int(last), size - 1) if last else size - 1
+        if first >= size or first > last:
+            raise ValueError(header)
+        return first, last
+
+    def _headers(self):
+        """Send status and headers, return (offset, count) of the body"""
+        if self.path.split("?")[0] != self.server.name:
+            self.send_error(404)
+            return None
+        size = self.server.size
+        try:
+            byte_range = self._range()
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(size))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        if byte_range is None:
+            self.send_response(200)
+            first, last = 0, size - 1
+        else:
+            self.send_response(206)
+            first, last = byte_range
+            self.send_header(
+                "Content-Range", "bytes {}-{}/{}".format(first, last, size)
+            )
+        self.send_header("Content-Type", "application/x-tar")
+        self.send_header("Content-Length", str(last - first + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", self.server.etag)
+        self.end_headers()
+        return first, last - first + 1
+
+    def do_HEAD(self):
+        self._headers()
+
+    def do_GET(self):
+        body = self._headers()
+        if body is None or not body[1]:
+            return
+        offset, count = body
+        with open(self.server.path, "rb") as file:
+            try:
+                self.connection.sendfile(file, offset, count)
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def _announce(port, digest, name):
+    """Publish the seed over mDNS, None if avahi-publish is missing"""
+    if not shutil.which("avahi-publish"):
+        print("avahi-publish not found, not announcing over mDNS")
+        return None
+    return Popen(
+        [
+            "avahi-publish",
+            "-s",
+            "noma seed on " + socket.gethostname(),
+            cfg.SEED_SERVICE,
+            str(port),
+            "path=" + name,
+            "sha256=" + digest,
+        ]
+    )
+
+
+def serve(path="", port=cfg.SEED_PORT, announce=True):
+    """
+    Serve a verified snapshot to the LAN until interrupted
+
+    :param path: snapshot tarball, SNAPSHOT_PATH by default
+    :param port: TCP port to listen on
+    :param announce: publish the seed over mDNS
+    """
+    if not path:
+        path = cfg.SNAPSHOT_PATH
+    if not os.path.isfile(str(path)):
+        raise FileNotFoundError(
+            "No snapshot at {}, set SNAPSHOT_KEEP to keep it after "
+            "fastsync".format(path)
+        )
+    digest = verified_digest(path)
+    if digest != cfg.SNAPSHOT_SHA256:
+        raise OSError("Not seeding {}, checksum does not match".format(path))
+    server = SeedServer(("", port), path, digest)
+    publisher = _announce(port, digest, server.name) if announce else None
+    print("Seeding {p} on port {n}".format(p=path, n=port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if publisher is not None:
+            publisher.terminate()
+            publisher.wait()
+        server.server_close()
+
+
+def parse_browse(output, sha256=cfg.SNAPSHOT_SHA256):
+    """
+    Parse avahi-browse --parsable output into seed urls
+
+    :param output: text of avahi-browse -rtp
+    :param sha256: only keep seeds announcing this digest
+    :return list: urls of the snapshot on each seed
+    """
+    urls = []
+    for line in output.splitlines():
+        fields = line.split(";")
+        # resolved IPv4: =;iface;IPv4;name;type;domain;host;ip;port;txt
+        if len(fields) < 10 or fields[0] != "=" or fields[2] != "IPv4":
+            continue
+        txt = dict(
+            item.split("=", 1)
+            for item in _TXT.findall(";".join(fields[9:]))
+            if "=" in item
+        )
+        if txt.get("sha256") != sha256 or "path" not in txt:
+            continue
+        url = "http://{a}:{p}{n}".format(
+            a=fields[7], p=fields[8], n=txt["path"]
+        )
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def discover(timeout=cfg.SEED_DISCOVERY_TIMEOUT, sha256=cfg.SNAPSHOT_SHA256):
+    """
+    Find seeds on the LAN over mDNS
+
+    :return list: snapshot urls, empty if avahi-browse is missing
+    """
+    if not shutil.which("avahi-browse"):
+        return []
+    try:
+        result = run(
+            ["avahi-browse", "-rtpk", cfg.SEED_SERVICE],
+            stdout=PIPE,
+            universal_newlines=True,
+            timeout=timeout,
+        )
+    except TimeoutExpired:
+        return []
+    return parse_browse(result.stdout, sha256)
+
+
+def sources(mirror, sha256=cfg.SNAPSHOT_SHA256):
+    """
+    Snapshot urls in order of preference, LAN seeds before the mirror
+
+    :param mirror: internet mirror url, always tried last
+    :return list: urls
+    """
+    name = "/" + cfg.SNAPSHOT_NAME
+    urls = [peer.rstrip("/") + name for peer in cfg.SEED_PEERS]
+    urls += [url for url in discover(sha256=sha256) if url not in urls]
+    return urls + [mirror]
+
+
+def print_seeds():
+    """Print seeds found on the LAN"""
+    seeds = discover()
+    for url in seeds:
+        print(url)
+    if not seeds:
+        print("No seeds found")
+    return seeds
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,182 @@
+"""
+Dependency-ordered shutdown of the compose services
+
+Services are stopped in reverse dependency order from the compose file, so
+the invoicer stops before lnd and lnd before bitcoind. Services that do not
+depend on each other are stopped concurrently. Each service is asked to shut
+down cleanly first, e.g. with lncli stop, and its container's exit event is
+awaited. A service that does not exit in time, or before the overall
+deadline, is stopped with docker stop.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import noma.config as cfg
+from noma import containers
+
+
+def load_graph(compose_path=""):
+    """
+    Read services and their dependencies from a compose file
+
+    :param compose_path: docker-compose.yml, of LND_MODE by default
+    :return dict: service name to set of services it depends on
+    """
+    import yaml
+
+    if not compose_path:
+        compose_path = cfg.COMPOSE_MODE_PATH / "docker-compose.yml"
+    with open(str(compose_path)) as file:
+        compose = yaml.safe_load(file)
+    graph = {}
+    for name, service in (compose.get("services") or {}).items():
+        # depends_on is a list, or a dict in the long syntax
+        graph[name] = set((service or {}).get("depends_on") or ())
+    return graph
+
+
+def _with_dependents(graph, services):
+    """Return services together with everything that depends on them"""
+    selected = set(services)
+    while True:
+        more = {
+            name
+            for name, needs in graph.items()
+            if needs & selected and name not in selected
+        }
+        if not more:
+            return selected
+        selected |= more
+
+
+def _graceful(service, container, grace):
+    """Ask a service to shut down cleanly, return the method used"""
+    if service == "bitcoind":
+        from noma import rpc
+
+        rpc.call("stop")
+        return "rpc stop"
+    command = cfg.SHUTDOWN_COMMANDS.get(service)
+    if command:
+        exit_code, output = container.exec_run(command)
+        if exit_code != 0:
+            raise OSError(output.decode(errors="replace").strip())
+        return " ".join(command)
+    # SIGTERM, killed after grace seconds
+    container.stop(timeout=int(grace))
+    return "docker stop"
+
+
+def stop_service(service, deadline):
+    """
+    Stop one service and wait for its container to exit
+
+    :param service: compose service name
+    :param deadline: time.monotonic() by which the container must be gone
+    :return dict: status (stopped, forced, not running), method, seconds
+    """
+    name = containers.compose_name(service)
+    state = containers.state()
+    start = time.monotonic()
+    if not state.is_running(name):
+        return {"status": "not running", "method": "", "seconds": 0.0}
+    container = containers.client().containers.get(name)
+    timeout = cfg.SHUTDOWN_TIMEOUTS.get(service, cfg.SHUTDOWN_TIMEOUT)
+    grace = max(0, min(start + timeout, deadline) - time.monotonic())
+    try:
+        method = _graceful(service, container, grace)
+        if state.wait(name, running=False, timeout=grace):
+            return {
+                "status": "stopped",
+                "method": method,
+                "seconds": time.monotonic() - start,
+            }
+    except Exception as error:
+        print("{} : {} : {}".format(service, error.__class__.__name__, error))
+        method = "docker stop"
+    # docker stop kills the container after the remaining time
+    container.stop(timeout=int(max(0, deadline - time.monotonic())))
+    state.wait(name, running=False, timeout=cfg.SHUTDOWN_TIMEOUT)
+    return {
+        "status": "forced",
+        "method": method,
+        "seconds": time.monotonic() - start,
+    }
+
+
+def shutdown(
+    services=None, graph=None, deadline=cfg.SHUTDOWN_DEADLINE, dependents=True
+):
+    """
+    Stop services in reverse dependency order, independent ones in parallel
+
+    :param services: services to stop, all services of the compose file by
+        default
+    :param graph: dict as returned by load_graph
+    :param deadline: seconds for the whole shutdown
+    :param dependents: also stop services depending on services
+    :return dict: service name to result of stop_service
+    """
+    if graph is None:
+        try:
+            graph = load_graph()
+        except FileNotFoundError:
+            graph = {}
+    graph = {name: set(needs) for name, needs in graph.items()}
+    for name in services or ():
+        graph.setdefault(name, set())
+    if not services:
+        todo = set(graph)
+    elif dependents:
+        todo = _with_dependents(graph, services)
+    else:
+        todo = set(services)
+    end = time.monotonic() + deadline
+    results = {}
+    running = {}
+
+    def ready():
+        # a service may stop once nothing still running depends on it
+        return [
+            name
+            for name in sorted(todo)
+            if name not in running
+            and not any(name in graph[other] for other in todo - {name})
+        ]
+
+    with ThreadPoolExecutor(max_workers=max(1, len(todo))) as pool:
+        while todo:
+            for name in ready():
+                running[name] = pool.submit(stop_service, name, end)
+            if not running:
+                raise ValueError("Dependency cycle between " + str(todo))
+            done, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name, future in list(running.items()):
+                if future in done:
+                    del running[name]
+                    todo.discard(name)
+                    try:
+                        results[name] = future.result()
+                    except Exception as error:
+                        print(error.__class__.__name__, ":", error)
+                        results[name] = {
+                            "status": "failed",
+                            "method": "",
+                            "seconds": 0.0,
+                        }
+                    print_result(name, results[name])
+    return results
+
+
+def print_result(service, result):
+    """Print how a service stopped"""
+    mark = "✅" if result["status"] in ("stopped", "not running") else "❌"
+    line = "{m} {s:<10}{t}".format(m=mark, s=service, t=result["status"])
+    if result["method"]:
+        line += " with {m} in {s:.1f}s".format(
+            m=result["method"], s=result["seconds"]
+        )
+    print(line, flush=True)
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,284 @@
+"""
+Background hardware telemetry
+
+The Sampler reads temperature, clock, load, CPU, memory and disk I/O
+straight from sysfs and procfs. Every file is opened once and re-read with
+pread, so a sample costs a few system calls and no process. Samples go into
+a RingBuffer that is memory-mapped to TELEMETRY_PATH, so they survive
+restarts and stats() can summarise them from another process.
+"""
+import math
+import os
+import time
+from json import dumps
+import noma.config as cfg
+from noma.ringbuffer import RingBuffer
+
+COLUMNS = (
+    "time",
+    "temp",
+    "freq",
+    "load",
+    "cpu",
+    "memory",
+    "swap",
+    "read",
+    "write",
+)
+# unit of every column shown by stats
+UNITS = {
+    "temp": "C",
+    "freq": "MHz",
+    "load": "",
+    "cpu": "%",
+    "memory": "%",
+    "swap": "MiB",
+    "read": "B/s",
+    "write": "B/s",
+}
+NAN = float("nan")
+
+THERMAL = "/sys/class/thermal/thermal_zone0/temp"
+CPUFREQ = "/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+
+
+class Sampler:
+    """
+    Sample hardware counters into a RingBuffer
+
+    :param path: file to memory-map the samples to, None to keep them in RAM
+    :param capacity: number of samples kept
+    :param device: disk name in /proc/diskstats, e.g. sda1, found from
+        MEDIA_PATH if None
+    """
+
+    def __init__(
+        self, path=None, capacity=cfg.TELEMETRY_SAMPLES, device=None
+    ):
+        if device is None:
+            from noma.progress import _disk_device
+
+            device = _disk_device(cfg.MEDIA_PATH)
+        self.device = device
+        self.samples = RingBuffer(COLUMNS, capacity, path)
+        self.cpu_seconds = 0.0
+        self.started = time.monotonic()
+        self._fds = {}
+        self._previous = None
+
+    def _pread(self, path, size=4096):
+        """Read a file from its start, None if it does not exist"""
+        fd = self._fds.get(path)
+        if fd is None:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                fd = -1
+            self._fds[path] = fd
+        if fd < 0:
+            return None
+        return os.pread(fd, size, 0).decode()
+
+    def _number(self, path, scale):
+        text = self._pread(path, 64)
+        return int(text) / scale if text else NAN
+
+    def _memory(self):
+        """Return used memory in percent and used swap in MiB"""
+        text = self._pread("/proc/meminfo")
+        if not text:
+            return NAN, NAN
+        values = {}
+        for line in text.splitlines():
+            key, _, rest = line.partition(":")
+            values[key] = int(rest.split()[0])
+        used = 100 - 100 * values["MemAvailable"] / values["MemTotal"]
+        swap = (values["SwapTotal"] - values["SwapFree"]) / 1024
+        return used, swap
+
+    def _cpu(self):
+        """Return busy and total jiffies of all CPUs"""
+        text = self._pread("/proc/stat", 256)
+        if not text:
+            return NAN, NAN
+        # user nice system idle iowait irq softirq steal
+        line = text.split("\n", 1)[0]
+        fields = [int(value) for value in line.split()[1:9]]
+        total = sum(fields)
+        return total - fields[3] - fields[4], total
+
+    def _disk(self):
+        """Return bytes read and written by the device"""
+        text = self._pread("/proc/diskstats", 65536)
+        for line in (text or "").splitlines():
+            fields = line.split()
+            if len(fields) > 9 and fields[2] == self.device:
+                return int(fields[5]) * 512, int(fields[9]) * 512
+        return NAN, NAN
+
+    def read(self):
+        """
+        Take one sample, rates are NaN for the first one
+
+        :return dict: a value for every name in COLUMNS
+        """
+        now = time.monotonic()
+        busy, total = self._cpu()
+        read, written = self._disk()
+        memory, swap = self._memory()
+        row = {
+            "time": time.time(),
+            "temp": self._number(THERMAL, 1000),
+            "freq": self._number(CPUFREQ, 1000),
+            "load": float(self._pread("/proc/loadavg", 64).split()[0]),
+            "cpu": NAN,
+            "memory": memory,
+            "swap": swap,
+            "read": NAN,
+            "write": NAN,
+        }
+        if self._previous is not None:
+            last, last_busy, last_total, last_read, last_written = (
+                self._previous
+            )
+            if total > last_total:
+                row["cpu"] = 100 * (busy - last_busy) / (total - last_total)
+            elapsed = now - last
+            if elapsed > 0:
+                row["read"] = (read - last_read) / elapsed
+                row["write"] = (written - last_written) / elapsed
+        self._previous = (now, busy, total, read, written)
+        return row
+
+    def sample(self):
+        """Take a sample, append it and account for its CPU time"""
+        start = time.process_time()
+        self.samples.append(self.read())
+        self.cpu_seconds += time.process_time() - start
+
+    def overhead(self):
+        """Return CPU time spent sampling as percent of elapsed time"""
+        elapsed = time.monotonic() - self.started
+        return 100 * self.cpu_seconds / elapsed if elapsed > 0 else 0.0
+
+    def run(self, interval=cfg.TELEMETRY_INTERVAL, count=None):
+        """
+        Sample every interval seconds until interrupted
+
+        :param count: stop after this many samples
+        """
+        deadline = time.monotonic()
+        taken = 0
+        try:
+            while count is None or taken < count:
+                self.sample()
+                taken += 1
+                if taken % cfg.TELEMETRY_FLUSH == 0:
+                    self.samples.flush()
+                deadline += interval
+                time.sleep(max(0, deadline - time.monotonic()))
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        """Close files and unmap the samples"""
+        for fd in self._fds.values():
+            if fd >= 0:
+                os.close(fd)
+        self._fds = {}
+        self.samples.close()
+
+
+def percentile(values, percent):
+    """
+    Return percentile of sorted values, interpolating between ranks
+
+    :param values: sorted list of numbers
+    :param percent: 0 to 100
+    """
+    if not values:
+        return None
+    rank = (len(values) - 1) * percent / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def stats(
+    samples, window=cfg.TELEMETRY_WINDOW, percents=cfg.TELEMETRY_PERCENTILES
+):
+    """
+    Summarise samples of the last window seconds
+
+    :param samples: RingBuffer with COLUMNS
+    :param window: seconds before the newest sample
+    :param percents: percentiles to compute
+    :return dict: column to min, max, mean, percentiles and sample count
+    """
+    times = samples.column("time")
+    if not times:
+        return {}
+    first = next(
+        index for index, value in enumerate(times)
+        if value >= times[-1] - window
+    )
+    result = {}
+    for name in COLUMNS[1:]:
+        values = sorted(
+            value
+            for value in samples.column(name)[first:]
+            if not math.isnan(value)
+        )
+        summary = {"samples": len(values)}
+        if values:
+            summary["min"] = values[0]
+            summary["max"] = values[-1]
+            summary["mean"] = sum(values) / len(values)
+            for percent in percents:
+                summary["p{}".format(percent)] = percentile(values, percent)
+        result[name] = summary
+    return result
+
+
+def record(interval=cfg.TELEMETRY_INTERVAL, path=""):
+    """Sample to TELEMETRY_PATH until interrupted"""
+    if not path:
+        path = cfg.TELEMETRY_PATH
+    sampler = Sampler(path)
+    print("Sampling every {i}s to {p}".format(i=interval, p=path))
+    try:
+        sampler.run(interval)
+    finally:
+        print("Sampler used {:.3f}% CPU".format(sampler.overhead()))
+        sampler.close()
+
+
+def print_stats(window=cfg.TELEMETRY_WINDOW, as_json=False, path=""):
+    """Print stats of the recorded samples as a table or JSON"""
+    if not path:
+        path = cfg.TELEMETRY_PATH
+    with RingBuffer(
+        COLUMNS, cfg.TELEMETRY_SAMPLES, path, readonly=True
+    ) as samples:
+        summary = stats(samples, window)
+    if as_json:
+        print(dumps(summary, sort_keys=True))
+        return summary
+    keys = ["min"] + [
+        "p{}".format(percent) for percent in cfg.TELEMETRY_PERCENTILES
+    ] + ["max"]
+    print("{:<8}{:>6}".format("", "n") + "".join(
+        "{:>12}".format(key) for key in keys))
+    for name, values in summary.items():
+        line = "{:<8}{:>6}".format(name, values["samples"])
+        for key in keys:
+            if key in values:
+                line += "{:>12.1f}".format(values[key])
+            else:
+                line += "{:>12}".format("-")
+        print((line + " " + UNITS[name]).rstrip())
+    return summary
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,390 @@
+"""
+Hardware-aware tuning of bitcoind and lnd settings
+
+profile() measures RAM, cores, free space and throughput of the archive
+drive, recommend() turns that into bitcoin.conf and lnd.conf settings and
+tune() shows them as a diff or writes each file in one atomic edit. With a
+benchmark, the sync rate is measured before and after bitcoind is restarted
+with the new settings.
+"""
+import difflib
+import os
+import shutil
+import time
+from subprocess import call
+import noma.config as cfg
+from noma import conf
+
+MIB = 1048576
+# first lnd release knowing each tuned option, lnd refuses unknown options
+LND_OPTIONS = {
+    "workers.sig": (0, 6, 0),
+    "workers.write": (0, 6, 0),
+    "caches.channel-cache-size": (0, 8, 0),
+    "caches.reject-cache-size": (0, 8, 0),
+}
+
+
+def _clamp(value, low, high):
+    return int(max(low, min(high, value)))
+
+
+def _blocks_size(bitcoin_path):
+    """Return MiB used by block and undo files"""
+    total = 0
+    try:
+        with os.scandir(os.path.join(str(bitcoin_path), "blocks")) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except FileNotFoundError:
+        pass
+    return total // MIB
+
+
+def measure_throughput(directory, size=cfg.TUNE_TEST_SIZE):
+    """
+    Measure sequential write and uncached read speed of a drive
+
+    A temporary file is written and synced, dropped from the page cache and
+    read back.
+
+    :param directory: directory on the drive
+    :param size: bytes to write
+    :return tuple: write and read speed in MB/s
+    """
+    path = os.path.join(str(directory), ".noma-throughput")
+    block = os.urandom(MIB)
+    fd = os.open(path, os.O_CREAT | os.O_TRUNC | os.O_RDWR, 0o600)
+    try:
+        start = time.monotonic()
+        for _ in range(max(1, size // MIB)):
+            os.write(fd, block)
+        os.fsync(fd)
+        written = time.monotonic() - start
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.lseek(fd, 0, os.SEEK_SET)
+        start = time.monotonic()
+        while os.read(fd, MIB):
+            pass
+        read = time.monotonic() - start
+    finally:
+        os.close(fd)
+        os.remove(path)
+    total = max(1, size // MIB) * MIB / 1e6
+    return total / max(written, 1e-6), total / max(read, 1e-6)
+
+
+def lnd_version(compose_path=""):
+    """
+    Return version of the lnd image in the compose file
+
+    :param compose_path: docker-compose.yml, of LND_MODE by default
+    :return tuple: e.g. (0, 7, 1), None if unknown
+    """
+    import re
+    import yaml
+
+    if not compose_path:
+        compose_path = cfg.COMPOSE_MODE_PATH / "docker-compose.yml"
+    try:
+        with open(str(compose_path)) as file:
+            compose = yaml.safe_load(file)
+    except FileNotFoundError:
+        return None
+    service = (compose.get("services") or {}).get("lnd") or {}
+    match = re.search(r":v?(\d+)\.(\d+)\.(\d+)", service.get("image", ""))
+    if not match:
+        return None
+    return tuple(int(number) for number in match.groups())
+
+
+def profile(bitcoin_path=cfg.BITCOIN_PATH, config_path=""):
+    """
+    Profile the hardware noma runs on
+
+    :param bitcoin_path: bitcoind data directory
+    :param config_path: bitcoin.conf, for the current prune target
+    :return dict: ram, swap, disk sizes in MiB, cores, speeds in MB/s,
+        prune target and lnd version
+    """
+    from noma import node
+    from noma.usb import fs_size
+
+    directory = str(bitcoin_path)
+    if not os.path.isdir(directory):
+        directory = str(cfg.MEDIA_PATH)
+    write, read = measure_throughput(directory)
+    if not config_path:
+        config_path = cfg.BITCOIN_CONF
+    try:
+        prune = conf.load(config_path, conf.BitcoinConfig).lookup("prune")
+    except (FileNotFoundError, KeyError):
+        # no prune line, bitcoind keeps the full chain
+        prune = None
+    return {
+        "ram": node.get_ram(),
+        "swap": node.get_swap(),
+        "cores": os.cpu_count() or 1,
+        "disk_total": fs_size(directory) // MIB,
+        "disk_free": shutil.disk_usage(directory).free // MIB,
+        "blocks_size": _blocks_size(bitcoin_path),
+        "write_speed": write,
+        "read_speed": read,
+        "prune": int(prune or 0),
+        "lnd_version": lnd_version(),
+    }
+
+
+def _disk_budget(hardware):
+    """Return MiB the chain may use on the archive drive"""
+    return (hardware["disk_free"] + hardware["blocks_size"]) * (
+        cfg.TUNE_DISK_SHARE
+    )
+
+
+def recommend(hardware, allow_prune=False):
+    """
+    Derive bitcoind and lnd settings from a hardware profile
+
+    A chain that is pruned already is never set to unpruned, as that would
+    require downloading the whole chain again. A full chain is only pruned
+    with allow_prune, as pruning discards blocks for good. lnd options are
+    only recommended if the lnd version is known to support them.
+
+    :param hardware: dict as returned by profile()
+    :param allow_prune: prune a full chain that does not fit the drive
+    :return tuple: bitcoin.conf settings, lnd.conf settings by section
+    """
+    ram, cores = hardware["ram"], hardware["cores"]
+    # a larger UTXO cache means fewer chainstate flushes to a slow drive
+    if hardware["write_speed"] < cfg.TUNE_SLOW_DISK:
+        share = cfg.TUNE_DBCACHE_SHARE_SLOW
+    else:
+        share = cfg.TUNE_DBCACHE_SHARE
+    budget = _disk_budget(hardware)
+    if hardware["prune"] or (allow_prune and budget < cfg.TUNE_FULL_CHAIN):
+        prune = _clamp(budget, 550, budget)
+    else:
+        prune = 0
+    bitcoind = {
+        "dbcache": _clamp(ram * share, 100, 4096),
+        # leave one core to lnd
+        "par": max(1, cores - 1),
+        "maxmempool": _clamp(ram / 20, 50, 300),
+        "maxconnections": _clamp(ram / 32, 16, 125),
+        "prune": prune,
+    }
+    options = {
+        "Application Options": {
+            "caches.channel-cache-size": _clamp(ram * 5, 1000, 20000),
+            "caches.reject-cache-size": _clamp(ram * 12, 5000, 50000),
+        },
+        "workers": {
+            "workers.sig": cores,
+            "workers.write": _clamp(cores * 2, 2, 8),
+        },
+    }
+    version = hardware.get("lnd_version")
+    lnd = {}
+    for section, pairs in options.items():
+        supported = {
+            key: value
+            for key, value in pairs.items()
+            if version and version >= LND_OPTIONS[key]
+        }
+        if supported:
+            lnd[section] = supported
+    return bitcoind, lnd
+
+
+def _plan(config_path, document, settings):
+    """
+    Apply settings to a copy of config_path
+
+    :param settings: dict of section to dict of keys and values
+    :return tuple: old text, new text
+    """
+    try:
+        doc = conf.load(config_path, document)
+    except FileNotFoundError:
+        doc = document()
+    old = doc.text()
+    for section, pairs in settings.items():
+        for key, value in pairs.items():
+            doc.set(section, key, value)
+    return old, doc.text()
+
+
+def diff(config_path, document, settings):
+    """
+    Return a unified diff of the changes settings make to config_path
+
+    :return str: diff, empty if nothing would change
+    """
+    old, new = _plan(config_path, document, settings)
+    return "".join(
+        difflib.unified_diff(
+            old.splitlines(True),
+            new.splitlines(True),
+            str(config_path),
+            str(config_path) + " (tuned)",
+        )
+    )
+
+
+def apply(config_path, document, settings):
+    """
+    Write settings to config_path in one atomic edit
+
+    :return bool: file changed
+    """
+    with conf.edit(config_path, document) as doc:
+        for section, pairs in settings.items():
+            for key, value in pairs.items():
+                doc.set(section, key, value)
+        changed = doc.changed
+    return changed
+
+
+def _wait_for_rpc(timeout=cfg.TUNE_RESTART_TIMEOUT):
+    """Wait until bitcoind answers RPC calls, e.g. after a restart"""
+    from requests.exceptions import RequestException
+    from noma import rpc
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            rpc.call("getblockcount")
+            return True
+        except (rpc.RPCError, RequestException):
+            # RPC error -28 while bitcoind loads its block index
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(5)
+
+
+def sync_rate(duration=cfg.TUNE_DURATION):
+    """
+    Measure sync rate over duration seconds
+
+    :return dict: summary from progress.summary
+    """
+    from noma import progress
+    from noma.ringbuffer import RingBuffer
+
+    samples = RingBuffer(
+        progress.COLUMNS, int(duration // cfg.PROGRESS_INTERVAL) + 2
+    )
+    device = progress._disk_device(cfg.BITCOIN_PATH)
+    samples.append(progress.sample(device))
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        time.sleep(max(0, min(cfg.PROGRESS_INTERVAL, end - time.monotonic())))
+        samples.append(progress.sample(device))
+    return progress.summary(samples)
+
+
+def _restart_bitcoind():
+    """Restart bitcoind and give it time to flush its cache"""
+    from noma.containers import compose_name
+
+    print("Restarting bitcoind")
+    call(
+        [
+            "docker",
+            "restart",
+            "-t",
+            str(cfg.TUNE_RESTART_TIMEOUT),
+            compose_name("bitcoind"),
+        ]
+    )
+    if not _wait_for_rpc():
+        raise TimeoutError("bitcoind RPC did not come back after restart")
+
+
+def print_profile(hardware):
+    """Print hardware profile as a table"""
+    print(
+        "{:<20}{} MiB, {} MiB swap".format(
+            "RAM", hardware["ram"], hardware["swap"]
+        )
+    )
+    print("{:<20}{}".format("cores", hardware["cores"]))
+    version = hardware.get("lnd_version")
+    print(
+        "{:<20}{}".format(
+            "lnd", ".".join(map(str, version)) if version else "unknown"
+        )
+    )
+    print(
+        "{:<20}{} of {} MiB free, blocks use {} MiB".format(
+            "archive drive",
+            hardware["disk_free"],
+            hardware["disk_total"],
+            hardware["blocks_size"],
+        )
+    )
+    print(
+        "{:<20}write {:.1f} MB/s, read {:.1f} MB/s".format(
+            "throughput", hardware["write_speed"], hardware["read_speed"]
+        )
+    )
+
+
+def tune(
+    dry_run=False, benchmark=False, duration=cfg.TUNE_DURATION, prune=False
+):
+    """
+    Profile hardware and tune bitcoin.conf and lnd.conf
+
+    :param dry_run: only print the changes as a diff
+    :param benchmark: measure sync rate before and after restarting bitcoind
+    :param duration: seconds to measure sync rate for
+    :param prune: allow pruning a full chain that does not fit the drive
+    :return tuple: bitcoin.conf settings, lnd.conf settings by section
+    """
+    hardware = profile()
+    print_profile(hardware)
+    bitcoind, lnd = recommend(hardware, allow_prune=prune)
+    if not bitcoind["prune"] and _disk_budget(hardware) < cfg.TUNE_FULL_CHAIN:
+        print("Warning: the full chain does not fit the archive drive")
+        print("Use --prune to enable pruning, which discards old blocks")
+    files = (
+        (cfg.BITCOIN_CONF, conf.BitcoinConfig, {"": bitcoind}),
+        (cfg.LND_CONF, conf.ConfigDocument, lnd),
+    )
+    if dry_run:
+        for config_path, document, settings in files:
+            changes = diff(config_path, document, settings)
+            print(changes or "{} is tuned already".format(config_path))
+        return bitcoind, lnd
+
+    before = None
+    if benchmark:
+        print("Measuring sync rate for {:.0f}s".format(duration))
+        before = sync_rate(duration)
+    for config_path, document, settings in files:
+        if apply(config_path, document, settings):
+            print("Updated " + str(config_path))
+        else:
+            print("{} is tuned already".format(config_path))
+    if not benchmark:
+        print("Restart bitcoind and lnd for the new settings to take effect")
+        return bitcoind, lnd
+
+    print("Restart lnd for its new settings to take effect")
+    _restart_bitcoind()
+    print("Measuring sync rate for {:.0f}s".format(duration))
+    after = sync_rate(duration)
+    for name, state in (("before", before), ("after", after)):
+        print(
+            "{:<20}{:.1f} blocks/min".format(
+                name, state["average_blocks_per_minute"] or 0
+            )
+        )
+    return bitcoind, lnd
+
+
+if __name__ == "__main__":
+    print("This file is not meant to be run directly")
@@ -0,0 +1,105 @@
+"""Test change-aware channel.backup shipping"""
+import os
+import pathlib
+import platform
+import select
+import tempfile
+import unittest
+from subprocess import CompletedProcess
+from unittest import mock
+from noma import backup
+
+
+class ShipTests(unittest.TestCase):
+    """Test the ship() function"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "channel.backup")
+        self.manifest = os.path.join(self.tmp.name, "backup.json")
+        with open(self.source, "wb") as file:
+            file.write(b"first")
+        control_path = pathlib.Path(self.tmp.name) / "ssh" / "noma-%r@%h:%p"
+        patcher = mock.patch("noma.config.SSH_CONTROL_PATH", control_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @mock.patch("noma.backup.run")
+    def test_skips_unchanged(self, m_run):
+        """
+        Test that ship():
+            - uploads a new channel.backup and rotates remote versions
+            - skips the upload while the file is unchanged
+            - uploads again once the content changes
+        """
+        m_run.return_value = CompletedProcess([], 0, stdout=b"")
+
+        self.assertEqual(backup.ship(self.source, self.manifest), 0)
+        self.assertEqual(m_run.call_count, 2)
+        scp = m_run.mock_calls[0][1][0]
+        self.assertEqual(scp[0], "scp")
+        self.assertIn("ControlMaster=auto", scp)
+
+        self.assertEqual(backup.ship(self.source, self.manifest), 0)
+        self.assertEqual(m_run.call_count, 2)
+        manifest = backup.load_manifest(self.manifest)
+        self.assertEqual(manifest["skipped"], 1)
+        self.assertEqual(manifest["saved_bytes"], 5)
+
+        with open(self.source, "wb") as file:
+            file.write(b"second")
+        self.assertEqual(backup.ship(self.source, self.manifest), 0)
+        self.assertEqual(m_run.call_count, 4)
+        manifest = backup.load_manifest(self.manifest)
+        self.assertEqual(len(manifest["versions"]), 2)
+        self.assertEqual(manifest["sha256"], backup.file_digest(self.source))
+
+    @mock.patch("noma.backup.run")
+    def test_failed_upload_not_recorded(self, m_run):
+        """Test that a failed upload is retried on the next run"""
+        m_run.return_value = CompletedProcess([], 1)
+        self.assertEqual(backup.ship(self.source, self.manifest), 1)
+        self.assertEqual(backup.load_manifest(self.manifest)["sha256"], "")
+
+    @mock.patch("noma.backup.run")
+    def test_rotate_quotes_paths(self, m_run):
+        """Test that remote paths are quoted, except for a leading ~/"""
+        backup.rotate_remote("x; rm -rf ~", target="host:my backups")
+        command = m_run.mock_calls[0][1][0][-1]
+        self.assertTrue(command.startswith("cd 'my backups' && cp -p 'x; rm"))
+        backup.rotate_remote("latest", target="host:~/noma backups")
+        command = m_run.mock_calls[1][1][0][-1]
+        self.assertTrue(command.startswith("cd ~/'noma backups' && cp"))
+        backup.rotate_remote("latest", target="host:~/backups")
+        command = m_run.mock_calls[2][1][0][-1]
+        self.assertTrue(command.startswith("cd ~/backups && cp"))
+
+
+@unittest.skipUnless(platform.system() == "Linux", "requires inotify")
+class WatchTests(unittest.TestCase):
+    """Test inotify helpers used by watch()"""
+
+    def test_reports_written_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fd = backup._inotify_watch(
+                directory, backup.IN_CLOSE_WRITE | backup.IN_MOVED_TO
+            )
+            try:
+                temp_path = os.path.join(directory, "channel.backup.tmp")
+                with open(temp_path, "wb") as file:
+                    file.write(b"data")
+                os.replace(
+                    temp_path, os.path.join(directory, "channel.backup")
+                )
+                readable, _, _ = select.select([fd], [], [], 1)
+                self.assertTrue(readable)
+                self.assertIn("channel.backup", backup._read_names(fd))
+            finally:
+                os.close(fd)
+
+
+if __name__ == "__main__":
+    unittest.main()
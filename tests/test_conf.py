@@ -0,0 +1,165 @@
+"""Test comment-preserving config model"""
+import os
+import pathlib
+import shutil
+import tempfile
+import unittest
+from noma import bitcoind
+from noma import conf
+from noma import lnd
+
+SHIPPED_LND_CONF = (
+    pathlib.Path(__file__).parent.parent / "lnd" / "neutrino" / "lnd.conf"
+)
+SHIPPED_BITCOIN_CONF = (
+    pathlib.Path(__file__).parent.parent / "bitcoind" / "bitcoind.conf"
+)
+
+
+class ConfigDocumentTests(unittest.TestCase):
+    """Test ConfigDocument edits"""
+
+    def test_roundtrip(self):
+        text = SHIPPED_LND_CONF.read_text()
+        self.assertEqual(conf.ConfigDocument(text).text(), text)
+
+    def test_repeated_keys(self):
+        doc = conf.ConfigDocument(SHIPPED_LND_CONF.read_text())
+        self.assertEqual(len(doc.get_all("Neutrino", "neutrino.connect")), 3)
+        doc.add("Neutrino", "neutrino.connect", "node.example.com")
+        self.assertEqual(
+            doc.get_all("Neutrino", "neutrino.connect")[-1],
+            "node.example.com",
+        )
+        doc.set_all("Neutrino", "neutrino.connect", ["a", "b"])
+        self.assertEqual(
+            doc.get_all("Neutrino", "neutrino.connect"), ["a", "b"]
+        )
+        lines = doc.text().splitlines()
+        self.assertEqual(
+            lines[lines.index("[Neutrino]") + 1], "neutrino.connect=a"
+        )
+
+    def test_set_keeps_comments(self):
+        doc = conf.ConfigDocument("; comment\n[A]\n; key=default\nother=1\n")
+        doc.set("A", "key", "2")
+        doc.set("A", "other", "3")
+        doc.set("B", "new", "4")
+        self.assertEqual(
+            doc.text(),
+            "; comment\n[A]\n; key=default\nkey=2\nother=3\n\n[B]\nnew=4\n",
+        )
+        self.assertEqual(doc.get("A", "key"), "2")
+        with self.assertRaises(KeyError):
+            doc.get("A", "missing")
+
+    def test_unchanged_set(self):
+        doc = conf.ConfigDocument("[A]\nkey = 1\n")
+        doc.set("A", "key", 1)
+        self.assertFalse(doc.changed)
+        doc.set("A", "key", 2)
+        self.assertEqual(doc.text(), "[A]\nkey = 2\n")
+
+
+class EditTests(unittest.TestCase):
+    """Test cached loading and atomic batched writes"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "lnd.conf")
+        shutil.copy(str(SHIPPED_LND_CONF), self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_set_bitcoind_single_write(self):
+        lnd.set_bitcoind("secret", lnd_config=self.path)
+        self.assertEqual(
+            lnd.get_kv("bitcoind.rpcpass", "Bitcoind", self.path), "secret"
+        )
+        self.assertEqual(
+            lnd.get_kv("bitcoind.rpcuser", "Bitcoind", self.path), "lncm"
+        )
+        text = pathlib.Path(self.path).read_text()
+        self.assertIn("; The alias your node will use", text)
+        self.assertEqual(text.count("neutrino.connect="), 3)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_failed_batch_writes_nothing(self):
+        before = pathlib.Path(self.path).read_text()
+        with self.assertRaises(RuntimeError):
+            with conf.edit(self.path) as doc:
+                doc.set("Application Options", "alias", "changed")
+                raise RuntimeError
+        self.assertEqual(pathlib.Path(self.path).read_text(), before)
+
+    def test_cache_sees_external_changes(self):
+        self.assertEqual(
+            lnd.get_kv("alias", config_path=self.path), "LNCM Neutrino"
+        )
+        with open(self.path, "a") as file:
+            file.write("\n[Extra]\nkey=value\n")
+        self.assertEqual(lnd.get_kv("key", "Extra", self.path), "value")
+
+
+class BitcoinConfigTests(unittest.TestCase):
+    """Test BitcoinConfig and the bitcoind config helpers"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "bitcoin.conf")
+        shutil.copy(str(SHIPPED_BITCOIN_CONF), self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_multi_valued(self):
+        text = SHIPPED_BITCOIN_CONF.read_text()
+        doc = conf.BitcoinConfig(text)
+        # the shipped file lacks a final newline, which is added
+        self.assertEqual(doc.text(), text + "\n")
+        self.assertEqual(len(doc.lookup_all("rpcallowip")), 6)
+        self.assertEqual(doc.lookup("rpcallowip"), "172.18.0.0/16")
+        with self.assertRaises(ValueError):
+            doc.set("", "rpcallowip", "127.0.0.1")
+
+    def test_networks(self):
+        doc = conf.BitcoinConfig(
+            "prune=550\nprune=1000\nrpcport=8332\n[test]\nprune=2000\n"
+        )
+        self.assertEqual(doc.lookup("prune"), "550")
+        self.assertEqual(doc.lookup("prune", "test"), "2000")
+        self.assertEqual(doc.lookup("rpcport", "main"), "8332")
+        with self.assertRaises(KeyError):
+            doc.lookup("rpcport", "test")
+
+    def test_set_rpcauth(self):
+        """
+        Test that set_rpcauth() fills the placeholder, then replaces only
+        the rpcauth line of the same user
+        """
+        doc = conf.BitcoinConfig(SHIPPED_BITCOIN_CONF.read_text())
+        doc.set_rpcauth("other:salt$hash")
+        self.assertNotIn("GENERATEDRPCAUTH", doc.text())
+        doc.set_rpcauth("lncm:newsalt$newhash")
+        self.assertEqual(
+            doc.lookup_all("rpcauth"),
+            ["lncm:newsalt$newhash", "other:salt$hash"],
+        )
+
+    def test_set_kvs(self):
+        """
+        Test that editing a value leaves other lines containing the same
+        substring alone and writes the file once
+        """
+        bitcoind.set_kvs({"prune": 5000, "maxmempool": 100}, self.path)
+        self.assertEqual(bitcoind.get_kv("prune", self.path), "5000")
+        self.assertEqual(bitcoind.get_kv("maxmempool", self.path), "100")
+        text = pathlib.Path(self.path).read_text()
+        self.assertIn("greater than 550 = automatically prune", text)
+        self.assertEqual(text.count("\nprune="), 1)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
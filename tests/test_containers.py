@@ -0,0 +1,120 @@
+"""Test event-driven container state"""
+import queue
+import threading
+import unittest
+from collections import namedtuple
+from noma import containers
+
+Container = namedtuple("Container", "name id status attrs")
+
+
+class EventStream:
+    """Stands in for docker's CancellableStream of decoded events"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            if isinstance(event, Exception):
+                raise event
+            yield event
+
+    def close(self):
+        self.queue.put(None)
+
+
+class StandInDocker:
+    """Docker client answering container listings and events"""
+
+    def __init__(self, listing):
+        self.listing = listing
+        self.lists = 0
+        self.streams = []
+        self.containers = self
+
+    def list(self, all=False):
+        self.lists += 1
+        return list(self.listing)
+
+    def events(self, since=None, decode=False, filters=None):
+        stream = EventStream()
+        self.streams.append(stream)
+        return stream
+
+
+def event(action, name, time=100):
+    return {
+        "Type": "container",
+        "Action": action,
+        "Actor": {"ID": "id-" + name, "Attributes": {"name": name}},
+        "time": time,
+        "timeNano": time * 1000000000,
+    }
+
+
+class ContainerStateTests(unittest.TestCase):
+    """Test ContainerState against a stand-in Docker client"""
+
+    def setUp(self):
+        started = {"State": {"StartedAt": "2019-03-01T12:00:00.5Z"}}
+        never = {"State": {"StartedAt": "0001-01-01T00:00:00Z"}}
+        self.docker = StandInDocker(
+            [
+                Container("neutrino_lnd_1", "id-lnd", "running", started),
+                Container("neutrino_tor_1", "id-tor", "created", never),
+            ]
+        )
+        self.state = containers.ContainerState(self.docker)
+
+    def tearDown(self):
+        self.state.close()
+
+    def test_seed_and_events(self):
+        """
+        Test that:
+            - the table is seeded by one listing and answers lookups
+            - events update and remove containers
+            - wait() returns once the awaited event arrives
+        """
+        self.assertTrue(self.state.is_running("neutrino_lnd_1"))
+        self.assertEqual(self.state.started_at("neutrino_lnd_1"), 1551441600.5)
+        self.assertIsNone(self.state.started_at("neutrino_tor_1"))
+        self.assertIsNone(self.state.status("neutrino_bitcoind_1"))
+        self.assertFalse(
+            self.state.wait("neutrino_lnd_1", running=False, timeout=0.01)
+        )
+        stream = self.docker.streams[0]
+        stopper = threading.Timer(
+            0.05, stream.queue.put, [event("die", "neutrino_lnd_1")]
+        )
+        stopper.start()
+        self.assertTrue(
+            self.state.wait("neutrino_lnd_1", running=False, timeout=5)
+        )
+        self.assertEqual(self.state.status("neutrino_lnd_1"), "exited")
+        stream.queue.put(event("start", "neutrino_bitcoind_1", time=200))
+        stream.queue.put(event("destroy", "neutrino_tor_1"))
+        self.assertTrue(self.state.wait("neutrino_bitcoind_1", timeout=5))
+        self.assertEqual(self.state.started_at("neutrino_bitcoind_1"), 200)
+        self.assertEqual(
+            sorted(self.state.containers()),
+            ["neutrino_bitcoind_1", "neutrino_lnd_1"],
+        )
+        self.assertEqual(self.docker.lists, 1)
+
+    def test_reseed_after_broken_stream(self):
+        self.assertEqual(self.state.status("neutrino_tor_1"), "created")
+        self.docker.listing = [
+            Container("neutrino_tor_1", "id-tor", "running", {"State": {}})
+        ]
+        self.docker.streams[0].queue.put(ConnectionError("dockerd restarted"))
+        self.assertTrue(self.state.wait("neutrino_tor_1", timeout=5))
+        self.assertIsNone(self.state.status("neutrino_lnd_1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
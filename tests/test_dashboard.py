@@ -0,0 +1,84 @@
+"""Test concurrent, cached dashboard"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from noma import dashboard
+
+
+class GatherTests(unittest.TestCase):
+    """Test gather() with stand-in sources"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = os.path.join(self.tmp.name, "info.json")
+        self.calls = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def source(self, name, value, delay=0.0):
+        def function():
+            self.calls.append(name)
+            time.sleep(delay)
+            return value
+
+        return function
+
+    def forking(self):
+        self.calls.append("fork")
+        return int(dashboard._run([sys.executable, "-c", "print(42)"]))
+
+    def failing(self):
+        raise OSError("vcgencmd missing")
+
+    def gather(self):
+        return dashboard.gather(
+            {
+                "fast": self.source("fast", {"a": 1}, 0.2),
+                "slow": self.source("slow", 1, 0.2),
+                "hang": self.source("hang", 2, 5),
+                "fork": self.forking,
+                "fail": self.failing,
+            },
+            cache_path=self.cache,
+            ttls={"slow": 60, "fork": 60, "hang": 60},
+            timeouts={"hang": 0.5, "fork": 10},
+        )
+
+    def test_gather(self):
+        """
+        Test that gather():
+            - runs sources concurrently and times out hanging ones
+            - caches values of sources with a TTL across calls
+            - reports errors, forks and cached sources
+        """
+        start = time.monotonic()
+        info = self.gather()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(info["fast"], {"a": 1})
+        self.assertEqual(info["fork"], 42)
+        self.assertEqual(info["hang"], {"error": "timeout"})
+        self.assertEqual(info["fail"], {"error": "OSError: vcgencmd missing"})
+        self.assertEqual(info["meta"]["forks"], 1)
+        self.assertEqual(info["meta"]["cached"], [])
+        self.assertEqual(
+            list(info), ["fast", "slow", "hang", "fork", "fail", "meta"]
+        )
+        with open(self.cache) as file:
+            self.assertEqual(sorted(json.load(file)), ["fork", "slow"])
+
+        self.calls = []
+        info = self.gather()
+        self.assertEqual(sorted(self.calls), ["fast", "hang"])
+        self.assertEqual(info["slow"], 1)
+        self.assertEqual(info["meta"]["forks"], 0)
+        self.assertEqual(info["meta"]["cached"], ["slow", "fork"])
+        self.assertIn("gathered in", dashboard.render(info))
+        self.assertIn("  a                     1", dashboard.render(info))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+"""Test resumable multi-connection downloader"""
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from noma.download import Download, Extract
+
+PAYLOAD = os.urandom(1000000)
+DIGEST = hashlib.sha256(PAYLOAD).hexdigest()
+CHUNK = 65536
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server standing in for the snapshot host"""
+
+    daemon_threads = True
+    payload = PAYLOAD
+    failures = {}
+    requested = []
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serve PAYLOAD with Range support and injected failures"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.payload)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", '"snapshot"')
+        self.end_headers()
+
+    def do_GET(self):
+        payload = self.server.payload
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        start, end = int(match.group(1)), int(match.group(2)) + 1
+        self.server.requested.append(start)
+        self.send_response(206)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header(
+            "Content-Range",
+            "bytes {}-{}/{}".format(start, end - 1, len(payload)),
+        )
+        self.end_headers()
+        if self.server.failures.get(start // CHUNK, 0):
+            self.server.failures[start // CHUNK] -= 1
+            # drop the connection halfway through the chunk
+            self.wfile.write(payload[start:start + (end - start) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(payload[start:end])
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInTestCase(unittest.TestCase):
+    """Run a local stand-in server and provide a temporary directory"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(("127.0.0.1", 0), StandInHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:{}/snapshot.tar".format(
+            cls.server.server_port
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.target = os.path.join(self.tmp.name, "snapshot.tar")
+        self.server.payload = PAYLOAD
+        self.server.failures.clear()
+        del self.server.requested[:]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+class DownloadTests(StandInTestCase):
+    """Test Download against a local stand-in server"""
+
+    def download(self, retries=2, sha256=DIGEST):
+        download = Download(
+            self.url,
+            self.target,
+            sha256=sha256,
+            jobs=4,
+            chunk_size=CHUNK,
+            retries=retries,
+            backoff=0,
+        )
+        download.run()
+        return download
+
+    def test_retry(self):
+        """
+        Test that a chunk cut off mid-transfer is requested again and the
+        state file is removed when complete
+        """
+        self.server.failures[3] = 1
+        self.download()
+        with open(self.target, "rb") as file:
+            self.assertEqual(file.read(), PAYLOAD)
+        self.assertFalse(os.path.exists(self.target + ".state"))
+        retried = [
+            start for start in self.server.requested if start // CHUNK == 3
+        ]
+        self.assertEqual(len(retried), 2)
+
+    def test_resume(self):
+        """
+        Test that a download failing after bounded retries resumes with the
+        missing chunks only
+        """
+        self.server.failures[5] = 10
+        with self.assertRaises(OSError):
+            self.download(retries=1)
+        with open(self.target + ".state") as file:
+            done = json.loads(file.read())["done"]
+        self.assertIn(0, done)
+        self.assertNotIn(5, done)
+
+        self.server.failures.clear()
+        del self.server.requested[:]
+        self.assertEqual(self.download().digest, DIGEST)
+        missing = [
+            index * CHUNK
+            for index in range(-(-len(PAYLOAD) // CHUNK))
+            if index not in done
+        ]
+        self.assertEqual(sorted(self.server.requested), missing)
+        with open(self.target, "rb") as file:
+            self.assertEqual(file.read(), PAYLOAD)
+
+    def test_checkpoint(self):
+        """Test that chunks are synced to disk before they are recorded"""
+        events = []
+        fsync = os.fsync
+        save_state = Download.save_state
+
+        def synced(fd):
+            events.append("fsync")
+            fsync(fd)
+
+        def saved(download, done):
+            events.append("save")
+            save_state(download, done)
+
+        with mock.patch("noma.config.DOWNLOAD_CHECKPOINT", 0), mock.patch(
+            "os.fsync", synced
+        ), mock.patch.object(Download, "save_state", saved):
+            self.download()
+        self.assertGreater(events.count("save"), 1)
+        for number, event in enumerate(events):
+            if event == "save":
+                self.assertEqual(events[number - 1], "fsync")
+
+    def test_checksum_mismatch(self):
+        """
+        Test that a digest mismatch raises and does not leave a state file
+        that would resume the corrupt download
+        """
+        with self.assertRaises(OSError):
+            self.download(sha256="00" * 32)
+        self.assertFalse(os.path.exists(self.target + ".state"))
+
+
+def archive(members):
+    """Tar archive of name to bytes"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class ExtractTests(StandInTestCase):
+    """Test Extract against a local stand-in server"""
+
+    members = {
+        "blocks/blk00000.dat": PAYLOAD[:300000],
+        "chainstate/000001.ldb": PAYLOAD[300000:],
+    }
+
+    def extract(self, sha256=None):
+        self.server.payload = archive(self.members)
+        self.throttled = 0
+        extract = Extract(
+            self.url,
+            self.tmp.name,
+            sha256=sha256 or hashlib.sha256(self.server.payload).hexdigest(),
+            throttle=self.throttle,
+            jobs=4,
+            chunk_size=CHUNK,
+            retries=2,
+            backoff=0,
+        )
+        extract.run()
+        return extract
+
+    def throttle(self):
+        self.throttled += 1
+
+    def test_extract(self):
+        """
+        Test that Extract unpacks while downloading, retrying cut off
+        chunks, and leaves neither a tarball nor a staging directory
+        """
+        self.server.failures[2] = 1
+        extract = self.extract()
+        self.assertEqual(self.throttled, extract.chunks())
+        for name, data in self.members.items():
+            with open(os.path.join(self.tmp.name, name), "rb") as file:
+                self.assertEqual(file.read(), data)
+        self.assertEqual(
+            sorted(os.listdir(self.tmp.name)), ["blocks", "chainstate"]
+        )
+
+    def test_rollback(self):
+        """
+        Test that a digest mismatch or an unsafe member discards the
+        partial extraction
+        """
+        with self.assertRaises(OSError):
+            self.extract(sha256="00" * 32)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+        self.members = {"../escape": b"x", "blocks/blk00000.dat": PAYLOAD}
+        with self.assertRaises(OSError):
+            self.extract()
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""Test forwarding history export"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from noma import fwdexport
+
+DAY = 86400
+START = 1560000000 // DAY * DAY
+
+
+class DummyResponse:
+    """Mocked-up requests Response"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        """mock JSON method"""
+        return self._data
+
+    def raise_for_status(self):
+        """mock raise_for_status method"""
+
+
+class FakeSwitch:
+    """Serves forwarding events like lnd's /v1/switch"""
+
+    def __init__(self):
+        self.events = []
+
+    def add(self, timestamp, chan_out, fee):
+        self.events.append(
+            {
+                "timestamp": str(timestamp),
+                "chan_id_in": "1",
+                "chan_id_out": str(chan_out),
+                "amt_in": "1001",
+                "amt_out": "1000",
+                "fee": str(fee // 1000),
+                "fee_msat": str(fee),
+            }
+        )
+
+    def post(self, path, data):
+        request = json.loads(data)
+        window = [
+            event
+            for event in self.events
+            if int(request["start_time"])
+            <= int(event["timestamp"])
+            < int(request["end_time"])
+        ]
+        offset = request["index_offset"]
+        page = window[offset:offset + request["num_max_events"]]
+        return DummyResponse(
+            {
+                "forwarding_events": page,
+                "last_offset_index": offset + len(page),
+            }
+        )
+
+
+class ExportTests(unittest.TestCase):
+    """Test export() and streaming aggregation"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "fwdexport")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_incremental_export(self):
+        """
+        Test that export():
+            - pages through events
+            - only appends events newer than the cursor, including events
+            in the same second as the cursor
+        """
+        switch = FakeSwitch()
+        for number in range(5):
+            switch.add(START + number * 3600, chan_out=2, fee=1000)
+        switch.add(START + DAY, chan_out=3, fee=500)
+        with mock.patch("noma.fwdexport.post", switch.post):
+            self.assertEqual(fwdexport.export(self.path, page_size=2), 6)
+            switch.add(START + DAY, chan_out=3, fee=700)
+            switch.add(START + 2 * DAY, chan_out=2, fee=100)
+            self.assertEqual(fwdexport.export(self.path, page_size=2), 2)
+            self.assertEqual(fwdexport.export(self.path, page_size=2), 0)
+
+        index = fwdexport.load_index(self.path)
+        self.assertEqual(index["rows"], 8)
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.path, "fee_msat.bin")), 8 * 8
+        )
+
+        self.assertEqual(
+            fwdexport.fees_per_channel(export_path=self.path),
+            {2: 5100, 3: 1200},
+        )
+        days = fwdexport.fees_per_day(
+            since=START + DAY, until=START + 2 * DAY, export_path=self.path
+        )
+        self.assertEqual(list(days.values()), [1200])
+
+        chunks = list(
+            fwdexport.iter_columns(
+                ["fee_msat"], export_path=self.path, chunk_rows=3
+            )
+        )
+        self.assertEqual(
+            [len(chunk["fee_msat"]) for chunk in chunks], [3, 3, 2]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Test streaming channel graph snapshots"""
+import json
+import os
+import tempfile
+import unittest
+from noma import graph
+
+
+def node(number, alias=None):
+    return {
+        "pub_key": "02{:064x}".format(number),
+        "alias": alias or "node{}".format(number),
+        "color": "#3399ff",
+        "last_update": 1560000000,
+        "addresses": [{"network": "tcp", "addr": "10.0.0.{}".format(number)}],
+    }
+
+
+def edge(number, node1, node2, fee_rate="1"):
+    return {
+        "channel_id": str(600000 << 40 | number),
+        "chan_point": "{:064x}:0".format(number),
+        "node1_pub": node(node1)["pub_key"],
+        "node2_pub": node(node2)["pub_key"],
+        "capacity": str(100000 * number),
+        "last_update": 1560000000,
+        "node1_policy": {"fee_rate_milli_msat": fee_rate},
+        "node2_policy": None,
+    }
+
+
+def chunked(data, size):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+class StreamParserTests(unittest.TestCase):
+    """Test StreamParser"""
+
+    def test_chunk_boundaries(self):
+        """
+        Test that the parser yields the same items as json.loads for any
+        chunk size, including chunks splitting numbers and UTF-8 characters
+        """
+        document = {
+            "nodes": [node(1, alias="ünïcødé ⚡"), node(2)],
+            "edges": [edge(1, 1, 2)],
+            "count": 12345,
+            "empty": [],
+        }
+        data = json.dumps(document, ensure_ascii=False, indent=1).encode()
+        for size in (1, 2, 3, 7, 64, len(data)):
+            parser = graph.StreamParser(chunked(data, size))
+            items = list(parser)
+            self.assertEqual(
+                [item for key, item in items if key == "nodes"],
+                document["nodes"],
+            )
+            self.assertEqual(
+                [item for key, item in items if key == "edges"],
+                document["edges"],
+            )
+            self.assertIn(("count", 12345), items)
+        self.assertEqual(list(graph.StreamParser([b" {} "])), [])
+        with self.assertRaises(ValueError):
+            list(graph.StreamParser([b'{"nodes": [{"pub_key": "02"']))
+
+
+class SnapshotTests(unittest.TestCase):
+    """Test store() and diff()"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def store(self, name, nodes, edges):
+        path = os.path.join(self.tmp.name, name)
+        data = json.dumps({"nodes": nodes, "edges": edges}).encode()
+        counts = graph.store(chunked(data, 100), path, batch_size=2)
+        self.assertEqual(counts["nodes"], len(nodes))
+        self.assertEqual(counts["edges"], len(edges))
+        self.assertLess(counts["max_buffer"], len(data))
+        return path
+
+    def test_diff(self):
+        """
+        Test that diff() counts added, removed and updated nodes and edges
+        """
+        old = self.store(
+            "old.sqlite",
+            [node(n) for n in range(1, 6)],
+            [edge(1, 1, 2), edge(2, 2, 3), edge(3, 3, 4)],
+        )
+        new = self.store(
+            "new.sqlite",
+            [node(1, alias="renamed")] + [node(n) for n in range(2, 7)],
+            [edge(1, 1, 2, fee_rate="10"), edge(3, 3, 4), edge(4, 5, 6)],
+        )
+        changes = graph.diff(old, new)
+        self.assertEqual(changes["nodes added"], 1)
+        self.assertEqual(changes["nodes removed"], 0)
+        self.assertEqual(changes["nodes updated"], 1)
+        self.assertEqual(changes["edges added"], 1)
+        self.assertEqual(changes["edges removed"], 1)
+        self.assertEqual(changes["policies changed"], 1)
+        self.assertEqual(changes["capacity added"], 400000)
+        self.assertEqual(changes["capacity removed"], 200000)
+        with self.assertRaises(FileNotFoundError):
+            graph.diff(old, os.path.join(self.tmp.name, "missing.sqlite"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""Test incremental invoice and payment index"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+from noma import index
+
+
+class DummyResponse:
+    """Mocked-up requests Response"""
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        """mock JSON method"""
+        return self._data
+
+    def raise_for_status(self):
+        """mock raise_for_status method"""
+
+
+def invoice(add_index, state="SETTLED", memo="", value=1000, expiry=3600):
+    return {
+        "add_index": str(add_index),
+        "memo": memo,
+        "value": str(value),
+        "state": state,
+        "creation_date": str(1560000000 + add_index),
+        "expiry": str(expiry),
+        "r_hash": "hash{}".format(add_index),
+    }
+
+
+def payment(payment_index, status="SUCCEEDED", fee=1):
+    return {
+        "payment_hash": "hash{}".format(payment_index),
+        "payment_index": str(payment_index),
+        "value_sat": "1000",
+        "fee_sat": str(fee),
+        "status": status,
+        "creation_date": str(1560000000 + payment_index),
+    }
+
+
+class FakeLnd:
+    """Serves pages like lnd's /v1/invoices and /v1/payments"""
+
+    def __init__(self, invoices, payments=()):
+        self.invoices = invoices
+        self.payments = list(payments)
+        self.offsets = []
+        self.payment_offsets = []
+
+    def get(self, path, params):
+        offset = params["index_offset"]
+        if path == "/v1/payments":
+            self.payment_offsets.append(offset)
+            page = [
+                p for p in self.payments if int(p["payment_index"]) > offset
+            ][: params["max_payments"]]
+            last = page[-1]["payment_index"] if page else "0"
+            return DummyResponse({"payments": page, "last_index_offset": last})
+        self.offsets.append(offset)
+        page = [
+            i for i in self.invoices if int(i["add_index"]) > offset
+        ][: params["num_max_invoices"]]
+        last = page[-1]["add_index"] if page else "0"
+        return DummyResponse({"invoices": page, "last_index_offset": last})
+
+
+class IndexTests(unittest.TestCase):
+    """Test index.update() and index.search()"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "index.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_incremental_update(self):
+        """
+        Test that index_invoices():
+            - pages through all invoices
+            - resumes from the oldest open invoice on the next run
+        """
+        lnd = FakeLnd(
+            [invoice(n) for n in range(1, 6)]
+            # payable for centuries, so still open on the next run
+            + [invoice(6, state="OPEN", expiry=10 ** 10)]
+            + [invoice(n) for n in range(7, 11)]
+        )
+        with mock.patch("noma.index.get", lnd.get):
+            db = index.connect(self.db_path)
+            self.assertEqual(index.index_invoices(db, page_size=4), 10)
+            lnd.invoices[5] = invoice(6, state="SETTLED")
+            lnd.invoices.append(invoice(11, memo="coffee", value=5000))
+            self.assertEqual(index.index_invoices(db, page_size=4), 6)
+            db.close()
+            self.assertEqual(index.update(self.db_path), (0, 0))
+        self.assertEqual(lnd.offsets, [0, 4, 8, 5, 9, 11])
+
+        rows = index.search("invoices", state="OPEN", db_path=self.db_path)
+        self.assertEqual(rows, [])
+        rows = index.search(
+            "invoices", memo="coff", min_sat=5, db_path=self.db_path
+        )
+        self.assertEqual([row["add_index"] for row in rows], [11])
+        rows = index.search(
+            "invoices", since=1560000008, limit=2, db_path=self.db_path
+        )
+        self.assertEqual([row["add_index"] for row in rows], [11, 10])
+
+    def test_expired_invoice(self):
+        """Test that an expired open invoice does not hold back resuming"""
+        lnd = FakeLnd(
+            [invoice(1), invoice(2, state="OPEN"), invoice(3, "ACCEPTED")]
+            + [invoice(n) for n in range(4, 7)]
+        )
+        with mock.patch("noma.index.get", lnd.get):
+            db = index.connect(self.db_path)
+            index.index_invoices(db, page_size=10)
+            self.assertEqual(index._invoice_offset(db), 2)
+            lnd.invoices[2] = invoice(3)
+            index.index_invoices(db, page_size=10)
+            self.assertEqual(index._invoice_offset(db), 6)
+            db.close()
+
+    def test_in_flight_payment(self):
+        """Test that an in-flight payment is indexed again once final"""
+        lnd = FakeLnd(
+            [], [payment(1), payment(2, "IN_FLIGHT", 0), payment(3, "FAILED")]
+        )
+        with mock.patch("noma.index.get", lnd.get):
+            db = index.connect(self.db_path)
+            self.assertEqual(index.index_payments(db, page_size=10), 3)
+            lnd.payments[1] = payment(2, fee=5)
+            self.assertEqual(index.index_payments(db, page_size=10), 2)
+            self.assertEqual(index.index_payments(db, page_size=10), 0)
+            db.close()
+        self.assertEqual(lnd.payment_offsets, [0, 1, 3])
+        rows = index.search("payments", db_path=self.db_path)
+        self.assertEqual(
+            [(row["status"], row["fee_msat"]) for row in rows],
+            [("FAILED", 1000), ("SUCCEEDED", 5000), ("SUCCEEDED", 1000)],
+        )
+
+    def test_timestamp(self):
+        self.assertEqual(index.timestamp("2019-08-01"), 1564617600)
+        self.assertEqual(index.timestamp("2019-08-01 12:00"), 1564660800)
+        self.assertEqual(index.timestamp("2019-08-01 12:00:30"), 1564660830)
+        self.assertEqual(index.timestamp("1564617600"), 1564617600)
+        with self.assertRaises(ValueError):
+            index.timestamp("01.08.2019")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,8 @@
 import logging
 import random
 import json
+import os
+import tempfile
 import unittest
 from unittest import mock
 from noma import lnd
@@ -156,7 +158,7 @@ class LndCreateWalletTests(unittest.TestCase):
         with mock.patch("builtins.open", m_open):
             with self.assertRaises(TestComplete):
                 lnd.create_wallet()
-        m_get.assert_called_with(cfg.URL_GENSEED, verify=str(cfg.TLS_CERT_PATH))
+        m_get.assert_called_with(cfg.URL_GENSEED)
 
     @mock.patch("noma.lnd.post")
     @mock.patch("noma.lnd.get")
@@ -219,7 +221,7 @@ class LndCreateWalletTests(unittest.TestCase):
                             m_post.mock_calls,
                         )
                     )
-        m_get.assert_called_with(cfg.URL_GENSEED, verify=str(cfg.TLS_CERT_PATH))
+        m_get.assert_called_with(cfg.URL_GENSEED)
         handle = m_open()
         for mne in mnemonic:
             handle.write.assert_any_call(mne + "\n")
@@ -267,11 +269,205 @@ class LndCreateWalletTests(unittest.TestCase):
         post_call = m_post.mock_calls[-1]
         _, args, kwargs = post_call
         self.assertIn(cfg.URL_INITWALLET, args)
-        self.assertEqual(kwargs["verify"], str(cfg.TLS_CERT_PATH))
         data_json = kwargs["data"]
         data = json.loads(data_json)
         self.assertEqual(data["cipher_seed_mnemonic"], mnemonic)
 
 
+class DummyResponse:
+    """Mocked-up requests Response"""
+
+    def __init__(self, status_code=200, data=None):
+        self.status_code = status_code
+        self._data = data if data is not None else {}
+        self.text = json.dumps(self._data)
+
+    def json(self):
+        """mock JSON method"""
+        return self._data
+
+    def raise_for_status(self):
+        """mock raise_for_status method"""
+
+
+class LndAutoconnectTests(unittest.TestCase):
+    """Test the parallel REST autoconnect"""
+
+    @mock.patch("noma.lnd.post")
+    @mock.patch("noma.lnd.get")
+    def test_connect_peers(self, m_get, m_post):
+        """
+        Test that connect_peers():
+            - skips peers lnd is already connected to
+            - connects each remaining address once
+            - reports lnd errors as failures
+        """
+        m_get.return_value = DummyResponse(data={"peers": [{"pub_key": "aa"}]})
+
+        def post(path, data, timeout):
+            pubkey = json.loads(data)["addr"]["pubkey"]
+            if pubkey == "cc":
+                return DummyResponse(500, {"error": "dial tcp: timeout"})
+            return DummyResponse()
+
+        m_post.side_effect = post
+        addresses = ["aa@host1:9735", "bb@host2", "bb@host2", "cc@host3"]
+        results = lnd.connect_peers(addresses, jobs=2)
+
+        self.assertEqual(
+            [r["status"] for r in results],
+            ["connected", "ok", "ok", "failed"],
+        )
+        self.assertEqual(results[3]["error"], "dial tcp: timeout")
+        self.assertEqual(m_post.call_count, 2)
+        _, args, kwargs = m_post.mock_calls[0]
+        self.assertEqual(args, ("/v1/peers",))
+        self.assertEqual(
+            json.loads(kwargs["data"]),
+            {"addr": {"pubkey": "bb", "host": "host2"}},
+        )
+
+
+class LndSavePeersTests(unittest.TestCase):
+    """Test the incremental peer snapshot"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.peers_path = os.path.join(self.tmp.name, "peers.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @mock.patch("noma.lnd.get")
+    def test_savepeers_only_writes_changes(self, m_get):
+        """
+        Test that savepeers():
+            - writes new peers and skips an unchanged set
+            - saves the advertised address of inbound peers, if any
+        """
+
+        def get(path):
+            if path == "/v1/peers":
+                return DummyResponse(
+                    data={
+                        "peers": [
+                            {
+                                "pub_key": "aa",
+                                "address": "1.1.1.1:9735",
+                                "ping_time": "20000",
+                            },
+                            {"pub_key": "bb", "address": "2.2.2.2:9735"},
+                            {
+                                "pub_key": "cc",
+                                "address": "3.3.3.3:51234",
+                                "inbound": True,
+                            },
+                            {
+                                "pub_key": "dd",
+                                "address": "4.4.4.4:40000",
+                                "inbound": True,
+                            },
+                        ]
+                    }
+                )
+            if path == "/v1/channels":
+                return DummyResponse(
+                    data={"channels": [{"remote_pubkey": "bb"}]}
+                )
+            if path == "/v1/graph/node/cc":
+                return DummyResponse(
+                    data={"node": {"addresses": [{"addr": "3.3.3.3:9735"}]}}
+                )
+            if path == "/v1/graph/node/dd":
+                return DummyResponse(data={"node": {}})
+            raise Unhappy(path)
+
+        m_get.side_effect = get
+        self.assertTrue(lnd.savepeers(self.peers_path))
+        self.assertFalse(lnd.savepeers(self.peers_path))
+        peers = lnd.load_peers(self.peers_path)
+        self.assertEqual(peers["aa"]["ping"], 0.02)
+        self.assertTrue(peers["bb"]["channel"])
+        self.assertEqual(peers["cc"]["host"], "3.3.3.3:9735")
+        self.assertNotIn("dd", peers)
+
+    def test_prioritized_peers(self):
+        """
+        Test channel peers come first, then recent peers, fastest first
+        """
+        now = 10 * cfg.PEERS_REFRESH
+        peers = {
+            "old": {"host": "h1", "last_seen": 0, "latency": 0.1},
+            "slow": {"host": "h2", "last_seen": now, "latency": 2.0},
+            "fast": {"host": "h3", "last_seen": now, "ping": 0.5},
+            "chan": {"host": "h4", "last_seen": 0, "channel": True},
+            "nohost": {"last_seen": now},
+        }
+        self.assertEqual(
+            lnd.prioritized_peers(peers),
+            ["chan@h4", "fast@h3", "slow@h2", "old@h1"],
+        )
+
+
+class LndUnlockTests(unittest.TestCase):
+    """Test unlock() readiness probing"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        password_path = os.path.join(self.tmp.name, "password.txt")
+        with open(password_path, "w") as file:
+            file.write("sesame\n")
+        for name, value in (
+            ("PASSWORD_FILE_PATH", password_path),
+            ("UNLOCK_LOG", os.path.join(self.tmp.name, "unlock.log")),
+        ):
+            patcher = mock.patch.object(cfg, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @mock.patch("noma.lnd._container_started_at")
+    @mock.patch("noma.lnd.time.sleep")
+    @mock.patch("noma.lnd._rest_ready")
+    @mock.patch("noma.lnd.post")
+    def test_waits_then_unlocks(self, m_post, m_ready, m_sleep, m_started):
+        """
+        Test that unlock() polls until the port answers, retries while lnd
+        is still starting and logs the boot time once unlocked
+        """
+        m_ready.side_effect = [False, False, True, True]
+        m_post.side_effect = [
+            DummyResponse(503, {"error": "connection refused"}),
+            DummyResponse(200, {}),
+        ]
+        m_started.return_value = 0
+        self.assertEqual(lnd.unlock(timeout=60), "unlocked")
+        self.assertEqual(m_post.call_count, 2)
+        sleeps = [c[1][0] for c in m_sleep.mock_calls]
+        self.assertEqual(
+            sleeps[:2], [cfg.UNLOCK_POLL_MIN, cfg.UNLOCK_POLL_MIN * 2]
+        )
+        with open(cfg.UNLOCK_LOG) as file:
+            entry = json.loads(file.readline())
+        self.assertEqual(entry["status"], "unlocked")
+        self.assertIn("boot_seconds", entry)
+
+    @mock.patch("noma.lnd._rest_ready")
+    @mock.patch("noma.lnd.post")
+    def test_already_unlocked(self, m_post, m_ready):
+        """Test that a missing WalletUnlocker service means unlocked"""
+        m_ready.return_value = True
+        m_post.return_value = DummyResponse(
+            404, {"error": "unknown service lnrpc.WalletUnlocker", "code": 12}
+        )
+        self.assertEqual(lnd.unlock(timeout=60), "already unlocked")
+        m_post.return_value = DummyResponse(
+            500, {"error": "invalid passphrase"}
+        )
+        self.assertEqual(lnd.unlock(timeout=60), "failed")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,111 @@
+"""Test indexed lnd log search"""
+import gzip
+import os
+import tempfile
+import unittest
+from noma import logs
+
+SUBSYSTEMS = ("HSWC", "PEER", "CRTR", "LTND")
+
+
+def entries(day, count, level="INF"):
+    """Generate count log entries, one per minute of day"""
+    lines = []
+    for number in range(count):
+        lines.append(
+            "2019-06-{:02d} {:02d}:{:02d}:00.000 [{}] {}: entry {}\n".format(
+                day,
+                number // 60,
+                number % 60,
+                level,
+                SUBSYSTEMS[number % len(SUBSYSTEMS)],
+                number,
+            )
+        )
+    return "".join(lines)
+
+
+class SearchTests(unittest.TestCase):
+    """Test update_index() and search()"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "mainnet")
+        self.index_path = os.path.join(self.tmp.name, "index")
+        os.makedirs(self.log_path)
+        with gzip.open(os.path.join(self.log_path, "lnd.log.1.gz"), "wt") as f:
+            f.write(entries(19, 600))
+        with open(os.path.join(self.log_path, "lnd.log"), "w") as file:
+            file.write(entries(20, 300))
+            file.write("  continuation of entry 299\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def search(self, **kwargs):
+        return list(
+            logs.search(
+                log_path=self.log_path, index_path=self.index_path, **kwargs
+            )
+        )
+
+    def test_index(self):
+        """
+        Test that update_index():
+            - decompresses rotated logs and orders files by time
+            - records levels and subsystems per block
+            - only re-indexes the tail of a growing log
+        """
+        index = logs.update_index(
+            self.log_path, self.index_path, block_size=4096
+        )
+        paths = list(index)
+        self.assertEqual(
+            paths,
+            [
+                os.path.join(self.index_path, "lnd.log.1"),
+                os.path.join(self.log_path, "lnd.log"),
+            ],
+        )
+        blocks = index[paths[1]]["blocks"]
+        self.assertGreater(len(blocks), 3)
+        self.assertEqual(blocks[0][1], "2019-06-20 00:00:00")
+        self.assertEqual(blocks[-1][2], "2019-06-20 04:59:00")
+        self.assertEqual(blocks[0][4], sorted(SUBSYSTEMS))
+
+        with open(os.path.join(self.log_path, "lnd.log"), "a") as file:
+            file.write("2019-06-20 05:00:00.000 [ERR] HSWC: failed\n")
+        grown = logs.update_index(
+            self.log_path, self.index_path, block_size=4096
+        )[paths[1]]["blocks"]
+        self.assertEqual(grown[:-1], blocks[:-1])
+        self.assertEqual(grown[-1][2], "2019-06-20 05:00:00")
+
+    def test_search(self):
+        """
+        Test that search() filters by time, level, subsystem and pattern
+        and keeps continuation lines with their entry
+        """
+        logs.update_index(self.log_path, self.index_path, block_size=4096)
+        with open(os.path.join(self.log_path, "lnd.log"), "a") as file:
+            file.write("2019-06-20 05:00:00.000 [ERR] HSWC: failed\n")
+
+        found = self.search(since="2019-06-19 09:58", until="2019-06-20")
+        self.assertEqual(len(found), 2)
+        self.assertTrue(found[0].endswith("entry 598"))
+
+        found = self.search(since="2019-06-20 04:59")
+        self.assertEqual(len(found), 2)
+        self.assertTrue(found[0].endswith("continuation of entry 299"))
+
+        self.assertEqual(len(self.search(level="WRN")), 1)
+        found = self.search(subsystems=["crtr"], since="2019-06-20")
+        self.assertEqual(len(found), 75)
+        found = self.search(pattern=r"entry 1[0-9]$", subsystems=["HSWC"])
+        self.assertEqual(len(found), 4)
+        with self.assertRaises(ValueError):
+            self.search(level="LOUD")
+
+
+if __name__ == "__main__":
+    unittest.main()
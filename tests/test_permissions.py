@@ -0,0 +1,65 @@
+"""Test permission normalisation"""
+import os
+import stat
+import tempfile
+import unittest
+from noma import permissions
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path, follow_symlinks=False).st_mode)
+
+
+class NormalizeTests(unittest.TestCase):
+    """Test normalize() on a small tree owned by the current user"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.top = os.path.join(self.tmp.name, "bitcoin")
+        self.files = []
+        for directory in ("blocks", "chainstate", "blocks/index"):
+            os.makedirs(os.path.join(self.top, directory), mode=0o700)
+            for number in range(5):
+                path = os.path.join(self.top, directory, str(number))
+                with open(path, "w"):
+                    pass
+                os.chmod(path, 0o600 if number % 2 else 0o744)
+                self.files.append(path)
+        self.outside = os.path.join(self.tmp.name, "outside")
+        with open(self.outside, "w"):
+            pass
+        os.chmod(self.outside, 0o600)
+        os.symlink(self.outside, os.path.join(self.top, "link"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def normalize(self, jobs):
+        return permissions.normalize(
+            self.top, os.getuid(), os.getgid(), 0o755, 0o744, jobs=jobs
+        )
+
+    def test_normalize(self):
+        """
+        Test that normalize():
+            - fixes directories and files, including the top directory
+            - only counts entries that needed a change
+            - leaves symlinks and their targets alone
+        """
+        for jobs in (1, 3):
+            os.chmod(self.top, 0o700)
+            os.chmod(self.files[1], 0o600)
+            checked, changed = self.normalize(jobs)
+            # top, 3 directories, 15 files and the symlink
+            self.assertEqual(checked, 20)
+            self.assertEqual(changed, 10 if jobs == 1 else 2)
+            self.assertEqual(mode(self.top), 0o755)
+            self.assertEqual(mode(os.path.join(self.top, "blocks")), 0o755)
+            for path in self.files:
+                self.assertEqual(mode(path), 0o744)
+            self.assertEqual(mode(self.outside), 0o600)
+            self.assertEqual(self.normalize(jobs)[1], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
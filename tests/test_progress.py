@@ -0,0 +1,139 @@
+"""Test sync progress ring buffer and rates"""
+import unittest
+from unittest import mock
+from requests import ConnectionError as RequestsConnectionError
+from noma import progress
+from noma.rpc import RPCError
+from noma.ringbuffer import RingBuffer
+
+
+def row(time, blocks, progress_, cpu=50.0, iowait=0.0, read=0, headers=700):
+    return {
+        "time": time,
+        "blocks": blocks,
+        "headers": headers,
+        "progress": progress_,
+        "cpu": cpu,
+        "iowait": iowait,
+        "read": read,
+        "written": 0,
+    }
+
+
+class RingBufferTests(unittest.TestCase):
+    """Test RingBuffer wrap-around"""
+
+    def test_ring_buffer(self):
+        """
+        Test that RingBuffer:
+            - keeps the newest capacity rows in order
+            - indexes rows from either end
+        """
+        ring = RingBuffer(("a", "b"), 3)
+        self.assertEqual(len(ring), 0)
+        for value in range(5):
+            ring.append({"a": value, "b": -value})
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.column("a"), [2.0, 3.0, 4.0])
+        self.assertEqual(ring[0], {"a": 2.0, "b": -2.0})
+        self.assertEqual(ring[-1]["b"], -4.0)
+        self.assertEqual([item["a"] for item in ring], [2.0, 3.0, 4.0])
+        with self.assertRaises(IndexError):
+            ring[3]
+
+    def test_overwrite_outside_window(self):
+        """Test that a full buffer drops the oldest row before overwriting"""
+        ring = RingBuffer(("a",), 3)
+        for value in range(3):
+            ring.append({"a": value})
+        seen = []
+
+        class Row(dict):
+            def __getitem__(self, name):
+                seen.append(ring.column(name))
+                return super().__getitem__(name)
+
+        ring.append(Row(a=3))
+        self.assertEqual(seen, [[1.0, 2.0]])
+        self.assertEqual(ring.column("a"), [1.0, 2.0, 3.0])
+
+
+class SummaryTests(unittest.TestCase):
+    """Test summary() on synthetic samples"""
+
+    def samples(self, rows):
+        ring = RingBuffer(progress.COLUMNS, 10)
+        for item in rows:
+            ring.append(item)
+        return ring
+
+    def test_rate_and_eta(self):
+        """Test block rate, ETA from progress rate and disk throughput"""
+        state = progress.summary(
+            self.samples(
+                row(60 * minute, 600 + 10 * minute, 0.5 + 0.01 * minute,
+                    read=6e6 * minute)
+                for minute in range(4)
+            ),
+            smoothing=0.5,
+        )
+        self.assertAlmostEqual(state["blocks_per_minute"], 10)
+        self.assertAlmostEqual(state["average_blocks_per_minute"], 10)
+        # 0.47 left at 0.01 per minute
+        self.assertAlmostEqual(state["eta"], 47 * 60)
+        self.assertAlmostEqual(state["disk_read"], 1e5)
+        self.assertFalse(state["stalled"])
+        self.assertEqual(state["bottleneck"], "")
+
+    def test_stall_and_bottleneck(self):
+        """
+        Test that summary():
+            - reports a stall after stall seconds without a block
+            - blames high iowait for the rate drop
+            - reports no stall once synced
+        """
+        rows = [row(0, 600, 0.9), row(60, 660, 0.95)]
+        rows += [row(60 + 300 * n, 660, 0.95, iowait=60) for n in (1, 2)]
+        state = progress.summary(self.samples(rows), stall=600)
+        self.assertTrue(state["stalled"])
+        self.assertEqual(state["since_block"], 600)
+        self.assertEqual(state["bottleneck"], "disk")
+        self.assertIn("rate limited by disk", progress.format_summary(state))
+
+        rows = [row(0, 690, 0.99), row(60, 700, 1.0), row(700, 700, 1.0)]
+        state = progress.summary(self.samples(rows), stall=600)
+        self.assertFalse(state["stalled"])
+        self.assertEqual(state["eta"], 0)
+
+
+class MonitorTests(unittest.TestCase):
+    """Test monitor() with stand-in samples"""
+
+    @mock.patch("noma.progress._disk_device", return_value="")
+    @mock.patch("builtins.print")
+    def test_watch_survives_errors(self, m_print, m_device):
+        """
+        Test that watching keeps sampling through bitcoind warmup and
+        restarts, and that a single run still fails on errors
+        """
+        samples = [
+            RPCError(-28, "Loading block index..."),
+            row(0, 600, 0.9),
+            RequestsConnectionError("connection refused"),
+            row(60, 610, 0.91),
+            KeyboardInterrupt(),
+        ]
+        with mock.patch("noma.progress.sample", side_effect=samples):
+            state = progress.monitor(interval=0, watch=True)
+        self.assertEqual(state["blocks"], 610)
+        printed = [call[0][0] for call in m_print.call_args_list]
+        self.assertEqual(len(printed), 3)
+        self.assertIn("code -28", printed[0])
+
+        with mock.patch("noma.progress.sample", side_effect=samples):
+            with self.assertRaises(RPCError):
+                progress.monitor(interval=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
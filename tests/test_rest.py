@@ -0,0 +1,89 @@
+"""Test pooled LND REST client"""
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from noma.rest import LndRest
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server standing in for lnd's REST port"""
+
+    daemon_threads = True
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answer every GET with the path, macaroon header and client port"""
+
+    protocol_version = "HTTP/1.1"
+    # send headers and body in one segment
+    wbufsize = -1
+
+    def do_GET(self):
+        body = json.dumps(
+            {
+                "path": self.path,
+                "macaroon": self.headers.get("Grpc-Metadata-macaroon"),
+                "port": self.client_address[1],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LndRestTests(unittest.TestCase):
+    """Test LndRest against a local stand-in server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(("127.0.0.1", 0), StandInHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:{}".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.macaroon = os.path.join(self.tmp.name, "admin.macaroon")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_endpoint(self):
+        client = LndRest(url=self.url + "/", macaroon=self.macaroon)
+        self.assertEqual(client.endpoint("/v1/peers"), self.url + "/v1/peers")
+        self.assertEqual(client.endpoint("v1/peers"), self.url + "/v1/peers")
+        absolute = "https://127.0.0.1:8080/v1/genseed"
+        self.assertEqual(client.endpoint(absolute), absolute)
+
+    def test_reuses_connection(self):
+        client = LndRest(url=self.url, macaroon=self.macaroon)
+        ports = {client.get("/v1/getinfo").json()["port"] for _ in range(5)}
+        self.assertEqual(len(ports), 1)
+        client.close()
+
+    def test_macaroon_header(self):
+        client = LndRest(url=self.url, macaroon=self.macaroon)
+        self.assertIsNone(client.get("/v1/getinfo").json()["macaroon"])
+        with open(self.macaroon, "wb") as file:
+            file.write(b"\x02\x01")
+        self.assertEqual(client.get("/v1/getinfo").json()["macaroon"], "0201")
+        client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
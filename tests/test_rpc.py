@@ -0,0 +1,127 @@
+"""Test keep-alive bitcoind JSON-RPC client"""
+import base64
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from noma import rpc
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server standing in for bitcoind's RPC port"""
+
+    daemon_threads = True
+    requests = []
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answer JSON-RPC calls and batches like bitcoind"""
+
+    protocol_version = "HTTP/1.1"
+    # send headers and body in one segment
+    wbufsize = -1
+
+    def reply(self, call):
+        if call["method"] == "fail":
+            error = {"code": -8, "message": "Invalid parameter"}
+            return {"result": None, "error": error, "id": call["id"]}
+        result = {"method": call["method"], "params": call["params"]}
+        return {"result": result, "error": None, "id": call["id"]}
+
+    def do_POST(self):
+        expected = "Basic " + base64.b64encode(b"lncm:secret=").decode()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Authorization") != expected:
+            self.send_response(401)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.requests.append(self.client_address[1])
+        payload = json.loads(body.decode())
+        status = 200
+        if isinstance(payload, list):
+            # answer out of order, clients have to match ids
+            data = [self.reply(call) for call in reversed(payload)]
+        else:
+            data = self.reply(payload)
+            status = 500 if data["error"] else 200
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BitcoinRPCTests(unittest.TestCase):
+    """Test BitcoinRPC against a local stand-in server"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = StandInServer(("127.0.0.1", 0), StandInHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:{}".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.credentials = os.path.join(self.tmp.name, "rpc.txt")
+        # two entries, written without final newline like older versions
+        with open(self.credentials, "w") as file:
+            file.write(
+                "rpcauth=old:salt$hash\nusername=old\npassword=stale="
+                "rpcauth=lncm:salt$hash\nusername=lncm\npassword=secret="
+            )
+        del self.server.requests[:]
+        self.client = rpc.BitcoinRPC(
+            url=self.url, credentials_path=self.credentials
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.tmp.cleanup()
+
+    def test_read_credentials(self):
+        self.assertEqual(
+            rpc.read_credentials(self.credentials), ("lncm", "secret=")
+        )
+
+    def test_call_and_batch(self):
+        """
+        Test that calls and batches:
+            - reuse one keep-alive connection
+            - return batch results in call order
+            - raise RPCError for errors
+        """
+        result = self.client.call("getblockhash", 565305)
+        self.assertEqual(result["params"], [565305])
+        results = self.client.batch(
+            ["getblockchaininfo", ("getblockhash", [1]), "getmempoolinfo"]
+        )
+        self.assertEqual(
+            [result["method"] for result in results],
+            ["getblockchaininfo", "getblockhash", "getmempoolinfo"],
+        )
+        with self.assertRaises(rpc.RPCError) as context:
+            self.client.call("fail")
+        self.assertEqual(context.exception.code, -8)
+        with self.assertRaises(rpc.RPCError):
+            self.client.batch(["getblockcount", "fail"])
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len(set(self.server.requests)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Test thermal- and load-aware maintenance job scheduler"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from subprocess import PIPE
+from noma import scheduler
+
+
+class SchedulerTests(unittest.TestCase):
+    """Test Scheduler with stand-in temperature readings"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stats = os.path.join(self.tmp.name, "scheduler.json")
+        self.temps = []
+        self.load = 0.0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def temperature(self):
+        return self.temps.pop(0) if len(self.temps) > 1 else self.temps[0]
+
+    def scheduler(self):
+        jobs = scheduler.Scheduler(
+            temperature=self.temperature,
+            load=lambda: self.load,
+            stats_path=self.stats,
+            lock_path=os.path.join(self.tmp.name, "jobs.lock"),
+        )
+        jobs.poll = 0.05
+        jobs.defer = 5
+        jobs.max_pause = 5
+        return jobs
+
+    def python(self, code):
+        return [sys.executable, "-c", code]
+
+    def sleep(self, seconds):
+        return self.python("import time; time.sleep({})".format(seconds))
+
+    def spin(self, seconds):
+        # CPU time, which unlike a sleep does not pass while stopped
+        return self.python(
+            "import time\nwhile time.process_time() < {}: pass".format(seconds)
+        )
+
+    def test_defer(self):
+        """
+        Test that a job:
+            - waits until the CPU is cool before it starts
+            - runs with its output captured
+            - is counted in the statistics
+        """
+        self.temps = [85, 85, 50]
+        jobs = self.scheduler()
+        jobs.submit("echo", self.python("print('done')"), stdout=PIPE)
+        jobs.submit("fail", self.python("exit(3)"))
+        echo, fail = jobs.run()
+        self.assertGreaterEqual(echo["deferred"], 0.1)
+        self.assertEqual(echo["output"], b"done\n")
+        self.assertEqual(echo["returncode"], 0)
+        self.assertEqual(fail["returncode"], 3)
+        with open(self.stats) as file:
+            stats = json.load(file)
+        self.assertEqual(stats["echo"]["runs"], 1)
+        self.assertEqual(stats["echo"]["failures"], 0)
+        self.assertEqual(stats["fail"]["failures"], 1)
+
+    def test_load(self):
+        self.temps = [50]
+        self.load = 2.0
+        jobs = self.scheduler()
+        jobs.defer = 0.2
+        result = jobs.run_job("busy", self.python("pass"))
+        self.assertGreaterEqual(result["deferred"], 0.2)
+        self.assertEqual(result["returncode"], 0)
+
+    def test_pause(self):
+        """
+        Test that a running job is paused while the CPU is hot, continued
+        once it cooled down and that the throttle event is recorded
+        """
+        self.temps = [50, 85, 85, 85, 85, 60]
+        jobs = self.scheduler()
+        result = jobs.run_job("spin", self.spin(0.5))
+        self.assertEqual(result["throttles"], 1)
+        self.assertGreaterEqual(result["paused"], 0.15)
+        self.assertGreaterEqual(result["seconds"], 0.5 + result["paused"])
+        stats = scheduler.load_stats(self.stats)
+        self.assertEqual(stats["spin"]["throttles"], 1)
+
+    def test_max_pause(self):
+        self.temps = [50, 90]
+        jobs = self.scheduler()
+        jobs.max_pause = 0.1
+        result = jobs.run_job("hot", self.sleep(0.5))
+        self.assertEqual(result["returncode"], 0)
+        self.assertGreaterEqual(result["throttles"], 1)
+
+    def test_job(self):
+        """
+        Test that an in-process job waits for its turn, is held up by its
+        throttle while the CPU is hot and is recorded as failed on error
+        """
+        self.temps = [50, 85, 85, 60]
+        jobs = self.scheduler()
+        with jobs.job("stream") as throttle:
+            throttle()
+            time.sleep(0.06)
+            throttle()
+            throttle()
+        with self.assertRaises(OSError):
+            with jobs.job("broken"):
+                raise OSError("mirror gone")
+        stats = scheduler.load_stats(self.stats)
+        self.assertEqual(stats["stream"]["throttles"], 1)
+        self.assertGreaterEqual(stats["stream"]["paused"], 0.05)
+        self.assertEqual(stats["stream"]["failures"], 0)
+        self.assertEqual(stats["broken"]["failures"], 1)
+
+    def test_prioritize(self):
+        args = scheduler.prioritize(["tar", "xf", 1])
+        self.assertEqual(args[-3:], ["tar", "xf", "1"])
+        if args[0] == "nice":
+            self.assertEqual(args[:3], ["nice", "-n", "19"])
+
+
+if __name__ == "__main__":
+    unittest.main()
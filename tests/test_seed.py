@@ -0,0 +1,122 @@
+"""Test LAN snapshot seeding"""
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import requests
+from noma import download
+from noma import seed
+
+DIGEST = "ab" * 32
+
+
+class SeedServerTests(unittest.TestCase):
+    """Test SeedServer with the resumable downloader"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "snapshot.tar")
+        self.data = os.urandom(300000)
+        with open(self.path, "wb") as file:
+            file.write(self.data)
+        self.digest = hashlib.sha256(self.data).hexdigest()
+        self.server = seed.SeedServer(
+            ("127.0.0.1", 0), self.path, self.digest
+        )
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = "http://127.0.0.1:{}/snapshot.tar".format(
+            self.server.server_port
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def test_ranges(self):
+        """
+        Test that the seed:
+            - answers single ranges, including suffix ranges
+            - sends the whole file for a stale If-Range
+            - rejects unsatisfiable ranges and unknown paths
+        """
+        response = requests.get(self.url, headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.data[10:20])
+        self.assertEqual(
+            response.headers["Content-Range"], "bytes 10-19/300000"
+        )
+        response = requests.get(self.url, headers={"Range": "bytes=-5"})
+        self.assertEqual(response.content, self.data[-5:])
+        response = requests.get(
+            self.url, headers={"Range": "bytes=0-9", "If-Range": '"other"'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.data)
+        response = requests.get(
+            self.url, headers={"Range": "bytes=300000-"}
+        )
+        self.assertEqual(response.status_code, 416)
+        response = requests.head(self.url.replace("snapshot", "other"))
+        self.assertEqual(response.status_code, 404)
+
+    def test_download_from_seed(self):
+        target = os.path.join(self.tmp.name, "copy.tar")
+        download.Download(
+            self.url, target, sha256=self.digest, jobs=3, chunk_size=65536
+        ).run()
+        with open(target, "rb") as file:
+            self.assertEqual(file.read(), self.data)
+
+    def test_download_records_digest(self):
+        """Test that a downloaded snapshot is seeded without rehashing"""
+        target = os.path.join(self.tmp.name, "copy.tar")
+        download.download(self.url, target, self.digest, jobs=2)
+        with mock.patch("noma.backup.file_digest") as file_digest:
+            self.assertEqual(seed.verified_digest(target), self.digest)
+        file_digest.assert_not_called()
+
+    def test_verified_digest(self):
+        """Test that the digest is cached until the file changes"""
+        self.assertEqual(seed.verified_digest(self.path), self.digest)
+        with open(self.path + ".sha256", "w") as file:
+            stat = os.stat(self.path)
+            file.write(
+                "{} {} {}\n".format(DIGEST, stat.st_size, stat.st_mtime_ns)
+            )
+        self.assertEqual(seed.verified_digest(self.path), DIGEST)
+        with open(self.path, "ab") as file:
+            file.write(b"\0")
+        self.assertNotEqual(seed.verified_digest(self.path), DIGEST)
+
+
+class DiscoveryTests(unittest.TestCase):
+    """Test parsing of avahi-browse output"""
+
+    def test_parse_browse(self):
+        txt = '"sha256={}" "path=/snapshot.tar"'
+        output = "\n".join(
+            [
+                "+;eth0;IPv4;noma seed on a;_noma-seed._tcp;local",
+                "=;eth0;IPv4;noma seed on a;_noma-seed._tcp;local;a.local;"
+                "192.168.1.5;8432;" + txt.format(DIGEST),
+                "=;eth0;IPv6;noma seed on a;_noma-seed._tcp;local;a.local;"
+                "fe80::1;8432;" + txt.format(DIGEST),
+                "=;wlan0;IPv4;noma seed on a;_noma-seed._tcp;local;a.local;"
+                "192.168.1.5;8432;" + txt.format(DIGEST),
+                "=;eth0;IPv4;noma seed on b;_noma-seed._tcp;local;b.local;"
+                "192.168.1.6;8432;" + txt.format("cd" * 32),
+            ]
+        )
+        self.assertEqual(
+            seed.parse_browse(output, DIGEST),
+            ["http://192.168.1.5:8432/snapshot.tar"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
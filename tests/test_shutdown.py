@@ -0,0 +1,78 @@
+"""Test dependency-ordered shutdown"""
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+from noma import shutdown
+
+COMPOSE = os.path.join(os.path.dirname(__file__), "..", "compose", "clearnet")
+
+
+class ShutdownTests(unittest.TestCase):
+    """Test shutdown() with stop_service standing in for docker"""
+
+    def setUp(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def fake_stop(self, service, deadline):
+        with self.lock:
+            self.events.append(("start", service))
+        time.sleep(0.05)
+        with self.lock:
+            self.events.append(("end", service))
+        return {"status": "stopped", "method": "test", "seconds": 0.05}
+
+    def test_load_graph(self):
+        self.assertEqual(
+            shutdown.load_graph(os.path.join(COMPOSE, "docker-compose.yml")),
+            {"bitcoind": set(), "lnd": {"bitcoind"}, "invoicer": {"lnd"}},
+        )
+
+    @mock.patch("noma.shutdown.print_result")
+    def test_order(self, m_print):
+        """
+        Test that shutdown():
+            - stops dependents before what they depend on
+            - stops independent services concurrently
+            - only stops requested services and their dependents
+        """
+        graph = {
+            "bitcoind": set(),
+            "lnd": {"bitcoind"},
+            "invoicer": {"lnd"},
+            "tor": set(),
+        }
+        with mock.patch("noma.shutdown.stop_service", self.fake_stop):
+            results = shutdown.shutdown(graph=graph, deadline=10)
+        self.assertEqual(
+            sorted(results), ["bitcoind", "invoicer", "lnd", "tor"]
+        )
+        position = {event: index for index, event in enumerate(self.events)}
+        self.assertLess(position["end", "invoicer"], position["start", "lnd"])
+        self.assertLess(position["end", "lnd"], position["start", "bitcoind"])
+        # tor depends on nothing and stops alongside the invoicer
+        self.assertLess(position["start", "tor"], position["end", "invoicer"])
+
+        self.events = []
+        with mock.patch("noma.shutdown.stop_service", self.fake_stop):
+            results = shutdown.shutdown(["lnd"], graph=graph, deadline=10)
+        self.assertEqual(sorted(results), ["invoicer", "lnd"])
+        self.assertEqual(m_print.call_count, 6)
+
+        with mock.patch("noma.shutdown.stop_service", self.fake_stop):
+            results = shutdown.shutdown(
+                ["bitcoind"], graph=graph, deadline=10, dependents=False
+            )
+        self.assertEqual(list(results), ["bitcoind"])
+
+    def test_cycle(self):
+        graph = {"a": {"b"}, "b": {"a"}}
+        with mock.patch("noma.shutdown.stop_service", self.fake_stop):
+            with self.assertRaises(ValueError):
+                shutdown.shutdown(graph=graph)
+
+
+if __name__ == "__main__":
+    unittest.main()
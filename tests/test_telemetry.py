@@ -0,0 +1,89 @@
+"""Test hardware telemetry and memory-mapped ring buffers"""
+import math
+import os
+import tempfile
+import unittest
+from noma import telemetry
+from noma.ringbuffer import RingBuffer
+
+COLUMNS = ("time", "value")
+
+
+class RingBufferFileTests(unittest.TestCase):
+    """Test RingBuffer backed by a memory-mapped file"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "ring.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_persistence(self):
+        """
+        Test that a memory-mapped RingBuffer:
+            - keeps rows across reopening and wraps around
+            - can be read by a read-only reader while it is written
+            - is recreated when its layout changes
+        """
+        with RingBuffer(COLUMNS, 3, self.path) as ring:
+            for number in range(2):
+                ring.append({"time": number, "value": number * 10})
+        with RingBuffer(COLUMNS, 3, self.path) as ring:
+            self.assertEqual(len(ring), 2)
+            reader = RingBuffer(COLUMNS, 3, self.path, readonly=True)
+            for number in range(2, 5):
+                ring.append({"time": number, "value": number * 10})
+            self.assertEqual(reader.column("time"), [2, 3, 4])
+            self.assertEqual(reader[-1], {"time": 4, "value": 40})
+            reader.close()
+        with self.assertRaises(ValueError):
+            RingBuffer(("time",), 3, self.path, readonly=True)
+        with RingBuffer(COLUMNS, 5, self.path) as ring:
+            self.assertEqual(len(ring), 0)
+
+
+class StatsTests(unittest.TestCase):
+    """Test percentiles and windowed stats"""
+
+    def test_percentile(self):
+        values = [1.0, 2.0, 3.0, 4.0]
+        self.assertEqual(telemetry.percentile(values, 0), 1.0)
+        self.assertEqual(telemetry.percentile(values, 50), 2.5)
+        self.assertEqual(telemetry.percentile(values, 100), 4.0)
+        self.assertIsNone(telemetry.percentile([], 50))
+
+    def test_stats(self):
+        ring = RingBuffer(telemetry.COLUMNS, 200)
+        for number in range(200):
+            row = {name: float(number) for name in telemetry.COLUMNS}
+            row["temp"] = math.nan if number % 2 else 50.0
+            ring.append(row)
+        result = telemetry.stats(ring, window=100, percents=(50, 99))
+        self.assertEqual(result["cpu"]["samples"], 101)
+        self.assertEqual(result["cpu"]["min"], 99)
+        self.assertEqual(result["cpu"]["max"], 199)
+        self.assertEqual(result["cpu"]["p50"], 149)
+        self.assertEqual(result["cpu"]["p99"], 198)
+        self.assertEqual(result["temp"]["samples"], 50)
+        self.assertEqual(result["temp"]["mean"], 50)
+
+
+class SamplerTests(unittest.TestCase):
+    """Test Sampler on this machine's procfs"""
+
+    def test_read(self):
+        sampler = telemetry.Sampler(capacity=10, device="")
+        sampler.run(interval=0.05, count=3)
+        self.assertEqual(len(sampler.samples), 3)
+        first, last = sampler.samples[0], sampler.samples[-1]
+        self.assertTrue(math.isnan(first["cpu"]))
+        self.assertFalse(math.isnan(last["cpu"]))
+        self.assertTrue(math.isnan(last["read"]))
+        self.assertGreater(last["memory"], 0)
+        self.assertGreaterEqual(sampler.cpu_seconds, 0)
+        sampler.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
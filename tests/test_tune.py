@@ -0,0 +1,138 @@
+"""Test hardware-aware tuning"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+from noma import conf
+from noma import tune
+
+
+def hardware(**changes):
+    """Raspberry Pi with 1 GB RAM and a slow USB drive"""
+    profile = {
+        "ram": 926,
+        "swap": 1024,
+        "cores": 4,
+        "disk_total": 476000,
+        "disk_free": 20000,
+        "blocks_size": 550,
+        "write_speed": 15.0,
+        "read_speed": 30.0,
+        "prune": 550,
+        "lnd_version": (0, 8, 0),
+    }
+    profile.update(changes)
+    return profile
+
+
+class RecommendTests(unittest.TestCase):
+    """Test recommend() on hardware profiles"""
+
+    def test_small_board(self):
+        bitcoind, lnd = tune.recommend(hardware())
+        self.assertEqual(bitcoind["dbcache"], 324)
+        self.assertEqual(bitcoind["par"], 3)
+        self.assertEqual(bitcoind["maxmempool"], 50)
+        self.assertEqual(bitcoind["maxconnections"], 28)
+        self.assertEqual(bitcoind["prune"], 16440)
+        self.assertEqual(lnd["workers"]["workers.sig"], 4)
+        self.assertEqual(
+            lnd["Application Options"]["caches.channel-cache-size"], 4630
+        )
+
+    def test_lnd_version(self):
+        """Test that lnd only gets options its version knows"""
+        _, lnd = tune.recommend(hardware(lnd_version=(0, 7, 1)))
+        self.assertEqual(list(lnd), ["workers"])
+        self.assertEqual(tune.recommend(hardware(lnd_version=None))[1], {})
+        compose = os.path.join(os.path.dirname(__file__), "..", "compose")
+        modes = {"clearnet": (0, 6, 0), "neutrino": (0, 7, 1)}
+        for mode, version in modes.items():
+            path = os.path.join(compose, mode, "docker-compose.yml")
+            self.assertEqual(tune.lnd_version(path), version)
+
+    def test_large_drive(self):
+        """
+        Test that:
+            - a fast drive gets the default dbcache share
+            - an unpruned chain stays unpruned with enough space
+            - a pruned chain is never unpruned
+        """
+        box = hardware(
+            ram=8192, cores=1, disk_free=900000, write_speed=100, prune=0
+        )
+        bitcoind, _ = tune.recommend(box)
+        self.assertEqual(bitcoind["dbcache"], 2048)
+        self.assertEqual(bitcoind["par"], 1)
+        self.assertEqual(bitcoind["maxmempool"], 300)
+        self.assertEqual(bitcoind["prune"], 0)
+        box["prune"] = 550
+        self.assertEqual(tune.recommend(box)[0]["prune"], 720440)
+
+    def test_prune_full_chain(self):
+        """Test that a full chain is only pruned when allowed"""
+        box = hardware(prune=0)
+        self.assertEqual(tune.recommend(box)[0]["prune"], 0)
+        bitcoind, _ = tune.recommend(box, allow_prune=True)
+        self.assertEqual(bitcoind["prune"], 16440)
+
+
+class ApplyTests(unittest.TestCase):
+    """Test diff() and apply() on a temporary bitcoin.conf"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "bitcoin.conf")
+        with open(self.path, "w") as file:
+            file.write("# [core]\nmaxmempool=50\nprune=550\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_dry_run_and_apply(self):
+        """
+        Test that:
+            - diff() shows changes without writing them
+            - apply() writes them in place and reports the change
+            - a second run finds nothing to change
+        """
+        settings = {"": {"maxmempool": 100, "dbcache": 300}}
+        changes = tune.diff(self.path, conf.BitcoinConfig, settings)
+        self.assertIn("-maxmempool=50\n", changes)
+        self.assertIn("+maxmempool=100\n", changes)
+        self.assertIn("+dbcache=300\n", changes)
+        with open(self.path) as file:
+            self.assertIn("maxmempool=50\n", file.read())
+
+        self.assertTrue(tune.apply(self.path, conf.BitcoinConfig, settings))
+        with open(self.path) as file:
+            self.assertEqual(
+                file.read(),
+                "# [core]\nmaxmempool=100\nprune=550\ndbcache=300\n",
+            )
+        self.assertFalse(tune.apply(self.path, conf.BitcoinConfig, settings))
+        self.assertFalse(tune.diff(self.path, conf.BitcoinConfig, settings))
+
+    def test_profile_unpruned(self):
+        """Test that profile() reads a bitcoin.conf without prune"""
+        with open(self.path, "w") as file:
+            file.write("maxmempool=50\n")
+        with mock.patch("noma.node.get_ram", return_value=926), mock.patch(
+            "noma.node.get_swap", return_value=1024
+        ), mock.patch("noma.usb.fs_size", return_value=0), mock.patch(
+            "noma.tune.measure_throughput", return_value=(15.0, 30.0)
+        ), mock.patch(
+            "noma.tune.lnd_version", return_value=(0, 8, 0)
+        ):
+            box = tune.profile(self.tmp.name, self.path)
+        self.assertEqual(box["prune"], 0)
+
+    def test_measure_throughput(self):
+        write, read = tune.measure_throughput(self.tmp.name, size=2097152)
+        self.assertGreater(write, 0)
+        self.assertGreater(read, 0)
+        self.assertEqual(os.listdir(self.tmp.name), ["bitcoin.conf"])
+
+
+if __name__ == "__main__":
+    unittest.main()